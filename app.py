@@ -1,15 +1,138 @@
 import streamlit as st
-import sys
+import requests
+import threading
+import time
 import os
 
-# Add the current directory to Python path to import orchestrator
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# With LEGALQA_API_URL the pipeline runs in the API service (server.py), shared by every UI
+# replica; without it, in this process
+API_URL = os.environ.get("LEGALQA_API_URL", "").rstrip("/")
+API_TIMEOUT = float(os.environ.get("LEGALQA_API_TIMEOUT", 300))
 
-try:
-    from orchestrator import process_legal_query
-except ImportError:
-    st.error("orchestrator.py not found. Please ensure it's in the same directory as this app.")
-    st.stop()
+# Seconds between two checks of the readiness indicator while the resources load
+READINESS_POLL_SECONDS = 2
+
+# States of the pipeline shown by the readiness indicator
+READY, LOADING, FAILED = "ready", "loading", "failed"
+STATUS_ICONS = {READY: "🟢", LOADING: "🟡", FAILED: "🔴"}
+
+class PipelineResources:
+    """
+    The retrieval indices, law cache and encoder of this process, loaded in the background.
+
+    Created once per process by get_resources, so every browser session and every rerun
+    uses the same warmed resources.
+    """
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.error = None
+        self.started = time.time()
+        # Held here so they are owned by the process-wide resource, not by module globals alone
+        self.cache = self.section_index = self.model = None
+        threading.Thread(target=self._load, name="legalqa-warmup", daemon=True).start()
+
+    def _load(self):
+        try:
+            # Imported here so the page renders before the pipeline dependencies are loaded
+            import orchestrator
+            from src.module_3 import get_cache
+            from src.module_4 import get_model, get_section_index
+
+            orchestrator.warmup()
+            self.cache, self.section_index, self.model = get_cache(), get_section_index(), get_model()
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"Warmup failed: {self.error}")
+        finally:
+            self.ready.set()
+
+    def status(self):
+        """(state, message) for the readiness indicator, see service_status"""
+        if not self.ready.is_set():
+            return LOADING, f"Loading the legal databases and models ({time.time() - self.started:.0f} s)..."
+        if self.error:
+            return FAILED, f"The legal databases could not be loaded: {self.error}"
+        return READY, "Ready"
+
+@st.cache_resource(show_spinner=False)
+def get_resources():
+    """Start loading the pipeline resources, once per process"""
+    return PipelineResources()
+
+def service_status():
+    """
+    Readiness of the pipeline: of this process, or of the API service's GET /ready.
+
+    Returns:
+        tuple: (READY, LOADING or FAILED, message)
+    """
+    if not API_URL:
+        return get_resources().status()
+    try:
+        response = requests.get(f"{API_URL}/ready", timeout=2)
+        body = response.json()
+    except (requests.RequestException, ValueError) as e:
+        return FAILED, f"Legal Q&A service unreachable at {API_URL}: {e}"
+    if body.get("error"):
+        return FAILED, f"The legal Q&A service failed to start: {body['error']}"
+    if not body.get("ready"):
+        return LOADING, "The legal Q&A service is starting..."
+    return READY, "Ready"
+
+def process_legal_query(user_query: str):
+    """
+    Answer the query in this process, or send it to the API service.
+
+    Args:
+        user_query (str): The user's legal question
+
+    Returns:
+        tuple: The AI-generated response and the titles of the applicable laws
+
+    Raises:
+        RuntimeError: If the service is unavailable or the pipeline failed
+    """
+    if not API_URL:
+        resources = get_resources()
+        resources.ready.wait()
+        if resources.error:
+            raise RuntimeError(f"The legal databases could not be loaded: {resources.error}")
+
+        from orchestrator import run_pipeline_batch
+        from src.utils.tracing import span
+
+        with span("process_legal_query", query_chars=len(user_query)):
+            result = run_pipeline_batch([user_query])[0]
+        if result["error"]:
+            raise RuntimeError(result["error"])
+        return result["response"], result["titles"]
+
+    try:
+        response = requests.post(f"{API_URL}/query", json={"query": user_query}, timeout=API_TIMEOUT)
+    except requests.RequestException as e:
+        raise RuntimeError(f"Legal Q&A service unreachable at {API_URL}: {e}")
+
+    try:
+        result = response.json()
+    except (requests.RequestException, ValueError):
+        # Not a JSON answer, e.g. the error page of a proxy
+        raise RuntimeError(f"Service returned HTTP {response.status_code} without a JSON body")
+    if not isinstance(result, dict):
+        raise RuntimeError(f"Service returned HTTP {response.status_code} without a JSON object")
+    if response.status_code != 200 or result.get("error"):
+        raise RuntimeError(result.get("error") or f"Service returned HTTP {response.status_code}")
+
+    return result["response"], result["titles"]
+
+@st.fragment(run_every=READINESS_POLL_SECONDS)
+def readiness_indicator():
+    """Status shown while the resources load, refreshed until they are ready"""
+    state, message = service_status()
+    if state == READY:
+        # Render the page again, without this polling fragment
+        st.rerun()
+    st.caption(f"{STATUS_ICONS[state]} {message}")
 
 def main():
     # Page configuration
@@ -31,6 +154,14 @@ def main():
             </p>
         </div>
         """, unsafe_allow_html=True)
+
+    # Starts loading the resources at the first page view of the process
+    state, message = service_status()
+    with col2:
+        if state == READY:
+            st.caption(f"{STATUS_ICONS[state]} {message}")
+        else:
+            readiness_indicator()
     
     # Scope and instructions
     st.markdown("""
@@ -110,7 +241,7 @@ def main():
         if user_query.strip():
             with st.spinner("⚖️ Analyzing your legal question..."):
                 try:
-                    # Call orchestrator.py to process the query
+                    # Answer the query, in this process or in the API service (LEGALQA_API_URL)
                     response, titles = process_legal_query(user_query)
                     
                     # Create a box with the applicable laws (titles)
@@ -0,0 +1,223 @@
+"""
+Offline batch processing of JSONL question files.
+
+Reads one JSON question per line and streams one JSON result per line, with the
+response, the applicable laws and the per-stage timings of every question.
+
+    python batch.py questions.jsonl results.jsonl --workers 4 --batch-size 8
+
+Questions already answered successfully in the output file are skipped, so an
+interrupted run is resumed by launching the same command again. Questions that failed
+are answered again, and the lines of their earlier failures are removed from the output
+once the run finishes.
+"""
+import os
+import sys
+import json
+import argparse
+import functools
+import multiprocessing as mp
+
+from orchestrator import warmup, run_pipeline_batch
+from src.module_2 import initialize as initialize_retrieval
+from src.module_3 import get_cache
+from src.module_4 import get_section_index
+from src.utils.deadline import Deadline
+from src.utils.profiling import PROFILE_MODES, profile_mode, request_profile
+from src.utils.tracing import span
+
+
+def read_questions(path, id_field="id", query_field="question"):
+    """
+    Read the questions of a JSONL file.
+
+    Args:
+        path (str): Path to the JSONL file
+        id_field (str): Field holding the question id (the line number is used if missing)
+        query_field (str): Field holding the question text
+
+    Returns:
+        list: (question_id, question_text) tuples in file order
+    """
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            query = record.get(query_field)
+            if not query:
+                print(f"Skipping line {line_number}: no '{query_field}' field")
+                continue
+            questions.append((str(record.get(id_field, line_number)), query))
+    return questions
+
+
+def read_done_ids(path):
+    """Ids of the questions already answered in a previous (possibly interrupted) run"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line of a run killed mid-write
+                continue
+            if result.get("error") is None:
+                done.add(result["id"])
+    return done
+
+
+def drop_superseded(path):
+    """
+    Rewrite a results file keeping only the last line of every question id: the answer
+    to a question that failed in an earlier run supersedes the line of its failure.
+    Unreadable lines of an interrupted run are dropped too.
+
+    Returns:
+        int: Lines removed
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+    last = {}
+    for i, line in enumerate(lines):
+        try:
+            last[json.loads(line)["id"]] = i
+        except (json.JSONDecodeError, KeyError, TypeError):
+            continue
+    kept = sorted(last.values())
+    if len(kept) == len(lines):
+        return 0
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.writelines(lines[i] if lines[i].endswith("\n") else lines[i] + "\n" for i in kept)
+    os.replace(tmp, path)
+    return len(lines) - len(kept)
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _init_worker():
+    """Warm the indices, the law cache and the encoder once per worker process"""
+    warmup()
+
+
+def process_batch(batch, profile=None):
+    """
+    Answer one batch of (question_id, question_text) tuples.
+
+    Args:
+        batch (list): The questions
+        profile (str): Profile every batch with this profiler (see src.utils.profiling),
+            None to profile LEGALQA_PROFILE_SAMPLE_RATE of them
+    """
+    with span("batch", questions=len(batch)) as s, request_profile(s, profile_mode(profile)):
+        # Offline answers are not degraded to meet a latency budget
+        results = run_pipeline_batch([query for _, query in batch], deadline=Deadline())
+    profile_path = s.attributes.get("profile")
+    return [{"id": question_id, **result, **({"profile": profile_path} if profile_path else {})}
+            for (question_id, _), result in zip(batch, results)]
+
+
+def _prepare_indices():
+    """Build the BM25 indices on disk once, before the workers open them concurrently"""
+    initialize_retrieval()
+    get_section_index()
+
+
+def run(input_path, output_path, workers=1, batch_size=8, id_field="id", query_field="question", profile=None):
+    """
+    Answer every question of a JSONL file, appending the results to a JSONL file.
+
+    Args:
+        input_path (str): Input JSONL questions
+        output_path (str): Output JSONL results (appended to, to allow resuming)
+        workers (int): Number of worker processes
+        batch_size (int): Questions per batch sent to a worker
+        id_field (str): Field holding the question id
+        query_field (str): Field holding the question text
+        profile (str): Profiler of every batch, None for LEGALQA_PROFILE_SAMPLE_RATE of them
+
+    Returns:
+        int: Number of questions that failed
+    """
+    questions = read_questions(input_path, id_field=id_field, query_field=query_field)
+    done = read_done_ids(output_path)
+    todo = [q for q in questions if q[0] not in done]
+    print(f"{len(questions)} questions, {len(done)} already answered, {len(todo)} to go")
+
+    batches = list(_chunks(todo, batch_size))
+    failed = 0
+
+    with open(output_path, "a", encoding="utf-8") as out:
+
+        def write(results):
+            nonlocal failed
+            for result in results:
+                failed += result["error"] is not None
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+
+        if workers <= 1:
+            warmup()
+            for batch in batches:
+                write(process_batch(batch, profile))
+        else:
+            _run_pool(batches, workers, profile, write)
+
+    removed = drop_superseded(output_path) if os.path.exists(output_path) else 0
+    if removed:
+        print(f"Removed {removed} superseded lines from {output_path}")
+    return failed
+
+
+def _run_pool(batches, workers, profile, write):
+    """Answer the batches in worker processes, passing every batch's results to write"""
+    # The JVM behind PyTerrier cannot be forked, so the indices are built in a fresh
+    # process and every worker opens them in its initializer
+    builder = mp.get_context("spawn").Process(target=_prepare_indices)
+    builder.start()
+    builder.join()
+
+    # With fork the law cache loaded here is shared copy-on-write by all the workers
+    if "fork" in mp.get_all_start_methods():
+        context = mp.get_context("fork")
+        get_cache()
+    else:
+        context = mp.get_context("spawn")
+
+    with context.Pool(processes=workers, initializer=_init_worker) as pool:
+        for results in pool.imap_unordered(functools.partial(process_batch, profile=profile), batches):
+            write(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of legal questions.")
+    parser.add_argument("input", help="JSONL file with one question per line")
+    parser.add_argument("output", help="JSONL file the results are appended to")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes (default: 1)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Questions batched together per worker call (default: 8)")
+    parser.add_argument("--id-field", default="id", help="Field holding the question id (default: id)")
+    parser.add_argument("--query-field", default="question", help="Field holding the question text (default: question)")
+    parser.add_argument("--profile", nargs="?", const=True, choices=PROFILE_MODES,
+                        help="Profile every batch, written to cache/profiles/<trace_id> (default profiler: "
+                             "LEGALQA_PROFILE_MODE)")
+    args = parser.parse_args(argv)
+
+    if not os.environ.get("OPENROUTER_API_KEY"):
+        print("OPENROUTER_API_KEY environment variable must be set.")
+        return 2
+
+    failed = run(args.input, args.output, workers=args.workers, batch_size=args.batch_size,
+                 id_field=args.id_field, query_field=args.query_field, profile=args.profile)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
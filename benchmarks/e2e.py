@@ -0,0 +1,196 @@
+"""
+End-to-end benchmark of process_legal_query against local stand-ins for OpenRouter and EUR-Lex.
+
+Runs the fixed query set sequentially for the per-stage and total latency distributions,
+then at each concurrency level for the throughput, and writes everything (plus the peak
+RSS) to a JSON file so runs can be compared.
+
+    python -m benchmarks.e2e --llm-latency 0.5 --tokens-per-second 50 --concurrency 1 4 8
+    python -m benchmarks.e2e --compare benchmarks/results/e2e-old.json benchmarks/results/e2e-new.json
+
+The retrieval indices and the EURLEX dataset are still needed locally (module 2).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stubs import OpenAIStub, EurLexStub, FIXTURES_DIR
+
+RESULTS_DIR = Path(__file__).parent / "results"
+STAGES = ("module_1", "module_2", "rerank", "module_3", "module_4", "module_5")
+
+
+def load_queries(path=FIXTURES_DIR / "queries.jsonl"):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line)["question"] for line in f if line.strip()]
+
+
+def percentiles(values):
+    """p50/p95/p99, mean, min and max of a list of latencies"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "min": round(ordered[0], 3),
+        "p50": round(pick(0.5), 3),
+        "p95": round(pick(0.95), 3),
+        "p99": round(pick(0.99), 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process, in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def run_query(run_pipeline_batch, query):
+    from src.utils.tracing import span
+
+    start = time.perf_counter()
+    with span("process_legal_query", query_chars=len(query)):
+        result = run_pipeline_batch([query])[0]
+    result["total_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def run_benchmark(queries, concurrency_levels, repeat=1):
+    # Imported here so the stub URLs are in the environment before the modules read them
+    from orchestrator import warmup, run_pipeline_batch
+
+    report = {}
+
+    start = time.perf_counter()
+    warmup()
+    report["warmup_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    report["rss_after_warmup_mb"] = peak_rss_mb()
+
+    # Sequential runs: latency distributions per stage
+    stage_latencies = {stage: [] for stage in STAGES}
+    totals, errors = [], 0
+    for _ in range(repeat):
+        for query in queries:
+            result = run_query(run_pipeline_batch, query)
+            errors += result["error"] is not None
+            totals.append(result["total_ms"])
+            for stage, ms in result["timings"].items():
+                stage_latencies.setdefault(stage, []).append(ms)
+
+    report["sequential"] = {
+        "queries": len(totals),
+        "errors": errors,
+        "total_ms": percentiles(totals),
+        "stages_ms": {stage: percentiles(values) for stage, values in stage_latencies.items()},
+    }
+
+    # Concurrent runs: throughput
+    report["concurrency"] = []
+    for level in concurrency_levels:
+        batch = queries * repeat
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            results = list(pool.map(lambda q: run_query(run_pipeline_batch, q), batch))
+        elapsed = time.perf_counter() - start
+        report["concurrency"].append({
+            "concurrency": level,
+            "queries": len(results),
+            "errors": sum(r["error"] is not None for r in results),
+            "elapsed_s": round(elapsed, 3),
+            "throughput_qps": round(len(results) / elapsed, 3),
+            "total_ms": percentiles([r["total_ms"] for r in results]),
+        })
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def compare(old_path, new_path):
+    """Print the latency and throughput deltas between two result files"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    def row(name, a, b):
+        delta = (b - a) / a * 100 if a else 0.0
+        print(f"{name:<32} {a:>12.1f} {b:>12.1f} {delta:>+8.1f}%")
+
+    print(f"{'metric':<32} {'old':>12} {'new':>12} {'delta':>9}")
+    for q in ("p50", "p95", "p99"):
+        row(f"total {q} (ms)", old["sequential"]["total_ms"][q], new["sequential"]["total_ms"][q])
+    for stage in STAGES:
+        a = old["sequential"]["stages_ms"].get(stage, {}).get("p50")
+        b = new["sequential"]["stages_ms"].get(stage, {}).get("p50")
+        if a is not None and b is not None:
+            row(f"{stage} p50 (ms)", a, b)
+    new_levels = {c["concurrency"]: c for c in new["concurrency"]}
+    for level in old["concurrency"]:
+        if level["concurrency"] in new_levels:
+            row(f"throughput @{level['concurrency']} (qps)", level["throughput_qps"],
+                new_levels[level["concurrency"]]["throughput_qps"])
+    row("peak RSS (MB)", old["peak_rss_mb"], new["peak_rss_mb"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark with local upstream stubs.")
+    parser.add_argument("--queries", default=str(FIXTURES_DIR / "queries.jsonl"), help="JSONL query set")
+    parser.add_argument("--repeat", type=int, default=1, help="Times the query set is run")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="Concurrency levels")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="LLM stub time to first token (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="LLM stub generation speed")
+    parser.add_argument("--completion-tokens", type=int, default=200, help="LLM stub answer length in tokens")
+    parser.add_argument("--eurlex-latency", type=float, default=0.1, help="EUR-Lex stub latency (s)")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/e2e-<timestamp>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    queries = load_queries(args.queries)
+
+    with OpenAIStub(latency=args.llm_latency, tokens_per_second=args.tokens_per_second,
+                    completion_tokens=args.completion_tokens) as llm, \
+            EurLexStub(latency=args.eurlex_latency) as eurlex:
+        os.environ["OPENROUTER_BASE_URL"] = llm.url
+        os.environ["OPENROUTER_API_KEY"] = "stub"
+        os.environ["EURLEX_BASE_URL"] = eurlex.url
+
+        report = run_benchmark(queries, args.concurrency, repeat=args.repeat)
+        report["upstream_requests"] = {"llm": llm.requests, "eurlex": eurlex.requests}
+
+    report["config"] = {k: v for k, v in vars(args).items() if k not in ("compare", "output")}
+    report["platform"] = {"python": platform.python_version(), "machine": platform.machine(),
+                          "system": platform.system(), "cpus": os.cpu_count()}
+    report["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"e2e-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    seq = report["sequential"]
+    print(f"total p50={seq['total_ms']['p50']}ms p95={seq['total_ms']['p95']}ms p99={seq['total_ms']['p99']}ms")
+    for level in report["concurrency"]:
+        print(f"concurrency {level['concurrency']}: {level['throughput_qps']} q/s")
+    print(f"peak RSS {report['peak_rss_mb']} MB, results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
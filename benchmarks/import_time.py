@@ -0,0 +1,81 @@
+"""
+Import time of the entry points, checked against a budget.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter (best of
+--repeat runs) and reports the total import time and the slowest top-level imports. The
+check fails (exit status 1) when the import takes longer than --budget-ms or pulls in a
+heavy dependency that the pipeline only needs once a query runs (the JVM of pyterrier,
+torch, the LLM client, ...): those are imported lazily by the modules' functions.
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --module orchestrator server --budget-ms 1500
+"""
+import os
+import sys
+import argparse
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# Packages that must not be imported by importing an entry point
+HEAVY = ("pyterrier", "jnius", "datasets", "sentence_transformers", "transformers", "torch", "openai", "bs4",
+         "streamlit")
+
+
+def import_times(module):
+    """
+    Import a module in a fresh interpreter with -X importtime.
+
+    Returns:
+        list: (package, self µs, cumulative µs, depth) of the module and every import it
+              triggered, in import order (the module last)
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT,
+                            capture_output=True, text=True, env={**os.environ, "PYTHONPATH": str(ROOT)})
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    # Only the imports done by the module: the nested ones are listed before it
+    end = max(i for i, (name, _, _, depth) in enumerate(imports) if name == module and depth == 0)
+    start = max((i + 1 for i, imported in enumerate(imports[:end]) if imported[3] == 0), default=0)
+    return imports[start:end + 1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import time of the entry points against a budget.")
+    parser.add_argument("--module", nargs="+", default=["orchestrator"], help="Modules to import")
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("LEGALQA_IMPORT_BUDGET_MS", 1000)),
+                        help="Maximum import time of every module")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per module, the fastest is kept")
+    parser.add_argument("--top", type=int, default=10, help="Slowest top-level imports shown")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module in args.module:
+        runs = [import_times(module) for _ in range(args.repeat)]
+        imports = min(runs, key=lambda run: run[-1][2])
+        total_ms = imports[-1][2] / 1000
+
+        heavy = sorted({name.split(".")[0] for name, _, _, _ in imports if name.split(".")[0] in HEAVY})
+        over = total_ms > args.budget_ms
+        failed = failed or over or bool(heavy)
+
+        print(f"import {module}: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms) {'OVER BUDGET' if over else 'ok'}")
+        top_level = sorted((i for i in imports if i[3] == 1), key=lambda i: i[2], reverse=True)
+        for name, _, cumulative_us, _ in top_level[:args.top]:
+            print(f"  {cumulative_us / 1000:>8.1f} ms  {name}")
+        if heavy:
+            print(f"  heavy dependencies imported eagerly: {', '.join(heavy)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Worst-case benchmark of the legacy (TexteOnly) article/annex segmenter.
+
+Compares segment_legacy_text with the DOTALL regexes it replaced, on the largest legacy
+laws of the cache in src/data and on synthetic documents built to make the lazy
+`.*?` + lookahead patterns rescan: many sections, inline "Article N" references, many
+"ANNEX" mentions and long whitespace runs. Outputs must be identical.
+
+    python -m benchmarks.legacy_segmenter
+    python -m benchmarks.legacy_segmenter --sizes 1000 5000 --top 10
+"""
+import re
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import pandas as pd
+
+from src.module_3 import segment_legacy_text
+
+DATA_DIR = Path(__file__).parent.parent / "src" / "data"
+
+
+def segment_legacy_text_regex(full_text):
+    """The previous implementation: one DOTALL findall per section type"""
+    articles = []
+    annexes = []
+
+    article_pattern = r'Article (\d+)\s*\n(.*?)(?=Article \d+|ANNEX|$)'
+    for article_num, article_content in re.findall(article_pattern, full_text, re.DOTALL):
+        articles.append({
+            "id": article_num,
+            "title": f"Article {article_num}",
+            "text": f"Article {article_num}\n\n{article_content.strip()}"
+        })
+
+    annex_pattern = r'ANNEX ([IVX]+)\s*\n(.*?)(?=ANNEX [IVX]+|$)'
+    for annex_num, annex_content in re.findall(annex_pattern, full_text, re.DOTALL):
+        annexes.append({
+            "id": f"anx_{annex_num}",
+            "type": "annex",
+            "title": f"ANNEX {annex_num}",
+            "text": f"ANNEX {annex_num}\n\n{annex_content.strip()}"
+        })
+
+    return articles, annexes
+
+
+def largest_legacy_texts(top):
+    """Text of the `top` longest legacy laws of the cache (structured_json without a header)"""
+    frames = []
+    for shard in sorted(DATA_DIR.glob("cachedLawsTexts_*.csv")):
+        df = pd.read_csv(shard, encoding="utf-8", usecols=["celex_id", "text", "structured_json"])
+        legacy = df["structured_json"].notna() & ~df["structured_json"].astype(str).str.contains("'header'", regex=False)
+        frames.append(df.loc[legacy & df["text"].notna(), ["celex_id", "text"]])
+    laws = pd.concat(frames, ignore_index=True)
+    laws = laws.assign(length=laws["text"].str.len()).sort_values("length", ascending=False).head(top)
+    return {f"cache {row.celex_id}": row.text for row in laws.itertuples()}
+
+
+def synthetic_texts(n):
+    """Adversarial legacy documents with n sections"""
+    paragraph = "Member States shall adopt the measures referred to in Article 3 of Directive 89/106/EEC."
+    return {
+        f"articles ({n})": "\n".join(f"Article {i}\n{paragraph}\n{paragraph}" for i in range(1, n + 1)),
+        f"inline references ({n})": "Article 1\n" + "\n".join(
+            f"See Article {i} and Article {i + 1}." for i in range(n * 5)),
+        f"annex mentions ({n})": "\n".join(
+            f"ANNEX {'IVX'[i % 3] * (1 + i % 3)}\nas listed in ANNEX and ANNEXES thereto" for i in range(n)),
+        f"whitespace ({n})": "Article 1" + " " * (n * 200) + "\nArticle 2\n" + "\n" * (n * 50) + "ANNEX I\n",
+    }
+
+
+def timed(fn, text, min_time):
+    """Best seconds per call over at least min_time seconds"""
+    best, spent = float("inf"), 0.0
+    while spent < min_time:
+        start = time.perf_counter()
+        fn(text)
+        elapsed = time.perf_counter() - start
+        best, spent = min(best, elapsed), spent + elapsed
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Worst-case benchmark of the legacy document segmenter.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[200, 1000, 5000], help="Synthetic section counts")
+    parser.add_argument("--top", type=int, default=5, help="Largest legacy laws of the cache to include")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Seconds spent timing each document")
+    args = parser.parse_args(argv)
+
+    documents = largest_legacy_texts(args.top)
+    for n in args.sizes:
+        documents.update(synthetic_texts(n))
+
+    mismatches = 0
+    print(f"{'document':<28} {'chars':>10} {'parity':>7} {'regex ms':>10} {'linear ms':>10} {'speedup':>8}")
+    for name, text in documents.items():
+        same = segment_legacy_text(text) == segment_legacy_text_regex(text)
+        mismatches += not same
+        old = timed(segment_legacy_text_regex, text, args.min_time)
+        new = timed(segment_legacy_text, text, args.min_time)
+        print(f"{name:<28} {len(text):>10} {'ok' if same else 'DIFF':>7} {old * 1000:>10.2f} "
+              f"{new * 1000:>10.2f} {old / new:>7.1f}x")
+
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+"""
+Memory of the law representation: steady state per worker and peak per query.
+
+Compares the previous representation (structured_json dicts copied between the stages
+and serialized to JSON from module 4 to module 5) with the Law / Match records of
+src.documents passed by reference, on the laws of the cache in src/data:
+
+- steady state: the law cache DataFrame and the laws a worker keeps preloaded
+- per query: the peak allocated while modules 3 to 5 turn the cached text of the k laws
+  with the most articles into the prompt context, every article matching (worst case)
+
+and estimates how many workers fit on a node from them. The encoder is not loaded, its
+size is given with --model-mb.
+
+    python -m benchmarks.memory
+    python -m benchmarks.memory --preloaded 500 --laws-per-query 5 --node-memory-gb 16 --concurrency 4
+"""
+import io
+import re
+import ast
+import gc
+import sys
+import json
+import argparse
+import tracemalloc
+from contextlib import redirect_stdout
+
+import pandas as pd
+
+from src.documents import Law, Match
+from src.module_3 import get_cache, clean_articles
+from src.module_5 import SequenceFilterer
+
+MB = 1024 * 1024
+
+
+def previous_query_path(rows, filterer):
+    """Modules 3 to 5 as they were: dicts copied by .apply/.copy, JSON from module 4 to module 5"""
+    df = pd.DataFrame({"celex_id": [c for c, _, _ in rows], "title": [t for _, t, _ in rows],
+                       "structured_json": [ast.literal_eval(s) for _, _, s in rows]})
+    df["structured_json"] = df["structured_json"].apply(clean_articles)
+
+    df_copy = df.copy()
+    df_copy["filtered_json"] = df_copy["structured_json"].apply(lambda data: json.dumps({
+        "articles": [{**a, "score": 0.9} for a in data.get("articles") or []],
+        "annexes": [{**a, "score": 0.9} for a in data.get("annexes") or []]}))
+
+    titles = dict(zip(df["celex_id"], df["title"]))
+    grouped = {}
+    for cid, raw in zip(df_copy["celex_id"], df_copy["filtered_json"]):
+        for art in json.loads(raw).get("articles", []):
+            flat = dict(art)
+            flat["celex_id"] = cid
+            flat["law_title"] = titles.get(cid, "Unknown Law")
+            if len(re.findall(r'\w+', flat.get("text", ""))) >= filterer.minimum_length_limit:
+                grouped.setdefault(cid, []).append(flat)
+    return "\n\n\n".join(f"{arts[0]['law_title'].strip()}\n\n" + "\n\n".join(a["text"] for a in arts)
+                          for arts in grouped.values())
+
+
+def compact_query_path(rows, filterer, preloaded=None):
+    """Modules 3 to 5 now: one Law per law, Match records referencing its sections"""
+    preloaded = preloaded or {}
+    laws = [preloaded.get(c) or Law.from_json(c, clean_articles(ast.literal_eval(s))) for c, _, s in rows]
+    df = pd.DataFrame({"celex_id": [c for c, _, _ in rows], "title": [t for _, t, _ in rows], "law": laws})
+    filtered = pd.DataFrame({"celex_id": df["celex_id"],
+                             "matches": [[Match(s, 0.9) for s in law.sections(("articles", "annexes"))]
+                                         for law in df["law"]]})
+    aggregated = filterer.aggregate_all_articles(df=filtered, title_df=df, source_column="matches")
+    return filterer.generate_text_prompt(aggregated)
+
+
+def peak_bytes(fn, *args):
+    """Peak bytes allocated while running fn"""
+    gc.collect()
+    tracemalloc.start()
+    with redirect_stdout(io.StringIO()):
+        fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def retained_bytes(build):
+    """
+    Run build() and measure what its result keeps allocated.
+
+    Returns:
+        tuple: (result, bytes)
+    """
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Steady-state and per-query memory of the law representation.")
+    parser.add_argument("--preloaded", type=int, default=500, help="Laws kept preloaded by a worker")
+    parser.add_argument("--laws-per-query", type=int, default=5, help="Laws reaching modules 3 to 5 per query")
+    parser.add_argument("--model-mb", type=float, default=130.0, help="Memory of the loaded encoder")
+    parser.add_argument("--node-memory-gb", type=float, default=16.0, help="Memory of a node")
+    parser.add_argument("--concurrency", type=int, default=4, help="Queries in flight per worker")
+    args = parser.parse_args(argv)
+
+    cache = get_cache()
+    cache_bytes = int(cache.memory_usage(deep=True).sum())
+    parsed = cache[cache["structured_json"].apply(lambda s: isinstance(s, str))]
+    parsed = parsed.assign(length=parsed["structured_json"].str.len()).sort_values("length", ascending=False)
+    rows = list(zip(parsed["celex_id"], parsed["title"], parsed["structured_json"]))
+
+    # Steady state: the preloaded laws
+    preload_rows = rows[:args.preloaded]
+    _, dict_bytes = retained_bytes(lambda: {c: clean_articles(ast.literal_eval(s)) for c, _, s in preload_rows})
+    preloaded, law_bytes = retained_bytes(
+        lambda: {c: Law.from_json(c, clean_articles(ast.literal_eval(s))) for c, _, s in preload_rows})
+
+    # Per query: the largest laws of the cache
+    query_rows = rows[:args.laws_per_query]
+    filterer = SequenceFilterer(minimum_length_limit=20, max_added_word_limit=10 ** 9)
+    if previous_query_path(query_rows, filterer) != compact_query_path(query_rows, filterer):
+        print("WARNING: the two paths build different prompt contexts")
+    before = peak_bytes(previous_query_path, query_rows, filterer)
+    after = peak_bytes(compact_query_path, query_rows, filterer)
+    after_preloaded = peak_bytes(compact_query_path, query_rows, filterer, preloaded)
+
+    print(f"Law cache DataFrame ({len(cache)} laws): {cache_bytes / MB:.1f} MB")
+    print(f"{args.preloaded} preloaded laws: dicts {dict_bytes / MB:.1f} MB, Law records {law_bytes / MB:.1f} MB "
+          f"({(1 - law_bytes / dict_bytes) * 100:.0f}% less)")
+    print(f"Peak per query ({args.laws_per_query} laws): dicts + JSON {before / MB:.2f} MB, "
+          f"Law + Match {after / MB:.2f} MB, preloaded laws {after_preloaded / MB:.2f} MB")
+
+    node = args.node_memory_gb * 1024 * MB
+    model = args.model_mb * MB
+    for name, steady, peak in (("before", cache_bytes + dict_bytes, before),
+                               ("after", cache_bytes + law_bytes, after_preloaded)):
+        worker = model + steady + args.concurrency * peak
+        print(f"{name:>6}: {worker / MB:.0f} MB per worker with {args.concurrency} queries in flight, "
+              f"{int(node // worker)} workers per {args.node_memory_gb:g} GB node")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
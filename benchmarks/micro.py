@@ -0,0 +1,279 @@
+"""
+Microbenchmarks of the pipeline's pure-CPU hot functions.
+
+Fixtures are built from the law cache in src/data and the HTML fixtures. Every function
+is reported in ops/sec and peak bytes allocated per call (tracemalloc), and compared with
+the stored baseline to flag regressions.
+
+    python -m benchmarks.micro                     # run and compare with the baseline
+    python -m benchmarks.micro --save-baseline     # store the current numbers as the baseline
+    python -m benchmarks.micro --only _rrf clean_articles
+"""
+import io
+import ast
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from pathlib import Path
+from contextlib import redirect_stdout
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.stubs import FIXTURES_DIR, DEFAULT_ANSWER
+
+DATA_DIR = Path(__file__).parent.parent / "src" / "data"
+BASELINE_PATH = Path(__file__).parent / "baselines" / "micro.json"
+
+# Shards of the law cache used as fixtures
+FIXTURE_SHARDS = ("cachedLawsTexts_0_399.csv", "cachedLawsTexts_400_799.csv")
+
+
+def load_fixture_laws():
+    """Laws of the fixture shards with their structured_json parsed"""
+    df = pd.concat([pd.read_csv(DATA_DIR / shard, encoding="utf-8") for shard in FIXTURE_SHARDS], ignore_index=True)
+    df = df[df["structured_json"].notna()].copy()
+    df["structured_json"] = df["structured_json"].apply(ast.literal_eval)
+    df["n_articles"] = df["structured_json"].apply(lambda d: len(d.get("articles") or []))
+    return df
+
+
+def pick_laws(df, n=5):
+    """The n laws with the most articles, the realistic worst case of a query"""
+    return df.sort_values("n_articles", ascending=False).head(n)
+
+
+def matches(celex_id, structured_json, score=0.7):
+    """A module_4 style output for a law: every article with a score"""
+    from src.documents import Law, Match
+
+    law = Law.from_json(celex_id, structured_json)
+    return [Match(article, score - i * 0.001) for i, article in enumerate(law.articles)]
+
+
+# Each benchmark returns a zero-argument callable doing one operation on its fixture
+
+def bench__rrf(laws):
+    from src.module_2 import _rrf
+
+    docnos = list(laws["celex_id"]) * 200
+    text = pd.DataFrame({"qid": "1", "docno": docnos[:1000], "rank": range(1000), "score": 1.0})
+    title = pd.DataFrame({"qid": "1", "docno": list(reversed(docnos[:1000])), "rank": range(1000), "score": 1.0})
+    return lambda: _rrf([text, title], K=10)
+
+
+def bench_getFullText(laws):
+    from src.module_3 import getFullText
+
+    cache = pd.concat([pd.read_csv(DATA_DIR / shard, encoding="utf-8") for shard in FIXTURE_SHARDS], ignore_index=True)
+    to_get = pick_laws(laws)[["celex_id", "title"]].reset_index(drop=True)
+
+    def run():
+        df = to_get.copy()
+        df["structured_json"] = None
+        return getFullText(df, cache)
+
+    return run
+
+
+def bench_extract_eu_law_text_json_modern(laws):
+    from src.module_3 import extract_eu_law_text_json
+
+    html = (FIXTURES_DIR / "modern.html").read_text(encoding="utf-8")
+    return lambda: extract_eu_law_text_json(html)
+
+
+def bench_extract_eu_law_text_json_legacy(laws):
+    from src.module_3 import extract_eu_law_text_json
+
+    html = (FIXTURES_DIR / "legacy.html").read_text(encoding="utf-8")
+    return lambda: extract_eu_law_text_json(html)
+
+
+def bench_clean_articles(laws):
+    from src.module_3 import clean_articles
+
+    documents = list(pick_laws(laws, n=20)["structured_json"])
+
+    def run():
+        for document in documents:
+            clean_articles(dict(document))
+
+    return run
+
+
+def bench_Law_from_json(laws):
+    from src.documents import Law
+
+    top = pick_laws(laws, n=20)
+    documents = list(zip(top["celex_id"], top["structured_json"]))
+    return lambda: [Law.from_json(celex_id, document) for celex_id, document in documents]
+
+
+def bench_aggregate_all_articles(laws):
+    from src.module_5 import SequenceFilterer
+
+    filterer = SequenceFilterer(minimum_length_limit=20, max_added_word_limit=10000)
+    top = pick_laws(laws)
+    df = pd.DataFrame({"celex_id": top["celex_id"],
+                       "matches": [matches(c, d) for c, d in zip(top["celex_id"], top["structured_json"])]})
+    titles = top[["celex_id", "title"]]
+    return lambda: filterer.aggregate_all_articles(df=df, title_df=titles, source_column="matches")
+
+
+def bench_BM25Index_score(laws):
+    from src.documents import Law
+    from src.utils.bm25 import BM25Index
+
+    sections = ("articles", "annexes")
+    index = BM25Index.build((c, [s.text for s in Law.from_json(c, d).sections(sections)])
+                            for c, d in zip(laws["celex_id"], laws["structured_json"]))
+    # The sections of the candidate laws of a query
+    docs = np.concatenate([index.group_docs(c) for c in pick_laws(laws)["celex_id"]])
+    query = "obligations of the member states on the safety of toys placed on the market"
+    return lambda: index.score(query, docs)
+
+
+def bench_CelexMetadata_mask(laws):
+    from src.utils.celex import CelexMetadata
+
+    metadata = CelexMetadata.build(laws["celex_id"])
+    # The 1000 BM25 hits of a query, filtered to the regulations of the last decade
+    ordinals = np.random.default_rng(0).integers(0, len(metadata), 1000)
+    return lambda: metadata.mask(ordinals, doc_type="regulation", year=(2010, None))
+
+
+def bench_clean_llm_response(laws):
+    from src.utils.utils import clean_llm_response
+
+    # A long answer with a thinking block, as returned by module 5
+    body = "\n\n".join(pick_laws(laws, n=1)["structured_json"].iloc[0]["articles"][i]["text"] for i in range(5))
+    response = DEFAULT_ANSWER + "\n\n\n" + body + "\nLet me think about it again.\n" + body
+    return lambda: clean_llm_response(response)
+
+
+BENCHMARKS = {
+    "_rrf": bench__rrf,
+    "getFullText": bench_getFullText,
+    "extract_eu_law_text_json[modern]": bench_extract_eu_law_text_json_modern,
+    "extract_eu_law_text_json[legacy]": bench_extract_eu_law_text_json_legacy,
+    "clean_articles": bench_clean_articles,
+    "Law.from_json": bench_Law_from_json,
+    "aggregate_all_articles": bench_aggregate_all_articles,
+    "BM25Index.score": bench_BM25Index_score,
+    "CelexMetadata.mask": bench_CelexMetadata_mask,
+    "clean_llm_response": bench_clean_llm_response,
+}
+
+
+def measure(fn, min_time=1.0):
+    """
+    Measure one operation.
+
+    Returns:
+        dict: ops_per_sec (best of 3 rounds of at least min_time/3 seconds) and the peak
+              bytes allocated during one call
+    """
+    fn()  # warm up
+
+    # Grow the number of calls per round until a round lasts long enough
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time / 3:
+            break
+        number *= 2
+
+    best = elapsed
+    for _ in range(2):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"ops_per_sec": round(number / best, 3), "peak_alloc_bytes": peak}
+
+
+def compare(results, baseline, tolerance):
+    """Names of the functions slower or allocating more than the baseline beyond the tolerance"""
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        slower = current["ops_per_sec"] < reference["ops_per_sec"] * (1 - tolerance)
+        heavier = current["peak_alloc_bytes"] > reference["peak_alloc_bytes"] * (1 + tolerance)
+        if slower or heavier:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the pure-CPU hot functions.")
+    parser.add_argument("--only", nargs="+", help="Run only these benchmarks")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Seconds spent timing each function")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH), help="Baseline file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Relative slowdown / allocation growth flagged as a regression (default: 0.2)")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+
+    laws = load_fixture_laws()
+    results = {}
+    print(f"{'function':<36} {'ops/sec':>12} {'peak alloc':>12} {'vs baseline':>12}")
+    for name, factory in BENCHMARKS.items():
+        if args.only and name not in args.only and name.split("[")[0] not in args.only:
+            continue
+        try:
+            fn = factory(laws)
+        except ImportError as e:
+            print(f"{name:<36} skipped ({e})")
+            continue
+        # The functions' own diagnostic prints are not part of the output
+        with redirect_stdout(io.StringIO()):
+            results[name] = measure(fn, min_time=args.min_time)
+
+        reference = baseline.get(name)
+        delta = ""
+        if reference:
+            delta = f"{(results[name]['ops_per_sec'] / reference['ops_per_sec'] - 1) * 100:+.1f}%"
+        print(f"{name:<36} {results[name]['ops_per_sec']:>12.1f} "
+              f"{results[name]['peak_alloc_bytes'] / 1024:>10.1f}KB {delta:>12}")
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline.update(results)
+        baseline_path.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"Baseline saved to {baseline_path}")
+        return 0
+
+    if not baseline:
+        print("No baseline to compare with, run with --save-baseline first")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name in regressions:
+        print(f"REGRESSION: {name}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
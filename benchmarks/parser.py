@@ -0,0 +1,82 @@
+"""
+Output parity and throughput of the lxml EUR-Lex parser against the BeautifulSoup one.
+
+    python -m benchmarks.parser                       # fixtures + synthetic large documents
+    python -m benchmarks.parser --html-dir pages/     # also every *.html file of a directory
+
+Known divergence: on legacy pages with unclosed <p> tags html.parser nests every following
+paragraph inside the open one and duplicates their text, lxml closes the paragraph.
+"""
+import re
+import sys
+import time
+import argparse
+from pathlib import Path
+
+from benchmarks.stubs import FIXTURES_DIR
+from src.module_3 import extract_eu_law_text_json, extract_eu_law_text_json_bs4
+
+
+def synthetic_modern_html(n_articles):
+    """The modern fixture with its articles repeated up to n_articles, renumbered"""
+    html = (FIXTURES_DIR / "modern.html").read_text(encoding="utf-8")
+    start = html.index('<div class="eli-subdivision" id="art_1">')
+    end = html.index('<div class="eli-subdivision" id="cpt_II">')
+    block = html[start:end]
+
+    articles = []
+    for i in range(n_articles):
+        articles.append(re.sub(r'art_1\b', f'art_{i + 1}', block).replace('Article 1', f'Article {i + 1}'))
+    return html[:start] + "".join(articles) + html[end:]
+
+
+def synthetic_legacy_html(n_articles):
+    """The legacy fixture with its articles repeated up to n_articles, renumbered"""
+    html = (FIXTURES_DIR / "legacy.html").read_text(encoding="utf-8")
+    start = html.index('<p>Article 1</p>')
+    end = html.index('<p>Article 2</p>')
+    block = html[start:end]
+
+    articles = [block.replace('Article 1', f'Article {i + 1}') for i in range(n_articles)]
+    return html[:start] + "".join(articles) + html[end:]
+
+
+def throughput(fn, html, min_time=1.0):
+    """Documents per second and MB of HTML per second"""
+    fn(html)
+    calls, start = 0, time.perf_counter()
+    while time.perf_counter() - start < min_time:
+        fn(html)
+        calls += 1
+    elapsed = time.perf_counter() - start
+    return calls / elapsed, calls * len(html.encode("utf-8")) / elapsed / 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parity and throughput of the EUR-Lex parsers.")
+    parser.add_argument("--html-dir", help="Directory of extra *.html documents to check")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Seconds spent timing each document")
+    args = parser.parse_args(argv)
+
+    documents = {path.name: path.read_text(encoding="utf-8") for path in sorted(FIXTURES_DIR.glob("*.html"))}
+    documents["synthetic modern (500 articles)"] = synthetic_modern_html(500)
+    documents["synthetic legacy (500 articles)"] = synthetic_legacy_html(500)
+    if args.html_dir:
+        for path in sorted(Path(args.html_dir).glob("*.html")):
+            documents[path.name] = path.read_text(encoding="utf-8")
+
+    mismatches = 0
+    print(f"{'document':<36} {'parity':>7} {'bs4 docs/s':>11} {'lxml docs/s':>12} {'lxml MB/s':>10} {'speedup':>8}")
+    for name, html in documents.items():
+        same = extract_eu_law_text_json(html) == extract_eu_law_text_json_bs4(html)
+        mismatches += not same
+        bs4_rate, _ = throughput(extract_eu_law_text_json_bs4, html, args.min_time)
+        lxml_rate, lxml_mb = throughput(extract_eu_law_text_json, html, args.min_time)
+        print(f"{name:<36} {'ok' if same else 'DIFF':>7} {bs4_rate:>11.1f} {lxml_rate:>12.1f} "
+              f"{lxml_mb:>10.2f} {lxml_rate / bs4_rate:>7.1f}x")
+
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
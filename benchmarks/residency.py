@@ -0,0 +1,121 @@
+"""
+Tail latency and RSS of the retrieval indices under each residency policy.
+
+Every policy of src.utils.residency runs in a fresh interpreter, the index files first
+dropped from the page cache (a node right after a deploy): the process opens the index
+with the policy, then runs the queries one by one. Reported per policy: the time to open
+(and warm or load) the index, the first query, the p50/p95/p99 latency of all of them and
+the RSS afterwards, split into heap (anonymous) and mapped file pages.
+
+The index is the BM25 shards of the law cache in src/data, or a Terrier index given
+with --terrier (pyterrier needed). Queries are titles of laws of the cache.
+
+    python -m benchmarks.residency
+    python -m benchmarks.residency --terrier cache/indices/eur_lex --queries 200
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+import numpy as np
+
+from src.utils.residency import POLICIES, evict_pages, index_files
+
+ROOT = Path(__file__).parent.parent
+
+
+def rss_mb():
+    """Resident memory of this process in MB: (total, anonymous, file-backed)"""
+    fields = {}
+    with open("/proc/self/status", "r", encoding="utf-8") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                fields[key] = int(value.split()[0]) / 1024
+    return fields.get("VmRSS", 0.0), fields.get("RssAnon", 0.0), fields.get("RssFile", 0.0)
+
+
+def run_policy(policy, index_dir, queries, terrier):
+    """Child process: open the index with a policy and time the queries"""
+    from src.utils.shards import ShardedIndex
+
+    evict_pages(index_files(index_dir))
+    start = time.perf_counter()
+    if terrier:
+        import pyterrier as pt
+        from src.utils.residency import open_terrier_index
+
+        if not pt.started():
+            pt.init()
+        retriever = pt.terrier.Retriever(open_terrier_index(pt, index_dir, policy), wmodel="BM25")
+        search = lambda query: retriever.search(query)
+    else:
+        index = ShardedIndex(index_dir, processes=False, residency=policy)
+        search = lambda query: index.search([query], 1000)
+    open_ms = (time.perf_counter() - start) * 1000
+
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        times.append((time.perf_counter() - start) * 1000)
+    rss, anon, file = rss_mb()
+    return {"policy": policy, "open_ms": open_ms, "first_ms": times[0],
+            **{f"p{q}_ms": float(np.percentile(times, q)) for q in (50, 95, 99)},
+            "rss_mb": rss, "anon_mb": anon, "file_mb": file}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tail latency and RSS per index residency policy.")
+    parser.add_argument("--policies", nargs="+", choices=POLICIES, default=list(POLICIES))
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--shards", type=int, default=4, help="Shards of the law cache index")
+    parser.add_argument("--terrier", help="Terrier index directory to measure instead of the law cache shards")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--index-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--queries-file", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        queries = json.loads(Path(args.queries_file).read_text(encoding="utf-8"))
+        print(json.dumps(run_policy(args.child, args.index_dir, queries, bool(args.terrier))))
+        return 0
+
+    from benchmarks.sharded import load_laws
+    from src.utils.shards import build_shards
+
+    laws = load_laws()
+    queries = laws["title"].dropna().sample(n=min(args.queries, len(laws)), random_state=0).tolist()
+    with tempfile.TemporaryDirectory() as tmp:
+        index_dir = args.terrier
+        if index_dir is None:
+            index_dir = str(Path(tmp) / "shards")
+            build_shards(zip(laws["celex_id"], laws["text"]), index_dir, args.shards)
+        queries_file = Path(tmp) / "queries.json"
+        queries_file.write_text(json.dumps(queries), encoding="utf-8")
+        size_mb = sum(path.stat().st_size for path in index_files(index_dir)) / 1024 / 1024
+        print(f"{'Terrier index' if args.terrier else f'{args.shards} BM25 shards'} of {size_mb:.0f} MB, "
+              f"{len(queries)} queries, page cache dropped before each policy")
+
+        results = []
+        for policy in args.policies:
+            command = [sys.executable, "-m", "benchmarks.residency", "--child", policy, "--index-dir", index_dir,
+                       "--queries-file", str(queries_file)] + (["--terrier", args.terrier] if args.terrier else [])
+            output = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, check=True,
+                                    env={**os.environ, "PYTHONPATH": str(ROOT)})
+            results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    columns = ("open_ms", "first_ms", "p50_ms", "p95_ms", "p99_ms", "rss_mb", "anon_mb", "file_mb")
+    print(f"{'policy':<8}" + "".join(f"{column:>10}" for column in columns))
+    for result in results:
+        print(f"{result['policy']:<8}" + "".join(f"{result[column]:>10.1f}" for column in columns))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Sharded BM25 retrieval against a single index of the same corpus.
+
+Indexes the texts of the law cache in src/data once as a single BM25Index and once as
+--shards shards, then for every query checks that the sharded top k has the same laws and
+scores as the single index (global statistics make the partition invisible) and reports
+the latency of both, the shards served by worker processes. Queries are the titles of
+laws of the cache.
+
+    python -m benchmarks.sharded
+    python -m benchmarks.sharded --shards 8 --partition sector --queries 100 --k 100
+"""
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.utils.bm25 import BM25Index
+from src.utils.shards import PARTITIONS, ShardedIndex, build_shards
+
+DATA_DIR = Path(__file__).parent.parent / "src" / "data"
+
+
+def load_laws(limit=None):
+    """CELEX id, title and text of the laws of the cache"""
+    df = pd.concat([pd.read_csv(path, encoding="utf-8", usecols=["celex_id", "title", "text"])
+                    for path in sorted(DATA_DIR.glob("cachedLawsTexts_*.csv"))], ignore_index=True)
+    df = df[df["text"].notna()].drop_duplicates("celex_id")
+    return df.head(limit) if limit else df
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q) * 1000) if values else 0.0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sharded BM25 retrieval against a single index.")
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--partition", choices=PARTITIONS, default="hash")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=100, help="Laws retrieved per query")
+    parser.add_argument("--batch", type=int, default=1, help="Queries sent to the shards together")
+    parser.add_argument("--laws", type=int, default=None, help="Laws indexed (default: the whole cache)")
+    args = parser.parse_args(argv)
+
+    laws = load_laws(args.laws)
+    queries = laws["title"].dropna().sample(n=min(args.queries, len(laws)), random_state=0).tolist()
+    print(f"{len(laws)} laws, {len(queries)} queries, top {args.k}, {args.shards} shards ({args.partition})")
+
+    start = time.perf_counter()
+    single = BM25Index.build((celex_id, [text]) for celex_id, text in zip(laws["celex_id"], laws["text"]))
+    print(f"single index built in {time.perf_counter() - start:.1f} s")
+
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        sizes = build_shards(zip(laws["celex_id"], laws["text"]), root, args.shards, args.partition)
+        print(f"shards built in {time.perf_counter() - start:.1f} s, laws per shard: {sizes}")
+        sharded = ShardedIndex(root)
+        try:
+            single_times, sharded_times, mismatches = [], [], 0
+            for i in range(0, len(queries), args.batch):
+                batch = queries[i:i + args.batch]
+                start = time.perf_counter()
+                expected = []
+                for query in batch:
+                    docs, scores = single.search(query, args.k)
+                    expected.append([(single.group_keys[d], s) for d, s in zip(docs, scores)])
+                single_times.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                rankings = sharded.search(batch, args.k)
+                sharded_times.append(time.perf_counter() - start)
+
+                for want, got in zip(expected, rankings):
+                    # Ties at the cut may keep different laws: compare the scores, then the laws above the cut
+                    same_scores = np.allclose([s for _, s in want], [s for _, s in got])
+                    cut = want[-1][1] + 1e-9 if want else 0
+                    same_laws = {c for c, s in want if s > cut} == {c for c, s in got if s > cut}
+                    mismatches += not (len(want) == len(got) and same_scores and same_laws)
+        finally:
+            sharded.close()
+
+    print(f"{'':<10}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, times in (("single", single_times), ("sharded", sharded_times)):
+        print(f"{name:<10}{percentile(times, 50):>10.2f}{percentile(times, 95):>10.2f}")
+    print(f"rankings differing from the single index: {mismatches}/{len(queries)}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""
+Local stand-ins for the pipeline's upstream services.
+
+- OpenAIStub: an OpenAI-compatible /chat/completions endpoint (the OpenRouter API) with a
+  configurable time to first token and token rate.
+- EurLexStub: serves fixture HTML for /<celex_id> like publications.europa.eu/resource/celex/.
+
+Both run an HTTP server in a daemon thread of the current process:
+
+    with OpenAIStub(latency=0.5, tokens_per_second=50) as llm, EurLexStub() as eurlex:
+        os.environ["OPENROUTER_BASE_URL"] = llm.url
+        os.environ["EURLEX_BASE_URL"] = eurlex.url
+"""
+import json
+import time
+import random
+import hashlib
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+DEFAULT_ANSWER = (
+    "<think>The question concerns EU product legislation.</think>"
+    "Under EU law, products placed on the internal market must comply with the applicable "
+    "Union harmonisation legislation. Economic operators must ensure conformity, keep the "
+    "technical documentation and cooperate with market surveillance authorities."
+)
+
+
+class _StubServer:
+    """Run a handler class on 127.0.0.1 in a background thread"""
+
+    def __init__(self, port=0):
+        self.port = port
+        self.httpd = None
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _count(self):
+        with self._lock:
+            self.requests += 1
+
+    def handler(self):
+        raise NotImplementedError
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", self.port), self.handler())
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class OpenAIStub(_StubServer):
+    """
+    OpenAI-compatible chat completions stub.
+
+    Args:
+        latency (float): Seconds before the first token
+        tokens_per_second (float): Generation speed of the completion tokens
+        completion_tokens (int): Length of every answer, in tokens
+        answer (str): Answer text returned for every prompt
+    """
+
+    def __init__(self, latency=0.5, tokens_per_second=50.0, completion_tokens=200, answer=DEFAULT_ANSWER, port=0):
+        super().__init__(port)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.answer = answer
+
+    @property
+    def url(self):
+        return super().url + "/v1"
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                stub._count()
+                if not self.path.endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                prompt = "".join(m.get("content", "") for m in request.get("messages", []))
+                # Rough token count of the prompt, ~4 characters per token
+                prompt_tokens = max(1, len(prompt) // 4)
+
+                generation = stub.completion_tokens / stub.tokens_per_second if stub.tokens_per_second else 0
+                time.sleep(stub.latency + generation)
+
+                body = json.dumps({
+                    "id": f"chatcmpl-stub-{random.getrandbits(32):08x}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "stub"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": stub.answer},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": stub.completion_tokens,
+                        "total_tokens": prompt_tokens + stub.completion_tokens,
+                    },
+                }).encode("utf-8")
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class EurLexStub(_StubServer):
+    """
+    EUR-Lex document stub.
+
+    /<celex_id> returns the document set with set_document, else fixtures/<celex_id>.html if
+    it exists, otherwise the default fixture (the modern format document). Responses carry
+    an ETag and a Last-Modified header and conditional requests matching them get a 304.
+
+    Throttling and outages are simulated with error_rate (a share of the requests answered
+    with error_status) or fail_next (the next n requests fail).
+
+    Args:
+        latency (float): Seconds before answering
+        fixtures_dir (Path): Directory with the fixture HTML files
+        default_fixture (str): File served for unknown CELEX ids, None to answer 404
+        error_rate (float): Probability of answering error_status instead of the document
+        error_status (int): Status of the injected errors (429 or 503)
+        retry_after (int): Retry-After seconds sent with the injected errors, None for none
+    """
+
+    def __init__(self, latency=0.0, fixtures_dir=FIXTURES_DIR, default_fixture="modern.html", port=0,
+                 error_rate=0.0, error_status=503, retry_after=None):
+        super().__init__(port)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.errors = 0
+        self._fail_next = 0
+        self.fixtures_dir = Path(fixtures_dir)
+        self.default_fixture = default_fixture
+        self._cache = {}
+        self.documents = {}
+        self.not_modified = 0
+        self.started = time.time()
+
+    def fail_next(self, count, status=None):
+        """Answer the next count requests with an error"""
+        with self._lock:
+            self._fail_next = count
+            if status is not None:
+                self.error_status = status
+
+    def _inject_error(self):
+        with self._lock:
+            if self._fail_next > 0:
+                self._fail_next -= 1
+            elif not (self.error_rate and random.random() < self.error_rate):
+                return None
+            self.errors += 1
+            return self.error_status
+
+    def set_document(self, celex_id, html):
+        """Serve this HTML for a CELEX id from now on (a changed law)"""
+        self.documents[celex_id] = html.encode("utf-8") if isinstance(html, str) else html
+
+    @property
+    def url(self):
+        return super().url + "/"
+
+    def fixture(self, celex_id):
+        """HTML served for a CELEX id, or None"""
+        if celex_id in self.documents:
+            return self.documents[celex_id]
+        name = f"{celex_id}.html"
+        if not (self.fixtures_dir / name).exists():
+            name = self.default_fixture
+        if name is None:
+            return None
+        if name not in self._cache:
+            self._cache[name] = (self.fixtures_dir / name).read_bytes()
+        return self._cache[name]
+
+    def respond(self, handler, celex_id):
+        """Write the response for a CELEX id"""
+        status = self._inject_error()
+        if status is not None:
+            handler.send_response(status)
+            if self.retry_after is not None:
+                handler.send_header("Retry-After", str(self.retry_after))
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+
+        html = self.fixture(celex_id)
+        if html is None:
+            handler.send_error(404)
+            return
+
+        etag = '"' + hashlib.sha256(html).hexdigest()[:16] + '"'
+        if handler.headers.get("If-None-Match") == etag:
+            with self._lock:
+                self.not_modified += 1
+            handler.send_response(304)
+            handler.send_header("ETag", etag)
+            handler.end_headers()
+            return
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/html; charset=utf-8")
+        handler.send_header("Content-Length", str(len(html)))
+        handler.send_header("ETag", etag)
+        handler.send_header("Last-Modified", time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(self.started)))
+        handler.end_headers()
+        handler.wfile.write(html)
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub._count()
+                if stub.latency:
+                    time.sleep(stub.latency)
+                stub.respond(self, self.path.strip("/").split("?")[0])
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -1,59 +1,323 @@
 import os
+import importlib
 from src.module_1 import run_module_1
-from src.module_2 import run_module_2
-from src.module_3 import run_module_3
-from src.module_4 import run_module_4
+from src.module_2 import run_module_2_batch, initialize as initialize_retrieval
+from src.module_3 import run_module_3, get_cache, preload_laws
+from src.module_4 import run_module_4_batch, get_model, get_section_index, preload_embeddings, PASSAGE_TOP_M
 from src.module_5 import run_module_5
-from src.utils.utils import clean_llm_response
+from src.rerank import rerank_laws_batch, RERANK_ENABLED, RERANK_TOP_N, RERANK_MAX_LAWS
+from src.query_log import get_query_log
+from src.utils.utils import clean_llm_response, approximate_size
+from src.utils.singleflight import SingleFlight
+from src.utils.deadline import Deadline
+from src.utils.profiling import profile_mode, request_profile
+from src.utils.tracing import span, start_metrics_server
 
-def process_legal_query(user_query: str) -> str:
+# Cheaper settings of the stages when the deadline is short: laws kept after reranking
+# (below the 2 of RERANK_MAX_LAWS and of module 2 without reranking), sections encoded
+# per query and words of LLM context
+DEGRADED_MAX_LAWS = 1
+DEGRADED_TOP_M = 10
+DEGRADED_CONTEXT_WORDS = 3000
+
+# Laws prewarmed at startup and the memory they may take
+PREWARM_LAWS = int(os.environ.get("LEGALQA_PREWARM_LAWS", 100))
+PREWARM_MEMORY_MB = float(os.environ.get("LEGALQA_PREWARM_MEMORY_MB", 256))
+
+def warmup(top_laws: int = PREWARM_LAWS, memory_budget_mb: float = PREWARM_MEMORY_MB):
     """
-    Process a user's legal query and return a response.
-    
+    Load the retrieval indices, the law cache, the section index and the encoder ahead of
+    the first query, then prewarm the laws most often retrieved according to the query log.
+
     Args:
-        user_query (str): The user's legal question
-        
-    Returns:
-        str: The AI-generated response about EU law
+        top_laws (int): Laws to prewarm, 0 to skip prewarming
+        memory_budget_mb (float): Memory the prewarmed texts and embeddings may take
     """
-    
+    with span("warmup"):
+        initialize_retrieval()
+        get_cache()
+        get_section_index()
+        get_model()
+        # Imported by the first LLM call otherwise
+        importlib.import_module("openai")
+        if top_laws > 0 and memory_budget_mb > 0:
+            prewarm(top_laws, int(memory_budget_mb * 1024 * 1024))
+
+def prewarm(top_laws: int, memory_budget: int):
+    """
+    Preload the parsed text and the article embeddings of the most retrieved laws.
+
+    The parsed texts may take up to half of the budget, the embeddings the rest.
+
+    Args:
+        top_laws (int): Laws to prewarm
+        memory_budget (int): Bytes the texts and embeddings may take
+    """
+    celex_ids = [celex_id for celex_id, _ in get_query_log().top_laws(top_laws)]
+    with span("prewarm", laws=len(celex_ids)):
+        if not celex_ids:
+            return
+        laws = preload_laws(celex_ids, memory_budget // 2)
+        documents = [laws[celex_id] for celex_id in celex_ids if celex_id in laws]
+        preload_embeddings(documents, memory_budget - approximate_size(documents))
+        print(f"Prewarmed {len(documents)} of the {len(celex_ids)} most retrieved laws")
+
+def _elapsed_ms(finished_span):
+    return round(finished_span.duration * 1000, 3)
+
+def _record_timing(result, index, stage, finished_span, on_stage):
+    result["timings"][stage] = _elapsed_ms(finished_span)
+    if on_stage is not None:
+        on_stage(index, stage, result["timings"][stage])
+
+def _log_laws(laws):
+    """Record the laws retrieved per query in the query log, never failing the queries"""
     try:
+        for output_2 in laws.values():
+            get_query_log().record(output_2['celex_id'].tolist())
+    except OSError as e:
+        print(f"Could not write the query log: {e}")
+
+# Pipeline runs in flight, by normalized query
+_query_flight = SingleFlight(name="pipeline_queries")
+
+def normalize_query(user_query: str) -> str:
+    """Key of a query for coalescing: case and whitespace differences do not count"""
+    return " ".join(user_query.split()).casefold()
+
+def run_pipeline_batch(user_queries: list, on_stage=None, deadline: Deadline = None) -> list:
+    """
+    Run the five modules over several queries, batching the retrieval (module 2) and
+    embedding (module 4) stages across them.
+
+    Identical queries (see normalize_query) are answered once: within the batch, and
+    across threads while a run of the same query is in flight, in which case the later
+    caller waits for that run's result instead of starting its own.
+
+    Args:
+        user_queries (list): The users' legal questions
+        on_stage (callable, optional): Called as on_stage(query_index, stage, elapsed_ms)
+            each time a stage finishes for a query (not for queries answered by another
+            caller's run)
+        deadline (Deadline, optional): Latency budget of the batch, LEGALQA_DEADLINE_SECONDS
+            from now by default. Stages switch to cheaper modes when it is short.
+
+    Returns:
+        list: One dict per query with 'query', 'response', 'titles', 'timings' (ms per stage),
+              'rerank' (candidate and kept laws, downstream work saved), 'coalesced' (True if
+              the answer comes from another caller's run), 'degradations' (the cheaper modes
+              applied to meet the deadline) and 'error' (None on success)
+    """
+    deadline = deadline or Deadline.from_env()
+    keys = [normalize_query(q) for q in user_queries]
+    # Query text run for every key: the first one having it
+    texts = {}
+    for key, user_query in zip(keys, user_queries):
+        texts.setdefault(key, user_query)
+    indices = {}
+    for i, key in enumerate(keys):
+        indices.setdefault(key, []).append(i)
+
+    def run(led_keys):
+        def on_led_stage(j, stage, elapsed_ms):
+            for i in indices[led_keys[j]]:
+                on_stage(i, stage, elapsed_ms)
+
+        return _run_pipeline_batch([texts[key] for key in led_keys], on_led_stage if on_stage else None, deadline)
+
+    outcomes = _query_flight.do_many(keys, run)
 
-        API_KEY = os.environ.get("OPENROUTER_API_KEY")
+    results = []
+    for i, (key, user_query) in enumerate(zip(keys, user_queries)):
+        result, shared = outcomes[key]
+        # Later duplicates within the batch share the run too
+        coalesced = shared or indices[key][0] != i
+        results.append({**result, "query": user_query, "timings": dict(result["timings"]),
+                        "degradations": list(result["degradations"]), "coalesced": coalesced})
+    return results
 
-        ####################################################################################
-        ########## STEP 1  Translates the user query into a legal question domain ##########
-        ####################################################################################
-        
-        output_1 = run_module_1(user_query, API_KEY=API_KEY)
+def _run_pipeline_batch(user_queries: list, on_stage=None, deadline: Deadline = None) -> list:
+    """Run the five modules over distinct queries, see run_pipeline_batch"""
+    API_KEY = os.environ.get("OPENROUTER_API_KEY")
+    deadline = deadline or Deadline()
 
-        ####################################################################################
-        ############ STEP 2 Find the relevvant laws according to the legal query ###########
-        ####################################################################################
+    results = [{"query": q, "response": None, "titles": [], "timings": {}, "rerank": None, "degradations": [],
+                "error": None} for q in user_queries]
+    legal_queries = {}
 
-        output_2, titles = run_module_2(output_1, K=5)
-        
-        ####################################################################################
-        #################### STEP 3 Retrieve the full text of the laws #####################
-        ####################################################################################
-        
-        output_3 = run_module_3(output_2)
+    def degrade(name, **details):
+        deadline.degrade(name, **details)
+        for result in results:
+            result["degradations"].append(deadline.degradations[-1])
 
-        ####################################################################################
-        ## STEP 4 Filter by laws and articles based on semantic similarity with the query ##
-        ####################################################################################
+    ####################################################################################
+    ########## STEP 1  Translates the user query into a legal question domain ##########
+    ####################################################################################
+
+    # Not enough time for the whole pipeline: search with the question as asked
+    skip_rephrase = deadline.short_for(("module_1", "module_2", "rerank", "module_3", "module_4", "module_5"))
+    if skip_rephrase:
+        degrade("skip_rephrase")
+
+    for i, result in enumerate(results):
+        try:
+            # A skipped rephrasing is not a module_1 span: its duration would lower the estimate
+            with span("module_1.skipped" if skip_rephrase else "module_1") as s:
+                legal_queries[i] = result["query"] if skip_rephrase else run_module_1(result["query"], API_KEY=API_KEY)
+        except Exception as e:
+            result["error"] = f"Error processing query: {str(e)}"
+        _record_timing(result, i, "module_1", s, on_stage)
+
+    ####################################################################################
+    ############ STEP 2 Find the relevvant laws according to the legal query ###########
+    ####################################################################################
+
+    pending = sorted(legal_queries)
+    laws = {}
+    if pending:
+        try:
+            # With reranking, every law of the fused top-N is a candidate
+            threshold, top_n = (0, RERANK_TOP_N) if RERANK_ENABLED else (5, 10)
+            with span("module_2", queries=len(pending)) as s:
+                outputs_2 = run_module_2_batch([legal_queries[i] for i in pending], K=threshold, top_n=top_n)
+                for i, (output_2, titles) in zip(pending, outputs_2):
+                    laws[i] = output_2
+                    results[i]["titles"] = titles
+        except Exception as e:
+            for i in pending:
+                results[i]["error"] = f"Error processing query: {str(e)}"
+        for i in pending:
+            _record_timing(results[i], i, "module_2", s, on_stage)
+
+    ####################################################################################
+    ####### STEP 2b Rerank the candidate laws, keep those likely to contribute #########
+    ####################################################################################
+
+    max_laws = RERANK_MAX_LAWS
+    short = bool(laws) and deadline.short_for(("rerank", "module_3", "module_4", "module_5"))
+    if short:
+        max_laws = DEGRADED_MAX_LAWS
+    # Queries that lost laws to the degraded limit
+    truncated = []
+
+    def keep(i, df):
+        if short and len(df) > max_laws:
+            truncated.append(i)
+        laws[i] = df.head(max_laws)
+        results[i]["titles"] = laws[i]['title'].tolist()
+
+    pending = sorted(laws)
+    if pending and RERANK_ENABLED:
+        try:
+            with span("rerank", queries=len(pending)) as s:
+                reranked = rerank_laws_batch([laws[i] for i in pending], [legal_queries[i] for i in pending])
+                for i, (kept, report) in zip(pending, reranked):
+                    keep(i, kept)
+                    results[i]["rerank"] = report
+        except Exception as e:
+            # The reranker only saves work: fall back to the best laws of module 2
+            print(f"Reranking failed, keeping the module 2 ranking: {e}")
+            truncated.clear()
+            for i in pending:
+                keep(i, laws[i])
+        for i in pending:
+            _record_timing(results[i], i, "rerank", s, on_stage)
+    elif short:
+        for i in pending:
+            keep(i, laws[i])
+    if truncated:
+        # Recorded only for the queries whose laws it removed
+        deadline.degrade("fewer_laws", max_laws=max_laws)
+        for i in truncated:
+            results[i]["degradations"].append(deadline.degradations[-1])
+    _log_laws(laws)
+
+    ####################################################################################
+    #################### STEP 3 Retrieve the full text of the laws #####################
+    ####################################################################################
+
+    # Not enough time to fetch laws from EUR-Lex: cached texts only
+    cached_only = bool(laws) and deadline.short_for(("module_3", "module_4", "module_5"))
+    if cached_only:
+        degrade("cached_only")
+
+    full_texts = {}
+    for i in sorted(laws):
+        try:
+            with span("module_3", cached_only=cached_only) as s:
+                full_texts[i] = run_module_3(laws[i], cached_only=cached_only)
+                s.set_attribute("laws", len(full_texts[i]))
+        except Exception as e:
+            results[i]["error"] = f"Error processing query: {str(e)}"
+        _record_timing(results[i], i, "module_3", s, on_stage)
+
+    ####################################################################################
+    ## STEP 4 Filter by laws and articles based on semantic similarity with the query ##
+    ####################################################################################
+
+    pending = sorted(full_texts)
+    top_m = PASSAGE_TOP_M
+    if pending and deadline.short_for(("module_4", "module_5")):
+        top_m = min(top_m, DEGRADED_TOP_M) if top_m else DEGRADED_TOP_M
+        degrade("fewer_sections", top_m=top_m)
+
+    filtered = {}
+    if pending:
+        try:
+            with span("module_4", queries=len(pending)) as s:
+                outputs_4 = run_module_4_batch([full_texts[i] for i in pending], [legal_queries[i] for i in pending],
+                                               top_m=top_m)
+                filtered = dict(zip(pending, outputs_4))
+        except Exception as e:
+            for i in pending:
+                results[i]["error"] = f"Error processing query: {str(e)}"
+        for i in pending:
+            _record_timing(results[i], i, "module_4", s, on_stage)
+
+    #####################################################################################
+    ############### STEP 5 Generate the final answer based on our context ###############
+    #####################################################################################
+
+    context_words = 10000
+    if filtered and deadline.short_for(("module_5",)):
+        context_words = DEGRADED_CONTEXT_WORDS
+        degrade("smaller_context", words=context_words)
+
+    for i in sorted(filtered):
+        try:
+            with span("module_5") as s:
+                output_5 = run_module_5(filtered[i], full_texts[i], legal_queries[i], dummy_prompt=False,
+                                        max_context_words=context_words)
+                results[i]["response"] = clean_llm_response(output_5)
+        except Exception as e:
+            results[i]["error"] = f"Error processing query: {str(e)}"
+        _record_timing(results[i], i, "module_5", s, on_stage)
+
+    return results
+
+def process_legal_query(user_query: str, deadline_seconds: float = None, profile=False) -> str:
+    """
+    Process a user's legal query and return a response.
+
+    Args:
+        user_query (str): The user's legal question
+        deadline_seconds (float, optional): Latency budget, LEGALQA_DEADLINE_SECONDS by default
+        profile (bool or str, optional): Profile the query (True, "sampling" or "cprofile"),
+            written to cache/profiles/<trace_id>; LEGALQA_PROFILE_SAMPLE_RATE applies otherwise
+
+    Returns:
+        str: The AI-generated response about EU law
+    """
 
-        output_4 = run_module_4(output_3, output_1)
+    # Expose the latency histograms if LEGALQA_METRICS_PORT is set
+    start_metrics_server()
 
-        #####################################################################################
-        ############### STEP 5 Generate the final answer based on our context ###############
-        #####################################################################################
+    with span("process_legal_query", query_chars=len(user_query)) as s, request_profile(s, profile_mode(profile)):
+        deadline = Deadline(deadline_seconds) if deadline_seconds else None
+        result = run_pipeline_batch([user_query], deadline=deadline)[0]
 
-        output_5 = run_module_5(output_4, output_3, output_1, dummy_prompt=False)
-        response = clean_llm_response(output_5)
+    if result["error"]:
+        print(result["error"])
+        return result["error"]
 
-        return response, titles
-        
-    except Exception as e:
-        print(f"Error processing query: {str(e)}")
-        return f"Error processing query: {str(e)}"
\ No newline at end of file
+    return result["response"], result["titles"]
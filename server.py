@@ -0,0 +1,257 @@
+"""
+Standalone HTTP API for the legal Q&A pipeline.
+
+The Terrier indices, the law cache and the encoder are loaded once at startup and
+queries run on a bounded pool of worker threads, so several UI replicas can share one
+warmed backend.
+
+    python server.py --port 8000 --workers 4 --max-queue 16
+
+Endpoints:
+    POST /query    {"query": "..."} -> {"response", "titles", "timings", "degradations", "trace_id", "error"}
+                   An optional "deadline_ms" sets the latency budget of the request
+                   (LEGALQA_DEADLINE_SECONDS by default), counted from its arrival.
+                   With {"stream": true} the answer is streamed as NDJSON events: one
+                   {"event": "stage"} per finished module, then a final {"event": "result"}.
+                   An "X-Profile: 1" header (or "sampling", "cprofile") profiles the request:
+                   the "profile" field of the result is the path of the profile written.
+    GET  /health   200 while the process is alive
+    GET  /ready    200 once the resources are loaded, 503 before
+    GET  /metrics  Prometheus text metrics
+"""
+import os
+import sys
+import json
+import queue
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from orchestrator import warmup, run_pipeline_batch
+from src.utils.deadline import Deadline
+from src.utils.profiling import profile_mode, request_profile
+from src.utils.tracing import REGISTRY, span, render_prometheus
+
+
+class PipelineService:
+    """Warmed pipeline resources plus a bounded executor running the queries"""
+
+    def __init__(self, workers=4, max_queue=16):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="legalqa-query")
+        # Requests running or waiting for a worker; above the bound new requests are rejected
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.ready = threading.Event()
+        self.warmup_error = None
+
+    def start_warmup(self):
+        """Load the indices, the law cache and the encoder in the background"""
+        def _warmup():
+            try:
+                warmup()
+                self.ready.set()
+            except Exception as e:
+                self.warmup_error = f"{type(e).__name__}: {e}"
+                print(f"Warmup failed: {self.warmup_error}")
+
+        threading.Thread(target=_warmup, name="legalqa-warmup", daemon=True).start()
+
+    def _run(self, user_query, on_stage=None, deadline=None, profile=None):
+        with span("process_legal_query", query_chars=len(user_query)) as s, request_profile(s, profile):
+            result = run_pipeline_batch([user_query], on_stage=on_stage, deadline=deadline)[0]
+        result["trace_id"] = s.trace_id
+        if profile is not None:
+            result["profile"] = s.attributes.get("profile")
+        return result
+
+    def submit(self, user_query, on_stage=None, deadline=None, profile=None):
+        """
+        Queue a query on the executor.
+
+        Args:
+            user_query (str): The question
+            on_stage (callable): Stage callback, see run_pipeline_batch
+            deadline (Deadline): Latency budget, including the time waiting for a worker
+            profile (str): Profiler of the request (see src.utils.profiling), None not to profile
+
+        Returns:
+            Future or None: The future of the result dict, or None if the service is saturated
+        """
+        if not self._slots.acquire(blocking=False):
+            REGISTRY.increment("server_rejected_requests")
+            return None
+
+        with self._lock:
+            self._in_flight += 1
+            REGISTRY.set_gauge("server_in_flight_requests", self._in_flight)
+
+        future = self.executor.submit(self._run, user_query, on_stage, deadline or Deadline.from_env(), profile)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+            REGISTRY.set_gauge("server_in_flight_requests", self._in_flight)
+        self._slots.release()
+
+
+def _query_error(e):
+    """Error message of a query whose pipeline raised, counted and logged"""
+    REGISTRY.increment("server_failed_requests")
+    message = f"{type(e).__name__}: {e}"
+    print(f"Query failed: {message}")
+    return message
+
+
+def make_handler(service):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/health":
+                self._send_json(200, {"status": "ok"})
+            elif path == "/ready":
+                status = 200 if service.ready.is_set() else 503
+                self._send_json(status, {"ready": service.ready.is_set(), "error": service.warmup_error})
+            elif path == "/metrics":
+                body = render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self._send_json(404, {"error": "Not found"})
+
+        def do_POST(self):
+            if self.path.split("?")[0] != "/query":
+                self._send_json(404, {"error": "Not found"})
+                return
+
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except (ValueError, json.JSONDecodeError):
+                self._send_json(400, {"error": "Body must be a JSON object"})
+                return
+
+            user_query = payload.get("query", "") if isinstance(payload, dict) else ""
+            if not isinstance(user_query, str) or not user_query.strip():
+                self._send_json(400, {"error": "Missing 'query'"})
+                return
+
+            deadline_ms = payload.get("deadline_ms")
+            if deadline_ms is not None and (not isinstance(deadline_ms, (int, float)) or deadline_ms <= 0):
+                self._send_json(400, {"error": "'deadline_ms' must be a positive number"})
+                return
+            deadline = Deadline(deadline_ms / 1000) if deadline_ms else Deadline.from_env()
+
+            try:
+                profile = profile_mode(self.headers.get("X-Profile"))
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+
+            if not service.ready.is_set():
+                self._send_json(503, {"error": "Service is warming up"}, {"Retry-After": "5"})
+                return
+
+            if payload.get("stream"):
+                self._stream(user_query, deadline, profile)
+                return
+
+            future = service.submit(user_query, deadline=deadline, profile=profile)
+            if future is None:
+                self._send_json(503, {"error": "Too many requests in flight"}, {"Retry-After": "1"})
+                return
+            try:
+                result = future.result()
+            except Exception as e:
+                self._send_json(500, {"error": _query_error(e)})
+                return
+            self._send_json(200, result)
+
+        def _stream(self, user_query, deadline=None, profile=None):
+            """Send NDJSON events as the stages finish, using chunked transfer encoding"""
+            events = queue.Queue()
+            future = service.submit(user_query, on_stage=lambda _, stage, ms: events.put(
+                {"event": "stage", "stage": stage, "ms": ms}), deadline=deadline, profile=profile)
+            if future is None:
+                self._send_json(503, {"error": "Too many requests in flight"}, {"Retry-After": "1"})
+                return
+            future.add_done_callback(lambda f: events.put(None))
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            while True:
+                event = events.get()
+                if event is None:
+                    break
+                self._write_chunk(event)
+            try:
+                result = {"event": "result", **future.result()}
+            except Exception as e:
+                # The status line is sent: the failure goes in the final event
+                result = {"event": "result", "error": _query_error(e)}
+            self._write_chunk(result)
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _write_chunk(self, event):
+            data = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the legal Q&A pipeline over HTTP.")
+    parser.add_argument("--host", default=os.environ.get("LEGALQA_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("LEGALQA_PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("LEGALQA_WORKERS", 4)),
+                        help="Queries run concurrently (default: 4)")
+    parser.add_argument("--max-queue", type=int, default=int(os.environ.get("LEGALQA_MAX_QUEUE", 16)),
+                        help="Queries waiting for a worker before new ones are rejected (default: 16)")
+    args = parser.parse_args(argv)
+
+    service = PipelineService(workers=args.workers, max_queue=args.max_queue)
+    service.start_warmup()
+
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    httpd.daemon_threads = True
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.executor.shutdown(wait=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
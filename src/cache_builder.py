@@ -0,0 +1,566 @@
+"""
+Bulk builder of the law cache read by module 3 (src/data/cachedLawsTexts_{start}_{end}.csv).
+
+Laws of the EURLEX corpus are fetched from EUR-Lex by a pool of threads sharing a token
+bucket rate limit, parsed in a pool of processes and written in shards of 400 corpus rows,
+the same layout cacheGeneration.ipynb produced. Every processed law is appended to a
+per-shard checkpoint file, so an interrupted run is resumed by launching the same command
+again (the laws that failed are fetched again); finished shards are skipped unless
+--refresh is given. --retry-failed fetches again only the laws a finished shard holds
+without structured_json.
+
+The raw HTML of every fetched law is kept in the raw store (src/raw_store.py) and laws
+already in it are parsed without being fetched again. After a parser change (a new
+module_3.PARSER_VERSION), --reparse updates the existing shards from the raw store alone.
+--revalidate sends conditional GETs (ETag / Last-Modified) for the laws past their
+freshness lifetime and re-parses only the documents that changed.
+
+    python -m src.cache_builder --start 0 --end 57000 --concurrency 8 --rate 4 --parse-workers 4
+    python -m src.cache_builder --laws laws.csv --base-url http://127.0.0.1:8080/ --output-dir /tmp/cache
+    python -m src.cache_builder --retry-failed --rate 2
+    python -m src.cache_builder --reparse --parse-workers 8
+    python -m src.cache_builder --revalidate --max-age-days 30 --rate 2
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, as_completed, FIRST_COMPLETED
+
+import pandas as pd
+
+from src.module_3 import EURLEX_BASE_URL, PARSER_VERSION, url_encode_celex_id, extract_eu_law_text_json, clean_articles
+from src.raw_store import RawStore, RAW_STORE_DIR, DAY, FreshnessPolicy, conditional_headers, response_validators
+from src.utils.fetch import FetchScheduler, FetchError
+from src.utils.tracing import REGISTRY, span
+
+DATA_DIR = Path(__file__).parent / "data"
+SHARD_SIZE = 400
+CHECKPOINT_DIR_NAME = ".cache_builder"
+
+def load_corpus(laws_path=None):
+    """
+    Rows of the corpus, in the order that defines the shard ranges.
+
+    Args:
+        laws_path (str): CSV with celex_id and optionally title and text columns; the
+                         jonathanli/eurlex dataset (train, test, validation) if None
+
+    Returns:
+        pd.DataFrame: celex_id, title and text columns
+    """
+    if laws_path:
+        laws = pd.read_csv(laws_path, encoding="utf-8", dtype=str)
+    else:
+        import datasets
+
+        dataset = datasets.load_dataset("jonathanli/eurlex")
+        laws = pd.concat([dataset[split].to_pandas() for split in ("train", "test", "validation")],
+                         ignore_index=True)
+
+    for column in ("title", "text"):
+        if column not in laws.columns:
+            laws[column] = None
+    return laws[["celex_id", "title", "text"]].reset_index(drop=True)
+
+
+def shard_ranges(n_rows, start=0, end=None, shard_size=SHARD_SIZE):
+    """
+    Shards overlapping the rows [start, end), aligned on multiples of shard_size.
+
+    Returns:
+        list: (first_row, last_row) tuples, inclusive like the shard file names
+    """
+    end = n_rows if end is None else min(end, n_rows)
+    first = (start // shard_size) * shard_size
+    return [(s, min(s + shard_size, n_rows) - 1) for s in range(first, end, shard_size)]
+
+
+def shard_path(output_dir, shard):
+    return Path(output_dir) / f"cachedLawsTexts_{shard[0]}_{shard[1]}.csv"
+
+
+def checkpoint_path(output_dir, shard):
+    return Path(output_dir) / CHECKPOINT_DIR_NAME / f"{shard[0]}_{shard[1]}.jsonl"
+
+
+def read_checkpoint(path):
+    """Records of the rows already processed, by row number (the last one of a row wins)"""
+    records = {}
+    if not path.exists():
+        return records
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Last line of a run killed mid-write
+                continue
+            records[record["row"]] = record
+    return records
+
+
+def make_scheduler(concurrency, rate, timeout, retries):
+    """
+    Fetch scheduler of a bulk job: unbounded queue and no circuit breaker, every law
+    waits for its turn and failures are recorded per law.
+    """
+    return FetchScheduler(rate=rate, burst=concurrency, max_concurrency=concurrency, max_queue=None, max_wait=None,
+                          timeout=timeout, retries=retries, name="cache_builder")
+
+
+def fetch_html(celex_id, base_url, scheduler, headers=None):
+    """
+    Fetch the HTML of a law through the rate-limited, retrying fetch scheduler.
+
+    Args:
+        headers (dict): Extra request headers, e.g. conditional ones
+
+    Returns:
+        requests.Response: The 200 (or 304 to a conditional request) response
+
+    Raises:
+        FetchError: If the law could not be fetched
+    """
+    response = scheduler.get(base_url + url_encode_celex_id(celex_id), headers={
+        "Accept": "text/html,application/xhtml+xml,application/xml",
+        "Accept-Language": "en",
+        **(headers or {}),
+    })
+    if response.status_code == 200 or (response.status_code == 304 and headers):
+        REGISTRY.increment("cache_builder_fetched_bytes", len(response.content))
+        return response
+    raise FetchError(f"HTTP {response.status_code}")
+
+
+def load_html(celex_id, base_url, scheduler, store=None, refetch=False):
+    """
+    Raw HTML of a law from the raw store, or fetched (and stored) if it is not there.
+
+    Returns:
+        tuple: (raw HTML bytes, True if it was fetched from EUR-Lex)
+    """
+    if store is not None and not refetch:
+        html = store.get_bytes(celex_id)
+        if html is not None:
+            return html, False
+
+    response = fetch_html(celex_id, base_url, scheduler)
+    if store is not None:
+        store.put(celex_id, response.content, **response_validators(response.headers))
+    return response.content, True
+
+
+def revalidate_html(celex_id, base_url, scheduler, store):
+    """
+    Revalidate the stored document of a law with a conditional GET.
+
+    Returns:
+        bytes: The new raw HTML if the document changed (it is stored), None if it did not
+    """
+    entry = store.entry(celex_id)
+    response = fetch_html(celex_id, base_url, scheduler, headers=conditional_headers(entry))
+    validators = response_validators(response.headers)
+    if response.status_code == 304 or hashlib.sha256(response.content).hexdigest() == entry["sha256"]:
+        store.touch(celex_id, **validators)
+        return None
+    store.put(celex_id, response.content, **validators)
+    return response.content
+
+
+def parse_html(html):
+    """Structured JSON of a law as stored in the cache (runs in the parse processes)"""
+    if isinstance(html, bytes):
+        html = html.decode("utf-8")
+    return clean_articles(extract_eu_law_text_json(html))
+
+
+def write_shard(df, path):
+    """Write a shard CSV atomically, readers never see a partial file"""
+    tmp = Path(path).with_suffix(".csv.tmp")
+    df.to_csv(tmp, index=False, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+class _ShardWriter:
+    """Checkpoint of one shard, written to its CSV once every row is processed"""
+
+    def __init__(self, laws, output_dir, shard, records):
+        self.laws = laws
+        self.output_dir = output_dir
+        self.shard = shard
+        self.records = records
+        self.path = checkpoint_path(output_dir, shard)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    @property
+    def complete(self):
+        return len(self.records) == self.shard[1] - self.shard[0] + 1
+
+    def add(self, row, celex_id, structured_json, error, digest=None):
+        record = {"row": row, "celex_id": celex_id, "structured_json": structured_json, "error": error,
+                  "parser_version": PARSER_VERSION if structured_json is not None else None, "sha256": digest}
+        self.records[row] = record
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def finalize(self):
+        """Write the shard CSV atomically and drop the checkpoint"""
+        self._file.close()
+        df = self.laws.iloc[self.shard[0]:self.shard[1] + 1].copy()
+        records = [self.records[row] for row in range(self.shard[0], self.shard[1] + 1)]
+        df["structured_json"] = [record["structured_json"] for record in records]
+        df["parser_version"] = pd.array([record.get("parser_version") for record in records], dtype="Int64")
+        df["sha256"] = [record.get("sha256") for record in records]
+        write_shard(df, shard_path(self.output_dir, self.shard))
+        self.path.unlink()
+
+    def close(self):
+        self._file.close()
+
+
+def shard_records(path, shard):
+    """Records of the rows of a finished shard that have a structured_json, by row number"""
+    df = read_shard(path)
+    return {shard[0] + i: {"row": shard[0] + i, "celex_id": df.at[i, "celex_id"],
+                           "structured_json": df.at[i, "structured_json"], "error": None,
+                           "parser_version": df.at[i, "parser_version"], "sha256": df.at[i, "sha256"]}
+            for i in df.index if not pd.isna(df.at[i, "structured_json"])}
+
+
+def build_cache(laws, output_dir=DATA_DIR, start=0, end=None, base_url=EURLEX_BASE_URL, concurrency=8,
+                rate=4.0, parse_workers=4, timeout=30.0, retries=3, refresh=False, shard_size=SHARD_SIZE,
+                store=None, retry_failed=False):
+    """
+    Fetch, parse and write the shards covering the corpus rows [start, end).
+
+    Args:
+        laws (pd.DataFrame): Corpus rows (celex_id, title, text), see load_corpus
+        output_dir (Path): Directory of the shard CSV files
+        start (int): First corpus row, rounded down to a shard boundary
+        end (int): Corpus row to stop at, rounded up to a shard boundary (None for all)
+        base_url (str): EUR-Lex endpoint the CELEX ids are appended to
+        concurrency (int): Concurrent HTTP requests
+        rate (float): Maximum requests per second (0 for no limit)
+        parse_workers (int): Parse processes (0 to parse in this process)
+        timeout (float): Seconds before an HTTP request is abandoned
+        retries (int): Retries of a failed request
+        refresh (bool): Rebuild the shards that already exist, fetching their laws again
+        shard_size (int): Corpus rows per shard
+        store (RawStore): Raw store the HTML is read from and fetched HTML is added to (None to skip)
+        retry_failed (bool): Fetch again the laws that finished shards hold without
+            structured_json, and rewrite those shards keeping their other rows
+
+    Returns:
+        dict: Counts of written shards, processed laws, laws fetched from EUR-Lex and failures
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Shards to build and the rows of each still to process
+    writers, pending = {}, []
+    for shard in shard_ranges(len(laws), start, end, shard_size):
+        checkpoint = checkpoint_path(output_dir, shard)
+        records = {}
+        if shard_path(output_dir, shard).exists() and not refresh:
+            if not retry_failed:
+                continue
+            records = shard_records(shard_path(output_dir, shard), shard)
+            if len(records) == shard[1] - shard[0] + 1:
+                continue
+        if refresh and checkpoint.exists():
+            checkpoint.unlink()
+        # Failed rows of an interrupted run are not kept: they are fetched again
+        records.update((row, record) for row, record in read_checkpoint(checkpoint).items() if not record["error"])
+        writers[shard] = _ShardWriter(laws, output_dir, shard, records)
+        pending.extend((row, shard) for row in range(shard[0], shard[1] + 1) if row not in writers[shard].records)
+
+    stats = {"shards": 0, "laws": 0, "fetched": 0, "failed": 0}
+    print(f"{len(writers)} shards to build, {len(pending)} laws to fetch")
+
+    # Shards already fully checkpointed by a previous run
+    for shard, writer in list(writers.items()):
+        if writer.complete:
+            writer.finalize()
+            del writers[shard]
+            stats["shards"] += 1
+
+    scheduler = make_scheduler(concurrency, rate, timeout, retries)
+    # HTML documents held in memory at once, fetched or waiting for a parser
+    window = max(concurrency, parse_workers) * 4
+    started = time.monotonic()
+
+    def record(row, shard, structured_json, error, digest=None):
+        writer = writers[shard]
+        writer.add(row, laws.at[row, "celex_id"], structured_json, error, digest)
+        stats["laws"] += 1
+        if error:
+            stats["failed"] += 1
+            print(f"Failed {laws.at[row, 'celex_id']} (row {row}): {error}")
+        if writer.complete:
+            writer.finalize()
+            del writers[shard]
+            stats["shards"] += 1
+        if stats["laws"] % 100 == 0:
+            elapsed = time.monotonic() - started
+            print(f"{stats['laws']}/{len(pending)} laws, {stats['shards']} shards written, "
+                  f"{stats['failed']} failed, {stats['laws'] / elapsed:.1f} laws/s")
+
+    with span("cache_builder.run", laws=len(pending), shards=len(writers)), \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="cache-fetch") as fetchers, \
+            (ProcessPoolExecutor(max_workers=parse_workers) if parse_workers else nullcontext()) as parsers:
+        rows = iter(pending)
+        fetching, parsing = {}, {}
+
+        def fill():
+            while len(fetching) + len(parsing) < window:
+                item = next(rows, None)
+                if item is None:
+                    return
+                celex_id = laws.at[item[0], "celex_id"]
+                fetching[fetchers.submit(load_html, celex_id, base_url, scheduler, store, refresh)] = item
+
+        try:
+            fill()
+            while fetching or parsing:
+                done, _ = wait(list(fetching) + list(parsing), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in fetching:
+                        row, shard = fetching.pop(future)
+                        try:
+                            html, fetched = future.result()
+                            stats["fetched"] += fetched
+                        except Exception as e:
+                            record(row, shard, None, str(e) if isinstance(e, FetchError) else f"{type(e).__name__}: {e}")
+                            continue
+                        # Digest of the document the row is parsed from, as in the raw store
+                        digest = hashlib.sha256(html).hexdigest()
+                        if parsers is not None:
+                            parsing[parsers.submit(parse_html, html)] = (row, shard, digest)
+                            continue
+                        try:
+                            structured_json, error = parse_html(html), None
+                        except Exception as e:
+                            structured_json, error = None, f"Parse error: {type(e).__name__}: {e}"
+                        record(row, shard, structured_json, error, digest)
+                    else:
+                        row, shard, digest = parsing.pop(future)
+                        try:
+                            record(row, shard, future.result(), None, digest)
+                        except Exception as e:
+                            record(row, shard, None, f"Parse error: {type(e).__name__}: {e}")
+                fill()
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+    elapsed = time.monotonic() - started
+    print(f"Done: {stats['laws']} laws in {elapsed:.1f}s ({stats['fetched']} fetched), "
+          f"{stats['shards']} shards written, {stats['failed']} failed")
+    return stats
+
+
+def read_shard(path):
+    """A shard CSV with the parser_version and sha256 columns, which older shards lack"""
+    df = pd.read_csv(path, encoding="utf-8")
+    for column in ("parser_version", "sha256"):
+        if column not in df.columns:
+            df[column] = None
+    df["parser_version"] = df["parser_version"].astype("Int64")
+    df["structured_json"] = df["structured_json"].astype(object)
+    df["sha256"] = df["sha256"].astype(object)
+    return df
+
+
+def reparse_cache(output_dir=DATA_DIR, store=None, parse_workers=4, force=False):
+    """
+    Re-parse the laws of existing shards from the raw store, without any HTTP request.
+
+    A law is re-parsed when its parser_version differs from module_3.PARSER_VERSION or
+    its document in the raw store is not the one it was parsed from (it was revalidated
+    and changed); all of them with force. Laws missing from the raw store are left unchanged.
+
+    Args:
+        output_dir (Path): Directory of the shard CSV files
+        store (RawStore): Raw store holding the HTML
+        parse_workers (int): Parse processes (0 to parse in this process)
+        force (bool): Re-parse every stored law
+
+    Returns:
+        dict: Counts of rewritten shards, re-parsed laws, laws missing from the store and failures
+    """
+    store = store if store is not None else RawStore()
+    stats = {"shards": 0, "laws": 0, "missing": 0, "failed": 0}
+    # HTML documents read from the store and handed to the parsers at once
+    window = max(1, parse_workers) * 4
+    started = time.monotonic()
+
+    with span("cache_builder.reparse"), \
+            (ProcessPoolExecutor(max_workers=parse_workers) if parse_workers else nullcontext()) as parsers:
+        for path in sorted(Path(output_dir).glob("cachedLawsTexts_*.csv")):
+            df = read_shard(path)
+
+            rows, missing = [], 0
+            for i in df.index:
+                entry = store.entry(df.at[i, "celex_id"])
+                outdated = force or df.at[i, "parser_version"] is pd.NA or df.at[i, "parser_version"] != PARSER_VERSION
+                if entry is None:
+                    missing += outdated
+                elif outdated or df.at[i, "sha256"] != entry["sha256"]:
+                    rows.append(i)
+            stats["missing"] += missing
+            if not rows:
+                continue
+
+            for chunk_start in range(0, len(rows), window):
+                chunk = rows[chunk_start:chunk_start + window]
+                entries = [store.entry(df.at[i, "celex_id"]) for i in chunk]
+                htmls = [store.get_bytes(df.at[i, "celex_id"]) for i in chunk]
+                if parsers is not None:
+                    results = [parsers.submit(parse_html, html) for html in htmls]
+                else:
+                    results = htmls
+
+                for i, entry, result in zip(chunk, entries, results):
+                    try:
+                        structured_json = result.result() if parsers is not None else parse_html(result)
+                    except Exception as e:
+                        stats["failed"] += 1
+                        print(f"Failed {df.at[i, 'celex_id']} ({path.name}): {type(e).__name__}: {e}")
+                        continue
+                    df.at[i, "structured_json"] = structured_json
+                    df.at[i, "parser_version"] = PARSER_VERSION
+                    df.at[i, "sha256"] = entry["sha256"]
+                    stats["laws"] += 1
+
+            write_shard(df, path)
+            stats["shards"] += 1
+            print(f"{path.name}: {len(rows)} laws re-parsed")
+
+    elapsed = time.monotonic() - started
+    print(f"Done: {stats['laws']} laws re-parsed in {elapsed:.1f}s, {stats['shards']} shards rewritten, "
+          f"{stats['missing']} not in the raw store, {stats['failed']} failed")
+    return stats
+
+
+def revalidate_cache(output_dir=DATA_DIR, store=None, policy=None, base_url=EURLEX_BASE_URL, concurrency=8,
+                     rate=4.0, parse_workers=4, timeout=30.0, retries=3, force=False):
+    """
+    Revalidate the cached laws past their freshness lifetime and re-parse those that changed.
+
+    Every stored law of the shards that is not fresh (all of them with force) gets a
+    conditional GET with its ETag / Last-Modified validators. A 304 answer only renews its
+    validation time; a changed document is stored and then re-parsed into its shard.
+
+    Args:
+        output_dir (Path): Directory of the shard CSV files
+        store (RawStore): Raw store holding the HTML and the validators
+        policy (FreshnessPolicy): Decides which laws are due (default: from the environment)
+        base_url (str): EUR-Lex endpoint the CELEX ids are appended to
+        concurrency (int): Concurrent HTTP requests
+        rate (float): Maximum requests per second (0 for no limit)
+        parse_workers (int): Parse processes for the changed laws
+        timeout (float): Seconds before an HTTP request is abandoned
+        retries (int): Retries of a failed request
+        force (bool): Revalidate fresh laws too
+
+    Returns:
+        dict: Counts of revalidated, unchanged, changed and failed laws
+    """
+    store = store if store is not None else RawStore()
+    policy = policy if policy is not None else FreshnessPolicy.from_env()
+
+    celex_ids = set()
+    for path in sorted(Path(output_dir).glob("cachedLawsTexts_*.csv")):
+        celex_ids.update(pd.read_csv(path, encoding="utf-8", usecols=["celex_id"])["celex_id"])
+    now = time.time()
+    due = [celex_id for celex_id in sorted(celex_ids)
+           if store.entry(celex_id) is not None
+           and (force or policy.state(store.entry(celex_id), now) != FreshnessPolicy.FRESH)]
+
+    stats = {"revalidated": 0, "unchanged": 0, "changed": 0, "failed": 0}
+    print(f"{len(due)} of {len(celex_ids)} cached laws to revalidate")
+    scheduler = make_scheduler(concurrency, rate, timeout, retries)
+    started = time.monotonic()
+
+    with span("cache_builder.revalidate", laws=len(due)), \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="cache-revalidate") as fetchers:
+        futures = {fetchers.submit(revalidate_html, celex_id, base_url, scheduler, store): celex_id
+                   for celex_id in due}
+        for future in as_completed(futures):
+            try:
+                changed = future.result() is not None
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"Failed {futures[future]}: {e}")
+                continue
+            stats["revalidated"] += 1
+            stats["changed" if changed else "unchanged"] += 1
+
+    print(f"Revalidated {stats['revalidated']} laws in {time.monotonic() - started:.1f}s: "
+          f"{stats['changed']} changed, {stats['unchanged']} unchanged, {stats['failed']} failed")
+
+    if stats["changed"]:
+        reparse_cache(output_dir=output_dir, store=store, parse_workers=parse_workers)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the law cache shards from EUR-Lex.")
+    parser.add_argument("--laws", help="CSV of laws (celex_id, title, text) instead of the EURLEX dataset")
+    parser.add_argument("--output-dir", default=str(DATA_DIR), help="Directory of the shard files (default: src/data)")
+    parser.add_argument("--start", type=int, default=0, help="First corpus row")
+    parser.add_argument("--end", type=int, help="Corpus row to stop at (default: all)")
+    parser.add_argument("--base-url", default=EURLEX_BASE_URL, help="EUR-Lex endpoint (default: EURLEX_BASE_URL)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent HTTP requests (default: 8)")
+    parser.add_argument("--rate", type=float, default=4.0, help="Maximum requests per second, 0 for no limit (default: 4)")
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count() or 1,
+                        help="Parse processes, 0 to parse in the main process (default: CPU count)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="HTTP timeout in seconds (default: 30)")
+    parser.add_argument("--retries", type=int, default=3, help="Retries of a failed request (default: 3)")
+    parser.add_argument("--refresh", action="store_true", help="Rebuild the shards that already exist")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Fetch again the laws of existing shards that have no structured_json")
+    parser.add_argument("--raw-dir", default=str(RAW_STORE_DIR), help="Raw HTML store (default: cache/raw)")
+    parser.add_argument("--no-raw", action="store_true", help="Neither read nor fill the raw HTML store")
+    parser.add_argument("--reparse", action="store_true",
+                        help="Re-parse the laws of existing shards with an outdated parser version from the raw store")
+    parser.add_argument("--revalidate", action="store_true",
+                        help="Revalidate the cached laws past their freshness lifetime with conditional GETs")
+    parser.add_argument("--max-age-days", type=float,
+                        help="Days a law stays fresh (default: LEGALQA_CACHE_MAX_AGE_DAYS or 30)")
+    parser.add_argument("--force", action="store_true",
+                        help="With --reparse or --revalidate, process every stored law")
+    args = parser.parse_args(argv)
+
+    store = None if args.no_raw else RawStore(args.raw_dir)
+    if args.reparse:
+        stats = reparse_cache(output_dir=args.output_dir, store=store or RawStore(args.raw_dir),
+                              parse_workers=args.parse_workers, force=args.force)
+        return 1 if stats["failed"] else 0
+
+    if args.revalidate:
+        policy = FreshnessPolicy.from_env()
+        if args.max_age_days is not None:
+            policy.max_age = args.max_age_days * DAY
+        stats = revalidate_cache(output_dir=args.output_dir, store=store or RawStore(args.raw_dir), policy=policy,
+                                 base_url=args.base_url, concurrency=args.concurrency, rate=args.rate,
+                                 parse_workers=args.parse_workers, timeout=args.timeout, retries=args.retries,
+                                 force=args.force)
+        return 1 if stats["failed"] else 0
+
+    laws = load_corpus(args.laws)
+    stats = build_cache(laws, output_dir=args.output_dir, start=args.start, end=args.end, base_url=args.base_url,
+                        concurrency=args.concurrency, rate=args.rate, parse_workers=args.parse_workers,
+                        timeout=args.timeout, retries=args.retries, refresh=args.refresh, store=store,
+                        retry_failed=args.retry_failed)
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
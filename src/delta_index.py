@@ -0,0 +1,228 @@
+"""
+Laws added after the main BM25 indices were built, searchable within seconds.
+
+Added laws are appended as JSON lines {"celex_id", "title", "text", "eurovoc_concepts"}
+to cache/indices/delta/laws.jsonl (LEGALQA_DELTA_DIR), by a serving process or by
+
+    python -m src.delta_index add new_laws.jsonl
+
+Every process polls the log (at most every LEGALQA_DELTA_POLL_SECONDS) and indexes the
+text and title of the laws not yet merged into the main indices in small in-memory BM25
+indices, which module 2 searches alongside the main ones and fuses with them. Once
+LEGALQA_DELTA_MERGE_LAWS laws are pending, module 2 rebuilds the main indices with them
+in the background (a new generation of the indices), swaps them in and records in
+state.json how many laws of the log the main indices hold, which empties the delta.
+
+    python -m src.delta_index compact     # merge the pending laws now
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from src.utils.bm25 import BM25Index
+from src.utils.shards import LocalIndex
+
+DELTA_DIR = Path(os.environ.get("LEGALQA_DELTA_DIR", "cache/indices/delta"))
+
+# Seconds between two checks of the log for laws added by other processes
+DELTA_POLL_SECONDS = float(os.environ.get("LEGALQA_DELTA_POLL_SECONDS", 1))
+
+# Pending laws starting a background merge into the main indices, 0 to merge only on demand
+DELTA_MERGE_LAWS = int(os.environ.get("LEGALQA_DELTA_MERGE_LAWS", 1000))
+
+# A merge lock older than this is left by a process that died while merging
+COMPACTION_LOCK_STALE_SECONDS = 6 * 3600
+
+FIELDS = ("celex_id", "title", "text", "eurovoc_concepts")
+
+
+def _law_record(law):
+    """A law as a log record, checked to have an id and a text"""
+    record = {field: law.get(field) for field in FIELDS}
+    if not record["celex_id"] or not record["text"]:
+        raise ValueError(f"A law needs a celex_id and a text: {str(law)[:200]}")
+    record["celex_id"] = str(record["celex_id"])
+    concepts = record["eurovoc_concepts"]
+    record["eurovoc_concepts"] = [str(c) for c in concepts] if concepts is not None else []
+    return record
+
+
+class DeltaIndex:
+    """
+    Log of the added laws and BM25 indices of the ones not merged into the main indices.
+
+    Args:
+        directory (Path): Directory of laws.jsonl and state.json
+        poll_seconds (float): Minimum seconds between two reads of the log by refresh
+    """
+
+    def __init__(self, directory=DELTA_DIR, poll_seconds=DELTA_POLL_SECONDS):
+        self.directory = Path(directory)
+        self.log_path = self.directory / "laws.jsonl"
+        self.state_path = self.directory / "state.json"
+        self.lock_path = self.directory / "compact.lock"
+        self.poll_seconds = poll_seconds
+        self.laws = []
+        self.merged = 0
+        self.generation = 0
+        self.text = None
+        self.title = None
+        self._offset = 0
+        self._polled = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, laws):
+        """
+        Append laws to the log. They are searchable once refresh has read them.
+
+        Args:
+            laws (list): Dicts with celex_id, text and optionally title and eurovoc_concepts
+
+        Returns:
+            int: Laws added
+        """
+        lines = "".join(json.dumps(_law_record(law)) + "\n" for law in laws)
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(lines)
+        self._polled = 0.0
+        return len(laws)
+
+    def _read_state(self):
+        if not self.state_path.exists():
+            return 0, 0
+        state = json.loads(self.state_path.read_text(encoding="utf-8"))
+        return state["merged"], state["generation"]
+
+    def _read_new_laws(self):
+        """Complete lines appended to the log since the last read"""
+        if not self.log_path.exists() or self.log_path.stat().st_size <= self._offset:
+            return []
+        with open(self.log_path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+        # A line being written by another process is read on the next poll
+        end = data.rfind(b"\n") + 1
+        self._offset += end
+        laws = []
+        for line in data[:end].decode("utf-8").splitlines():
+            try:
+                laws.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Line of a process killed mid-write
+                continue
+        return laws
+
+    def _rebuild(self):
+        """Index the text and title of the pending laws, the last version of a law kept"""
+        pending = {law["celex_id"]: law for law in self.laws[self.merged:]}.values()
+        if not pending:
+            self.text = self.title = None
+            return
+        self.text = LocalIndex(BM25Index.build((law["celex_id"], [law["text"]]) for law in pending))
+        self.title = LocalIndex(BM25Index.build((law["celex_id"], [law["title"]]) for law in pending))
+
+    def refresh(self, force=False):
+        """
+        Read the laws added to the log and the merges done since the last call, by this
+        process or another one, and reindex the pending laws if they changed.
+
+        Args:
+            force (bool): Read the log even if it was read less than poll_seconds ago
+
+        Returns:
+            list: The laws read from the log
+        """
+        now = time.monotonic()
+        if not force and now - self._polled < self.poll_seconds:
+            return []
+        with self._lock:
+            self._polled = now
+            # The state first: the laws it counts as merged were in the log before it was written
+            merged, generation = self._read_state()
+            new_laws = self._read_new_laws()
+            self.laws.extend(new_laws)
+            if new_laws or (merged, generation) != (self.merged, self.generation):
+                self.merged, self.generation = merged, generation
+                self._rebuild()
+        return new_laws
+
+    def pending(self):
+        """Laws of the log not merged into the main indices"""
+        return len(self.laws) - self.merged
+
+    def mark_merged(self, merged, generation):
+        """Record that the main indices of a generation hold the first merged laws of the log"""
+        with self._lock:
+            tmp = self.state_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"merged": merged, "generation": generation}), encoding="utf-8")
+            tmp.replace(self.state_path)
+            self.merged, self.generation = merged, generation
+            self._rebuild()
+
+    def lock_compaction(self):
+        """Take the merge lock shared by the processes, False if another merge holds it"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        try:
+            if time.time() - self.lock_path.stat().st_mtime > COMPACTION_LOCK_STALE_SECONDS:
+                self.lock_path.unlink()
+        except FileNotFoundError:
+            pass
+        try:
+            fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        return True
+
+    def unlock_compaction(self):
+        try:
+            self.lock_path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def read_laws(path):
+    """Laws of a JSONL or CSV file (celex_id, title, text and optionally eurovoc_concepts)"""
+    path = Path(path)
+    if path.suffix == ".csv":
+        df = pd.read_csv(path, encoding="utf-8")
+        if "eurovoc_concepts" in df.columns:
+            df["eurovoc_concepts"] = df["eurovoc_concepts"].fillna("").str.split()
+        return df.to_dict(orient="records")
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Add laws to the BM25 indices without rebuilding them.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="Append laws to the delta log")
+    add.add_argument("path", help="JSONL or CSV of laws (celex_id, title, text, eurovoc_concepts)")
+    commands.add_parser("compact", help="Merge the pending laws into new main indices")
+    args = parser.parse_args(argv)
+
+    if args.command == "add":
+        added = DeltaIndex().add(read_laws(args.path))
+        print(f"Added {added} laws to {DELTA_DIR / 'laws.jsonl'}")
+        return 0
+
+    from src import module_2
+
+    module_2.initialize()
+    if not module_2.compact():
+        print("A merge is already running")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""
+Compact in-memory model of the laws passed between the pipeline stages.
+
+The structured JSON of a law (nested dicts, one per article) is converted once by module
+3 into a Law holding tuples of Section records. Both use __slots__, and the CELEX ids,
+section ids and titles (a few hundred distinct "Article N" / "ANNEX" strings shared by
+every law) are interned. Module 4 scores the sections and returns Match records pointing
+at them, and module 5 reads their text from there: the section texts are never copied
+or serialized between the stages.
+"""
+import sys
+import json
+
+# Section kinds of a law, in document order
+SECTION_KINDS = ("articles", "annexes", "appendices")
+
+# Fields of a law besides its sections, kept as they are
+LAW_FIELDS = ("header", "title", "preamble")
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Section:
+    """
+    An article, annex or appendix of a law.
+
+    Args:
+        celex_id (str): CELEX id of the law
+        kind (str): One of SECTION_KINDS
+        id (str): Id of the section in the law ("3", "anx_1", ...)
+        title (str): Title, e.g. "Article 3"
+        text (str): Full text of the section
+        subtitle (str): Subtitle of an article, if any
+        type (str): "annex" or "appendix" for the annex-like sections, if given
+    """
+
+    __slots__ = ("celex_id", "kind", "id", "title", "text", "subtitle", "type")
+
+    def __init__(self, celex_id, kind, id=None, title=None, text=None, subtitle=None, type=None):
+        self.celex_id = _intern(celex_id)
+        self.kind = kind
+        self.id = _intern(id)
+        self.title = _intern(title)
+        self.text = text
+        self.subtitle = _intern(subtitle)
+        self.type = _intern(type)
+
+    @classmethod
+    def from_json(cls, celex_id, kind, data):
+        return cls(celex_id, kind, id=None if data.get("id") is None else str(data["id"]), title=data.get("title"),
+                   text=data.get("text"), subtitle=data.get("subtitle"), type=data.get("type"))
+
+    def to_json(self):
+        """The section as a structured JSON dict"""
+        data = {}
+        for field in ("id", "type", "title", "subtitle", "text"):
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = value
+        return data
+
+    def __repr__(self):
+        return f"Section({self.celex_id!r}, {self.kind!r}, id={self.id!r})"
+
+
+class Law:
+    """
+    A parsed law: its header fields and its sections.
+
+    Args:
+        celex_id (str): CELEX id of the law
+        title (str): Title of the document
+        header (dict): Header table of the modern format
+        preamble (str): Preamble text
+        articles (tuple): Article sections
+        annexes (tuple): Annex sections
+        appendices (tuple): Appendix sections
+        partial (bool): Whether the law is only its dataset text (EUR-Lex was unavailable)
+    """
+
+    __slots__ = ("celex_id", "header", "title", "preamble", "articles", "annexes", "appendices", "partial")
+
+    def __init__(self, celex_id, title=None, header=None, preamble=None, articles=(), annexes=(), appendices=(),
+                 partial=False):
+        self.celex_id = _intern(celex_id)
+        self.title = title
+        self.header = header
+        self.preamble = preamble
+        self.articles = tuple(articles)
+        self.annexes = tuple(annexes)
+        self.appendices = tuple(appendices)
+        self.partial = partial
+
+    @classmethod
+    def from_json(cls, celex_id, structured_json):
+        """
+        Build a law from its structured JSON.
+
+        Args:
+            celex_id (str): CELEX id of the law
+            structured_json (dict): Output of extract_eu_law_text_json (cleaned), or None
+
+        Returns:
+            Law: The law, or None if there is no structured JSON
+        """
+        if isinstance(structured_json, Law):
+            return structured_json
+        if not isinstance(structured_json, dict):
+            return None
+        celex_id = _intern(str(celex_id))
+        sections = {
+            kind: tuple(Section.from_json(celex_id, kind, data) for data in structured_json.get(kind) or ()
+                        if isinstance(data, dict))
+            for kind in SECTION_KINDS
+        }
+        return cls(celex_id, partial=bool(structured_json.get("partial")),
+                   **{field: structured_json.get(field) for field in LAW_FIELDS}, **sections)
+
+    def to_json(self):
+        """The law as structured JSON, in the format of the cache shards"""
+        data = {field: getattr(self, field) for field in LAW_FIELDS if getattr(self, field) is not None}
+        for kind in SECTION_KINDS:
+            sections = getattr(self, kind)
+            if sections:
+                data[kind] = [section.to_json() for section in sections]
+        if self.partial:
+            data["partial"] = True
+        return data
+
+    def sections(self, kinds=SECTION_KINDS):
+        """The sections of the given kinds, in document order"""
+        for kind in kinds:
+            yield from getattr(self, kind)
+
+    def __repr__(self):
+        return f"Law({self.celex_id!r}, articles={len(self.articles)}, annexes={len(self.annexes)})"
+
+
+class Match:
+    """
+    A section of a law scored against a query, referencing the section.
+
+    Args:
+        section (Section): The matching section
+        score (float): Relevance to the query, the matches of a query are ranked by it
+        dense (float): Cosine similarity with the query, if the score fuses several signals
+        lexical (float): Normalized BM25 score, if the score fuses several signals
+    """
+
+    __slots__ = ("section", "score", "dense", "lexical")
+
+    def __init__(self, section, score, dense=None, lexical=None):
+        self.section = section
+        self.score = score
+        self.dense = dense
+        self.lexical = lexical
+
+    @property
+    def celex_id(self):
+        return self.section.celex_id
+
+    @property
+    def text(self):
+        return self.section.text
+
+    def to_json(self):
+        data = {**self.section.to_json(), "score": self.score}
+        for field in ("dense", "lexical"):
+            if getattr(self, field) is not None:
+                data[field] = getattr(self, field)
+        return data
+
+    def __repr__(self):
+        return f"Match({self.section!r}, score={self.score:.3f})"
+
+
+def matches_to_json(matches):
+    """Matches of a law in the former filtered_json format: {"articles": [...], "annexes": [...]}"""
+    data = {"articles": [], "annexes": []}
+    for match in matches:
+        data.setdefault(match.section.kind, []).append(match.to_json())
+    return data
+
+
+def matches_from_json(celex_id, filtered_json):
+    """Matches of a law from the filtered_json format (a dict or its JSON string)"""
+    if isinstance(filtered_json, str):
+        filtered_json = json.loads(filtered_json)
+    matches = []
+    for kind, elements in filtered_json.items():
+        if kind not in SECTION_KINDS:
+            continue
+        for data in elements or ():
+            matches.append(Match(Section.from_json(celex_id, kind, data), float(data.get("score", 0)),
+                                 dense=data.get("dense"), lexical=data.get("lexical")))
+    return matches
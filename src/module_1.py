@@ -1,12 +1,13 @@
 import os
 from pathlib import Path
-from openai import OpenAI
 from dotenv import load_dotenv
+from src.utils.tracing import span
 
 load_dotenv()
 
 PROMPT_PATH = Path(__file__).parent / "prompts/prompt_1.txt"
 MODEL = os.environ.get("OPENROUTER_MODEL", "qwen/qwen3-30b-a3b:free")
+BASE_URL = os.environ.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
 
 def load_prompt_template(path):
     with open(path, "r", encoding="utf-8") as f:
@@ -19,22 +20,28 @@ def fill_prompt(template, variables):
         raise ValueError(f"Missing variable for prompt: {e}")
 
 def call_openrouter_llm(prompt, api_key, model=MODEL):
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=api_key,
-    )
-    completion = client.chat.completions.create(
-        extra_headers={},
-        extra_body={},
-        model=model,
-        messages=[
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ]
-    )
-    return completion.choices[0].message.content
+    with span("module_1.llm_call", model=model, prompt_chars=len(prompt)) as s:
+        from openai import OpenAI
+
+        client = OpenAI(
+            base_url=BASE_URL,
+            api_key=api_key,
+        )
+        completion = client.chat.completions.create(
+            extra_headers={},
+            extra_body={},
+            model=model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ]
+        )
+        if completion.usage is not None:
+            s.set_attributes(prompt_tokens=completion.usage.prompt_tokens,
+                             completion_tokens=completion.usage.completion_tokens)
+        return completion.choices[0].message.content
 
 def run_module_1(promptInput, API_KEY=None):
     try:
@@ -47,4 +54,4 @@ def run_module_1(promptInput, API_KEY=None):
     
     except Exception as e:
         print(f"Error: {e}")
-        exit(1)
\ No newline at end of file
+        raise
\ No newline at end of file
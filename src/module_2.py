@@ -1,8 +1,30 @@
+import os
 import re
-import datasets
+import shutil
+import threading
+import numpy as np
 import pandas as pd
-import pyterrier as pt
 from pathlib import Path
+from src.utils.bitmap import Bitmap, BitmapIndex, to_array
+from src.utils.celex import CelexMetadata, FILTERS
+from src.utils.shards import ShardedIndex, LawRetriever, build_shards, read_manifest
+from src.utils.residency import RESIDENCY, check_policy, open_terrier_index
+from src.delta_index import DeltaIndex, DELTA_MERGE_LAWS, FIELDS
+from src.utils.tracing import span
+
+# Restricting to concepts having at most this many laws scores only those laws,
+# larger sets are intersected with the full retrieval
+CONCEPT_SCAN_LIMIT = int(os.environ.get("LEGALQA_CONCEPT_SCAN_LIMIT", 5000))
+
+# Factor applied to the fused score of the laws having a concept, in boost mode
+CONCEPT_BOOST = float(os.environ.get("LEGALQA_CONCEPT_BOOST", 1.5))
+
+CONCEPT_MODES = ("restrict", "boost")
+
+# Shards of the text and title indices, served by local worker processes (0: one Terrier index each)
+SHARDS = int(os.environ.get("LEGALQA_SHARDS", 0))
+SHARD_PARTITION = os.environ.get("LEGALQA_SHARD_PARTITION", "hash")
+SHARD_DIR = Path(os.environ.get("LEGALQA_SHARD_DIR", "cache/indices/shards"))
 
 # Global variables for lazy initialization
 _pd_ds = None
@@ -12,18 +34,44 @@ _bm25_text = None
 _bm25_title = None
 _initialized = False
 _index_ref_title = None
+_concept_index = None
+_ordinals = None
+_celex_metadata = None
+
+# Laws added since the main indices were built: rows of _pd_ds after the dataset's
+_delta = None
+_delta_retrievers = []
+_dataset_rows = 0
+_main_rows = 0
+_generation = 0
+
+# Serializes the JVM calls of concurrent requests
+_search_lock = threading.Lock()
+
+# Serializes the reads of the delta log and the swaps of the indices
+_delta_lock = threading.Lock()
+
+# Held while the delta is merged into a new generation of the main indices
+_compaction_lock = threading.Lock()
 
 def _initialize():
     """Initialize the retrieval system (called once)"""
-    global _dataset, _pd_ds, _index_ref, _index_ref_title, _bm25_text, _bm25_title, _initialized
-    
     if _initialized:
         return
-    
-    # Initialize PyTerrier if not already done
-    if not pt.started():
-        pt.init()
-    
+
+    with span("module_2.initialize"):
+        _build_indices()
+
+def _build_indices():
+    """Load the EURLEX dataset and the added laws, and open (or build) the BM25 indices"""
+    global _dataset, _pd_ds, _bm25_text, _bm25_title, _initialized, _concept_index, _ordinals, _celex_metadata, \
+        _delta, _delta_retrievers, _dataset_rows, _main_rows, _generation
+
+    check_policy(RESIDENCY)
+
+    # Imported here: datasets pulls in pyarrow
+    import datasets
+
     # Load dataset
     _dataset = datasets.load_dataset("jonathanli/eurlex")
     
@@ -33,40 +81,214 @@ def _initialize():
     ds3 = _dataset['validation'].to_pandas()
     ds4 = pd.concat([ds1, ds2], axis=0)
     _pd_ds = pd.concat([ds4, ds3], axis=0)
+    _dataset_rows = len(_pd_ds)
+
+    # Laws added after the dataset, merged into the main indices or not
+    _delta = DeltaIndex()
+    _delta.refresh(force=True)
+    if _delta.laws:
+        _pd_ds = pd.concat([_pd_ds, pd.DataFrame(_delta.laws, columns=list(FIELDS))], ignore_index=True)
+
+    # EuroVoc concept -> bitmap of the laws, by their position in the dataset
+    with span("module_2.concept_index"):
+        _concept_index = BitmapIndex.build(_pd_ds['eurovoc_concepts'])
+        _ordinals = {celex_id: i for i, celex_id in enumerate(_pd_ds['celex_id'])}
+
+    # Sector, year and document type of every law, from its CELEX id
+    with span("module_2.celex_metadata"):
+        _celex_metadata = CelexMetadata.build(_pd_ds['celex_id'])
+
+    _main_rows = _dataset_rows + _delta.merged
+    _generation = _delta.generation
+    _bm25_text, _bm25_title = _open_indices(_pd_ds.iloc[:_main_rows], _generation)
+    _delta_retrievers = _delta_retrievers_of(_delta)
+    _remove_old_generations(_generation)
     
+    _initialized = True
+
+def _open_indices(corpus, generation):
+    """
+    Open (or build) the text and title BM25 indices of a generation of the corpus: the
+    dataset and the first laws of the delta log. Their files are brought into memory
+    following the LEGALQA_INDEX_RESIDENCY policy.
+
+    Returns:
+        tuple: (text retriever, title retriever)
+    """
+    text_dir, title_dir = _index_dirs(generation)
+    if SHARDS > 0:
+        return (LawRetriever(_open_shards(corpus, text_dir, 'text')),
+                LawRetriever(_open_shards(corpus, title_dir, 'title')))
+
+    # Imported here: pyterrier starts a JVM
+    import pyterrier as pt
+
+    # Initialize PyTerrier if not already done
+    if not pt.started():
+        pt.init()
+
     # Create index for dataset text
-    cache_dir = Path("cache/")
-    index_dir = cache_dir / "indices" / "eur_lex"
+    index_dir = text_dir
     
-    pd_ds_rename = _pd_ds.rename(columns={'celex_id': 'docno'}, inplace=False)
+    pd_ds_rename = corpus.rename(columns={'celex_id': 'docno'}, inplace=False)
     pd_ds_dict = pd_ds_rename.to_dict(orient='records')
     
     try:
-        _index_ref = pt.IndexFactory.of(str(index_dir.absolute()))
+        index_ref = open_terrier_index(pt, index_dir, RESIDENCY)
     except:
         indexer = pt.index.IterDictIndexer(str(index_dir.absolute()))
-        _index_ref = indexer.index(pd_ds_dict)
+        indexer.index(pd_ds_dict)
+        index_ref = open_terrier_index(pt, index_dir, RESIDENCY)
         
     # Create index for dataset titles
-    index_dir2 = cache_dir / "indices" / "eur_lex_titles"
+    index_dir2 = title_dir
     
-    pd_ds_rename_title = _pd_ds.rename(columns={'celex_id': 'docno', 'text':'not_text', 'title':'text'}, inplace=False)
+    pd_ds_rename_title = corpus.rename(columns={'celex_id': 'docno', 'text':'not_text', 'title':'text'}, inplace=False)
     pd_ds_dict_title = pd_ds_rename_title.to_dict(orient='records')
     
     try:
-        _index_ref_title = pt.IndexFactory.of(str(index_dir2.absolute()))
+        index_ref_title = open_terrier_index(pt, index_dir2, RESIDENCY)
     except:
         indexer_title = pt.index.IterDictIndexer(str(index_dir2.absolute()))
-        _index_ref_title = indexer_title.index(pd_ds_dict_title)
+        indexer_title.index(pd_ds_dict_title)
+        index_ref_title = open_terrier_index(pt, index_dir2, RESIDENCY)
     
     # BM25 IR models for text and title of dataset documents
-    _bm25_text = pt.terrier.Retriever(_index_ref, wmodel="BM25")
-    _bm25_title = pt.terrier.Retriever(_index_ref_title, wmodel="BM25")
-    
-    _initialized = True
+    return pt.terrier.Retriever(index_ref, wmodel="BM25"), pt.terrier.Retriever(index_ref_title, wmodel="BM25")
+
+def _index_dirs(generation):
+    """Directories of the text and title indices of a generation (no suffix for the first)"""
+    suffix = f".{generation}" if generation else ""
+    if SHARDS > 0:
+        return SHARD_DIR / f"text{suffix}", SHARD_DIR / f"title{suffix}"
+    return Path("cache/indices") / f"eur_lex{suffix}", Path("cache/indices") / f"eur_lex_titles{suffix}"
+
+def _remove_old_generations(generation):
+    """
+    Delete the indices of the generations before the previous one. The previous one may
+    still be searched by processes that have not read the last merge yet; the older ones
+    are not, since a process opens the generation of state.json before searching.
+    """
+    for old in range(generation - 1):
+        for directory in _index_dirs(old):
+            if directory.exists():
+                shutil.rmtree(directory, ignore_errors=True)
+                print(f"Removed {directory}, replaced by generation {generation}")
+
+def _open_shards(corpus, root, column):
+    """Open the shards of a column of the corpus, built first if missing or partitioned otherwise"""
+    manifest = read_manifest(root)
+    if manifest is None or (manifest['n_shards'], manifest['partition']) != (SHARDS, SHARD_PARTITION):
+        with span("module_2.build_shards", column=column, shards=SHARDS):
+            build_shards(zip(corpus['celex_id'], corpus[column]), root, SHARDS, SHARD_PARTITION)
+    return ShardedIndex(root, residency=RESIDENCY)
+
+def _delta_retrievers_of(delta):
+    """Text and title retrievers of the laws pending in the delta, none if there are none"""
+    if delta.text is None:
+        return []
+    return [LawRetriever(delta.text), LawRetriever(delta.title)]
+
+def _swap_indices(text, title, main_rows, generation):
+    """Search new main indices from now on, with the delta of the laws they do not hold"""
+    global _bm25_text, _bm25_title, _delta_retrievers, _main_rows, _generation
+    with _search_lock:
+        previous = (_bm25_text, _bm25_title)
+        _bm25_text, _bm25_title = text, title
+        _delta_retrievers = _delta_retrievers_of(_delta)
+        _main_rows, _generation = main_rows, generation
+    for retriever in previous:
+        # Stop the worker processes of replaced shards
+        if isinstance(retriever, LawRetriever) and isinstance(retriever.index, ShardedIndex):
+            retriever.index.close()
+    _remove_old_generations(generation)
+
+def _append_laws(laws):
+    """Make laws read from the delta log known to the metadata lookups, by position after the others"""
+    global _pd_ds, _concept_index, _ordinals, _celex_metadata
+    added = pd.DataFrame(laws, columns=list(FIELDS))
+    start = len(_pd_ds)
+    _pd_ds = pd.concat([_pd_ds, added], ignore_index=True)
+    _concept_index = _concept_index.extended(added['eurovoc_concepts'])
+    _celex_metadata = CelexMetadata.build(_pd_ds['celex_id'])
+    # Last: a law found by a query is in the tables above by then
+    _ordinals = {**_ordinals, **{celex_id: start + i for i, celex_id in enumerate(added['celex_id'])}}
+
+def _refresh_delta(force=False):
+    """
+    Pick up the laws added to the delta log and the merges done by other processes, and
+    start a merge in the background once DELTA_MERGE_LAWS laws are pending.
+    """
+    global _delta_retrievers
+    with _delta_lock:
+        new_laws = _delta.refresh(force)
+        if new_laws:
+            with span("module_2.delta_refresh", laws=len(new_laws)):
+                _append_laws(new_laws)
+        if _delta.generation != _generation:
+            # Another process merged the delta: open its indices
+            with span("module_2.open_generation", generation=_delta.generation):
+                text, title = _open_indices(_pd_ds.iloc[:_dataset_rows + _delta.merged], _delta.generation)
+            _swap_indices(text, title, _dataset_rows + _delta.merged, _delta.generation)
+        elif new_laws:
+            with _search_lock:
+                _delta_retrievers = _delta_retrievers_of(_delta)
+        pending = _delta.pending()
+
+    if DELTA_MERGE_LAWS and pending >= DELTA_MERGE_LAWS and not _compaction_lock.locked():
+        threading.Thread(target=compact, name="module_2-compact", daemon=True).start()
 
-def _rrf(dfs, i=1, K=100):
-    """RRF - Reciprocal Rank Fusion"""
+def add_laws(laws):
+    """
+    Add laws to the retrieval without rebuilding the main indices: they are written to
+    the delta log and searchable by every process within DELTA_POLL_SECONDS.
+
+    Args:
+        laws (list): Dicts with celex_id, text and optionally title and eurovoc_concepts
+
+    Returns:
+        int: Laws added
+    """
+    _initialize()
+    added = _delta.add(laws)
+    _refresh_delta(force=True)
+    return added
+
+def compact():
+    """
+    Merge the pending laws of the delta log into a new generation of the main indices,
+    built while the current ones keep serving, then swapped in.
+
+    Returns:
+        bool: False if a merge is already running, in this process or another one
+    """
+    _initialize()
+    if not _compaction_lock.acquire(blocking=False):
+        return False
+    try:
+        if not _delta.lock_compaction():
+            return False
+        try:
+            _refresh_delta(force=True)
+            with _delta_lock:
+                merged, generation = len(_delta.laws), _delta.generation + 1
+                corpus = _pd_ds.iloc[:_dataset_rows + merged]
+            if merged == _delta.merged:
+                return True
+            with span("module_2.compact", laws=merged - _delta.merged, generation=generation):
+                text, title = _open_indices(corpus, generation)
+            with _delta_lock:
+                _delta.mark_merged(merged, generation)
+                _swap_indices(text, title, _dataset_rows + merged, generation)
+            print(f"Merged {merged} added laws into generation {generation} of the BM25 indices")
+            return True
+        finally:
+            _delta.unlock_compaction()
+    finally:
+        _compaction_lock.release()
+
+def _rrf(dfs, i=1, K=100, boosted=(), boost=1.0):
+    """RRF - Reciprocal Rank Fusion, the scores of the boosted docnos multiplied by boost"""
     scores = {}
     for df in dfs:
         for _, row in df.iterrows():
@@ -76,9 +298,13 @@ def _rrf(dfs, i=1, K=100):
                 scores[docno] += rrf_score
             else:
                 scores[docno] = rrf_score
+    for docno in boosted:
+        if docno in scores:
+            scores[docno] *= boost
     
     merged_df = pd.DataFrame(
-        [{"qid": '1', "docno": k, "score": v} for k, v in sorted(scores.items(), key=lambda item: item[1], reverse=True)]
+        [{"qid": '1', "docno": k, "score": v} for k, v in sorted(scores.items(), key=lambda item: item[1], reverse=True)],
+        columns=["qid", "docno", "score"]
     )
     merged_df["rank"] = list(range(len(merged_df)))
     if K > len(merged_df):
@@ -86,39 +312,34 @@ def _rrf(dfs, i=1, K=100):
         
     return merged_df[:K]
 
-def _get_text(row):
-    return list(_pd_ds[_pd_ds['celex_id'] == row['docno']]['text'])[0]
+def _ordinal_array(docnos):
+    """Positions of docnos in the dataset, -1 for unknown ones"""
+    return np.fromiter((_ordinals.get(docno, -1) for docno in docnos), dtype=np.int64, count=len(docnos))
 
-def _get_title(row):
-    return list(_pd_ds[_pd_ds['celex_id'] == row['docno']]['title'])[0]
+def _attach_metadata(results):
+    """Title, text and EuroVoc concepts of the retrieved laws, read by position"""
+    ordinals = _ordinal_array(results['docno'])
+    found = ordinals >= 0
+    for column in ('title', 'text', 'eurovoc_concepts'):
+        values = np.full(len(results), None, dtype=object)
+        values[found] = _pd_ds[column].to_numpy()[ordinals[found]]
+        results[column] = values
 
-def _get_eurovoc_concepts(row):
-    return list(_pd_ds[_pd_ds['celex_id'] == row['docno']]['eurovoc_concepts'])[0]
+def initialize():
+    """Load the dataset and the BM25 indices ahead of the first query"""
+    _initialize()
 
-def run_module_2(user_prompt, K=0.5):
+def _clean_query(user_prompt):
+    return re.sub(r'[^A-Za-z0-9\s]', '', user_prompt)
+
+def _select_laws(rankings, K, top_n=10, boosted=()):
     """
-    Main function to retrieve documents based on user prompt with a score threshold.
-    
-    Args:
-        user_prompt (str): The query string from the user
-        K (float): The minimum score threshold to include documents (default: 0.5)
-    
-    Returns:
-        pandas.DataFrame: DataFrame with results containing celex_id, score, title, text, and eurovoc_concepts
-        At least 2 laws will be returned regardless of threshold.
+    Fuse the text and title rankings of one query (of the main indices, then of the added
+    laws), apply the threshold and attach metadata
     """
-    # Initialize if not already done
-    _initialize()
-    
-    # Clean the query
-    re_query = re.sub(r'[^A-Za-z0-9\s]', '', user_prompt)
-    
-    # Retrieve documents from both text and title indices
-    retr_text = _bm25_text.search(re_query)
-    retr_title = _bm25_title.search(re_query)
-    
     # Apply RRF to combine results (get more results to ensure proper filtering)
-    all_results = _rrf([retr_text, retr_title], K=10)
+    with span("module_2.rrf"):
+        all_results = _rrf(rankings, K=top_n, boosted=boosted, boost=CONCEPT_BOOST)
     
     # Filter by score threshold
     filtered_results = all_results[all_results['score'] >= K]
@@ -126,14 +347,162 @@ def run_module_2(user_prompt, K=0.5):
     # Ensure at least 2 laws are returned
     if len(filtered_results) < 2:
         filtered_results = all_results.head(2)
+    filtered_results = filtered_results.copy()
     
     # Add metadata columns
-    filtered_results['title'] = filtered_results.apply(_get_title, axis=1, raw=False)
-    filtered_results['text'] = filtered_results.apply(_get_text, axis=1, raw=False)
-    filtered_results['eurovoc_concepts'] = filtered_results.apply(_get_eurovoc_concepts, axis=1, raw=False)
+    if filtered_results.empty:
+        return pd.DataFrame(columns=['celex_id', 'score', 'title', 'text', 'eurovoc_concepts']), []
+    with span("module_2.attach_metadata", laws=len(filtered_results)):
+        _attach_metadata(filtered_results)
     
     # Rename and select final columns
     filtered_results.rename(columns={'docno': 'celex_id'}, inplace=True)
     filtered_results = filtered_results[['celex_id', 'score', 'title', 'text', 'eurovoc_concepts']]
     
     return filtered_results, filtered_results['title'].tolist()
+
+def concept_laws(concepts):
+    """
+    Laws having at least one of a set of EuroVoc concepts.
+
+    Args:
+        concepts (list): EuroVoc concept ids, as in the eurovoc_concepts column
+
+    Returns:
+        Bitmap: Positions of the laws in the dataset
+    """
+    _initialize()
+    return _concept_index.any(concepts)
+
+def _apply_filters(retrieved, filters):
+    """Rows of a ranking whose law passes the CELEX metadata filters"""
+    if not filters or retrieved.empty:
+        return retrieved
+    return retrieved[_celex_metadata.mask(_ordinal_array(retrieved['docno']), **filters)]
+
+def _in_bitmap(docnos, bitmap):
+    """Whether each docno is a law of the bitmap"""
+    ordinals = (_ordinals.get(docno) for docno in docnos)
+    return [ordinal is not None and ordinal in bitmap for ordinal in ordinals]
+
+def _empty_ranking():
+    return pd.DataFrame(columns=['qid', 'docid', 'docno', 'rank', 'score', 'query'])
+
+def _score_candidates(retrievers, queries, docnos):
+    """Rankings of the given laws by every retriever, without the laws having no query term"""
+    if not len(docnos):
+        return [_empty_ranking() for _ in retrievers]
+    candidates = queries.merge(pd.DataFrame({'docno': docnos}), how='cross')
+    rankings = [retriever.transform(candidates) for retriever in retrievers]
+    return [ranking[ranking['score'] > 0] for ranking in rankings]
+
+def _retrieve(queries, allowed=None):
+    """
+    Text and title BM25 rankings of the queries, restricted to the allowed laws if given,
+    then the text and title rankings of the added laws not merged into the main indices.
+
+    Small allowed sets are scored directly (Terrier re-ranks the given docnos, reading
+    only their postings); larger ones filter the full rankings.
+    """
+    if allowed is not None and len(allowed) == 0:
+        return [_empty_ranking(), _empty_ranking()]
+
+    with _search_lock:
+        main, delta = [_bm25_text, _bm25_title], list(_delta_retrievers)
+        if allowed is not None and len(allowed) <= CONCEPT_SCAN_LIMIT:
+            ordinals = to_array(allowed)
+            docnos = _pd_ds['celex_id'].to_numpy()
+            rankings = _score_candidates(main, queries, docnos[ordinals[ordinals < _main_rows]])
+            if delta:
+                rankings += _score_candidates(delta, queries, docnos[ordinals[ordinals >= _main_rows]])
+            return rankings
+        rankings = [retriever.transform(queries) for retriever in main + delta]
+
+    if allowed is not None:
+        rankings = [ranking[_in_bitmap(ranking['docno'], allowed)] for ranking in rankings]
+    return rankings
+
+def run_module_2_batch(user_prompts, K=0.5, top_n=10, concepts=None, concept_mode="restrict", filters=None):
+    """
+    Retrieve documents for several prompts with a single BM25 pass per index.
+    
+    Args:
+        user_prompts (list): The query strings
+        K (float): The minimum score threshold to include documents (default: 0.5)
+        top_n (int): Laws of the fused ranking the threshold is applied to (default: 10)
+        concepts (list): EuroVoc concept ids the laws should have (at least one of them)
+        concept_mode (str): "restrict" to retrieve only laws having a concept, "boost" to
+            multiply their fused score by CONCEPT_BOOST (default: "restrict")
+        filters (dict): CELEX metadata filters, e.g. {"doc_type": "R", "year": (2010, None)},
+            see CelexMetadata.mask. Laws not passing them are dropped from the rankings.
+    
+    Returns:
+        list: One (DataFrame, titles) tuple per prompt, see run_module_2
+    """
+    if concept_mode not in CONCEPT_MODES:
+        raise ValueError(f"concept_mode must be one of {CONCEPT_MODES}, got {concept_mode!r}")
+    filters = {key: value for key, value in (filters or {}).items() if value is not None}
+    unknown = set(filters) - set(FILTERS)
+    if unknown:
+        raise ValueError(f"Unknown filters {sorted(unknown)}, expected some of {FILTERS}")
+
+    # Initialize if not already done
+    _initialize()
+
+    # Laws added since the last query, by this process or another one
+    _refresh_delta()
+    
+    # Clean the queries
+    queries = pd.DataFrame({
+        'qid': [str(i) for i in range(len(user_prompts))],
+        'query': [_clean_query(p) for p in user_prompts],
+    })
+
+    # Laws having one of the concepts, as a bitmap
+    allowed = None
+    if concepts:
+        with span("module_2.concepts", concepts=len(concepts)) as s:
+            allowed = _concept_index.any(concepts)
+            if filters and concept_mode == "restrict":
+                # Only the laws passing the filters are scored
+                ordinals = to_array(allowed)
+                allowed = Bitmap(ordinals[_celex_metadata.mask(ordinals, **filters)].tolist())
+            s.set_attributes(laws=len(allowed))
+    
+    # Retrieve documents from both text and title indices
+    with span("module_2.bm25_search", queries=len(queries), query_chars=int(queries['query'].str.len().sum())) as s:
+        rankings = _retrieve(queries, allowed if concept_mode == "restrict" else None)
+        s.set_attributes(text_hits=len(rankings[0]), title_hits=len(rankings[1]),
+                         delta_hits=sum(len(ranking) for ranking in rankings[2:]))
+
+    if filters:
+        with span("module_2.filters", **{key: str(value) for key, value in filters.items()}) as s:
+            rankings = [_apply_filters(ranking, filters) for ranking in rankings]
+            s.set_attributes(text_hits=len(rankings[0]), title_hits=len(rankings[1]))
+    
+    results = []
+    for qid in queries['qid']:
+        query_rankings = [ranking[ranking['qid'] == qid] for ranking in rankings]
+        boosted = ()
+        if allowed is not None and concept_mode == "boost":
+            docnos = set().union(*(ranking['docno'] for ranking in query_rankings))
+            boosted = [docno for docno, hit in zip(docnos, _in_bitmap(docnos, allowed)) if hit]
+        results.append(_select_laws(query_rankings, K, top_n, boosted))
+    return results
+
+def run_module_2(user_prompt, K=0.5, concepts=None, concept_mode="restrict", filters=None):
+    """
+    Main function to retrieve documents based on user prompt with a score threshold.
+    
+    Args:
+        user_prompt (str): The query string from the user
+        K (float): The minimum score threshold to include documents (default: 0.5)
+        concepts (list): EuroVoc concept ids to restrict or boost the retrieval to
+        concept_mode (str): "restrict" or "boost", see run_module_2_batch
+        filters (dict): CELEX metadata filters (sector, year, doc_type), see run_module_2_batch
+    
+    Returns:
+        pandas.DataFrame: DataFrame with results containing celex_id, score, title, text, and eurovoc_concepts
+        At least 2 laws will be returned regardless of threshold.
+    """
+    return run_module_2_batch([user_prompt], K=K, concepts=concepts, concept_mode=concept_mode, filters=filters)[0]
@@ -2,11 +2,97 @@ import os
 import re
 import ast
 import json
+import queue
+import hashlib
+import threading
 import requests
 import pandas as pd
 import urllib.parse
-from anyio import Path
-from bs4 import BeautifulSoup
+from pathlib import Path
+from lxml import etree
+from src.documents import Law
+from src.raw_store import get_raw_store, FreshnessPolicy, conditional_headers, response_validators
+from src.utils.fetch import FetchScheduler, CircuitBreaker, FetchError
+from src.utils.singleflight import SingleFlight
+from src.utils.tracing import span, increment_attribute
+from src.utils.utils import approximate_size
+
+# Where the law HTML is fetched from, overridable to point at a local stand-in
+EURLEX_BASE_URL = os.environ.get("EURLEX_BASE_URL", "http://publications.europa.eu/resource/celex/")
+
+# Version of the structured_json produced by extract_eu_law_text_json + clean_articles,
+# stored with every cached law. Bump it whenever their output changes, then re-parse the
+# cache from the raw store with `python -m src.cache_builder --reparse`.
+PARSER_VERSION = 1
+
+# When a cached law is served as is, served while revalidated in the background, or
+# revalidated before being served
+FRESHNESS = FreshnessPolicy.from_env()
+
+# Shared EUR-Lex client of this process
+_fetch_scheduler = None
+
+def get_fetch_scheduler():
+    """
+    Create the EUR-Lex fetch scheduler once per process and reuse it afterwards.
+    
+    Configured with LEGALQA_EURLEX_RATE (requests/s), LEGALQA_EURLEX_CONCURRENCY,
+    LEGALQA_EURLEX_MAX_QUEUE, LEGALQA_EURLEX_TIMEOUT (s) and LEGALQA_EURLEX_RETRIES; the
+    circuit opens after LEGALQA_EURLEX_BREAKER_FAILURES consecutive failures for
+    LEGALQA_EURLEX_BREAKER_RESET seconds.
+    """
+    global _fetch_scheduler
+    if _fetch_scheduler is None:
+        env = os.environ.get
+        _fetch_scheduler = FetchScheduler(
+            rate=float(env("LEGALQA_EURLEX_RATE", 5)),
+            burst=int(env("LEGALQA_EURLEX_CONCURRENCY", 4)),
+            max_concurrency=int(env("LEGALQA_EURLEX_CONCURRENCY", 4)),
+            max_queue=int(env("LEGALQA_EURLEX_MAX_QUEUE", 32)),
+            max_wait=float(env("LEGALQA_EURLEX_TIMEOUT", 20)),
+            timeout=float(env("LEGALQA_EURLEX_TIMEOUT", 20)),
+            retries=int(env("LEGALQA_EURLEX_RETRIES", 2)),
+            breaker=CircuitBreaker(failure_threshold=int(env("LEGALQA_EURLEX_BREAKER_FAILURES", 5)),
+                                   reset_timeout=float(env("LEGALQA_EURLEX_BREAKER_RESET", 30)),
+                                   name="eurlex"),
+            name="eurlex",
+        )
+    return _fetch_scheduler
+
+def fetch_celex(celex_id: str, headers: dict = None) -> requests.Response:
+    """Request the document of a (URL encoded) CELEX ID from EUR-Lex.
+
+    Parameters
+    ----------
+    celex_id : str
+        The CELEX ID to request.
+    headers : dict
+        Extra request headers, e.g. conditional ones.
+
+    Returns
+    -------
+    requests.Response
+        The response of EUR-Lex.
+
+    Raises
+    ------
+    FetchError
+        If EUR-Lex could not be reached, or the fetch scheduler failed fast.
+    """
+    url = EURLEX_BASE_URL + str(
+        celex_id
+    )  # pragma: no cover
+    with span("module_3.http_fetch", celex_id=celex_id) as s:
+        response = get_fetch_scheduler().get(
+            url,
+            headers={  # pragma: no cover
+                "Accept": "text/html,application/xhtml+xml,application/xml",  # pragma: no cover
+                "Accept-Language": "en",  # pragma: no cover
+                **(headers or {}),
+            },
+        )  # pragma: no cover
+        s.set_attributes(status=response.status_code, bytes=len(response.content))
+    return response  # pragma: no cover
 
 def get_html_by_celex_id(celex_id: str) -> str:
     """Retrieve HTML by CELEX ID.
@@ -21,19 +107,7 @@ def get_html_by_celex_id(celex_id: str) -> str:
     str
         HTML found using the CELEX ID.
     """
-    url = "http://publications.europa.eu/resource/celex/" + str(
-        celex_id
-    )  # pragma: no cover
-    response = requests.get(
-        url,
-        allow_redirects=True,
-        headers={  # pragma: no cover
-            "Accept": "text/html,application/xhtml+xml,application/xml",  # pragma: no cover
-            "Accept-Language": "en",  # pragma: no cover
-        },
-    )  # pragma: no cover
-    html = response.content.decode("utf-8")  # pragma: no cover
-    return html  # pragma: no cover
+    return fetch_celex(celex_id).content.decode("utf-8")  # pragma: no cover
 
 def url_encode_celex_id(celex_id):
     """
@@ -57,6 +131,8 @@ def extract_eu_law_text(html_content):
     Returns:
         str: Clean, structured text with titles, articles, and appendices
     """
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html_content, 'html.parser')
     
     # Remove unwanted elements
@@ -404,16 +480,31 @@ def parse_legacy_format(soup, texte_only_div):
     regulation_title = strong_element.get_text(strip=True) if strong_element else None
     
     # Get all paragraphs within TexteOnly
-    paragraphs = texte_only_div.find_all('p')
+    paragraphs = [p.get_text(strip=True) for p in texte_only_div.find_all('p')]
     
-    # Parse the content
+    return build_legacy_document(title, regulation_title, paragraphs)
+
+def build_legacy_document(title, regulation_title, paragraphs):
+    """
+    Group the paragraph texts of a legacy (TexteOnly) document into articles and annexes.
+    
+    Args:
+        title (str): Text of the first h1 of the page
+        regulation_title (str): Text of the first strong element of the page
+        paragraphs (list): Text of every paragraph inside the TexteOnly div
+        
+    Returns:
+        dict: Document with title, articles and annexes
+    """
+    # Parse the content, collecting the paragraphs of the open section to join them once
     articles = []
     annexes = []
     current_article = None
     current_annex = None
+    open_section = None
+    open_parts = []
     
-    for p in paragraphs:
-        text = p.get_text(strip=True)
+    for text in paragraphs:
         
         if not text:
             continue
@@ -432,6 +523,9 @@ def parse_legacy_format(soup, texte_only_div):
                     "title": text,
                     "text": text
                 }
+                if open_section:
+                    open_section["text"] = "\n\n".join(open_parts)
+                open_section, open_parts = current_article, [text]
             current_annex = None
             
         # Check if this is an annex
@@ -454,14 +548,17 @@ def parse_legacy_format(soup, texte_only_div):
                     "title": text,
                     "text": text
                 }
+                if open_section:
+                    open_section["text"] = "\n\n".join(open_parts)
+                open_section, open_parts = current_annex, [text]
             
         # Add content to current article or annex
-        elif current_article:
-            current_article["text"] += "\n\n" + text
-        elif current_annex:
-            current_annex["text"] += "\n\n" + text
+        elif current_article or current_annex:
+            open_parts.append(text)
     
     # Don't forget the last article/annex
+    if open_section:
+        open_section["text"] = "\n\n".join(open_parts)
     if current_article:
         articles.append(current_article)
     if current_annex:
@@ -476,6 +573,55 @@ def parse_legacy_format(soup, texte_only_div):
     
     return document_data
 
+# Legacy section headers, and the tokens that end a section's content
+_LEGACY_ARTICLE_HEADER = re.compile(r'Article (\d+)\s*\n')
+_LEGACY_ARTICLE_BOUNDARY = re.compile(r'Article \d|ANNEX')
+_LEGACY_ANNEX_HEADER = re.compile(r'ANNEX ([IVX]+)\s*\n')
+_LEGACY_ANNEX_BOUNDARY = re.compile(r'ANNEX [IVX]')
+
+def _segment_sections(full_text, header, boundary):
+    """
+    Split a text into (number, content) sections.
+    
+    A section starts at a header and its content runs to the next boundary token. Every
+    header starts with a boundary token, so the headers can be found in one pass and each
+    content end with one forward search: this is what re.findall does with
+    header(.*?)(?=boundary|$), without a lookahead attempt at every character.
+    """
+    sections = []
+    for match in header.finditer(full_text):
+        end = boundary.search(full_text, match.end())
+        sections.append((match.group(1), full_text[match.end():end.start() if end else len(full_text)]))
+    return sections
+
+def segment_legacy_text(full_text):
+    """
+    Split the text of a legacy (TexteOnly) document into articles and annexes in linear time.
+    
+    An article runs from an "Article N" line to the next "Article N" or "ANNEX" occurrence;
+    an annex runs from an "ANNEX <roman>" line to the next "ANNEX <roman>" occurrence.
+    
+    Args:
+        full_text (str): Text of the TexteOnly div, one text node per line
+        
+    Returns:
+        tuple: (articles, annexes) lists of dictionaries
+    """
+    articles = [{
+        "id": article_num,
+        "title": f"Article {article_num}",
+        "text": f"Article {article_num}\n\n{article_content.strip()}"
+    } for article_num, article_content in _segment_sections(full_text, _LEGACY_ARTICLE_HEADER, _LEGACY_ARTICLE_BOUNDARY)]
+    
+    annexes = [{
+        "id": f"anx_{annex_num}",
+        "type": "annex",
+        "title": f"ANNEX {annex_num}",
+        "text": f"ANNEX {annex_num}\n\n{annex_content.strip()}"
+    } for annex_num, annex_content in _segment_sections(full_text, _LEGACY_ANNEX_HEADER, _LEGACY_ANNEX_BOUNDARY)]
+    
+    return articles, annexes
+
 def parse_legacy_format_enhanced(soup, texte_only_div):
     """
     Enhanced parser for older EUR-Lex HTML format with better content detection.
@@ -491,31 +637,7 @@ def parse_legacy_format_enhanced(soup, texte_only_div):
     full_text = texte_only_div.get_text(separator='\n', strip=True)
     
     # Split by known patterns
-    articles = []
-    annexes = []
-    
-    # Find all article sections
-    article_pattern = r'Article (\d+)\s*\n(.*?)(?=Article \d+|ANNEX|$)'
-    article_matches = re.findall(article_pattern, full_text, re.DOTALL)
-    
-    for article_num, article_content in article_matches:
-        articles.append({
-            "id": article_num,
-            "title": f"Article {article_num}",
-            "text": f"Article {article_num}\n\n{article_content.strip()}"
-        })
-    
-    # Find all annex sections
-    annex_pattern = r'ANNEX ([IVX]+)\s*\n(.*?)(?=ANNEX [IVX]+|$)'
-    annex_matches = re.findall(annex_pattern, full_text, re.DOTALL)
-    
-    for annex_num, annex_content in annex_matches:
-        annexes.append({
-            "id": f"anx_{annex_num}",
-            "type": "annex",
-            "title": f"ANNEX {annex_num}",
-            "text": f"ANNEX {annex_num}\n\n{annex_content.strip()}"
-        })
+    articles, annexes = segment_legacy_text(full_text)
     
     # Build the document structure
     document_data = {
@@ -526,11 +648,16 @@ def parse_legacy_format_enhanced(soup, texte_only_div):
     
     return document_data
 
-def extract_eu_law_text_json(html_content):
+def extract_eu_law_text_json_bs4(html_content):
     """
     Extract clean, structured data from EU legal document HTML.
     Handles both modern and legacy HTML formats.
+    
+    Reference BeautifulSoup implementation of extract_eu_law_text_json, kept to check
+    the output parity of the lxml parser.
     """
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html_content, 'html.parser')
     
     # Remove unwanted elements
@@ -558,6 +685,187 @@ def extract_eu_law_text_json(html_content):
     # Remove None values
     return {k: v for k, v in document_data.items() if v is not None}
 
+# Elements removed before extracting text, as in extract_eu_law_text_json_bs4
+_REMOVED_TAGS = ('script', 'style', 'link', 'meta', 'hr')
+_ARTICLE_ID = re.compile(r'art_\d+')
+_RECITAL_ID = re.compile(r'rct_\d+')
+_HTML_PARSER = etree.HTMLParser(encoding='utf-8')
+
+def _strings(element):
+    """Stripped, non-empty text nodes of an element (BeautifulSoup's get_text strings)"""
+    return [text for text in (t.strip() for t in element.itertext()) if text]
+
+def _text(element, separator=''):
+    return separator.join(_strings(element))
+
+def _has_class(element, class_name):
+    return class_name in element.get('class', '').split()
+
+def _find(element, tag=None, class_name=None):
+    """First descendant matching the tag and class, like BeautifulSoup's find"""
+    for descendant in element.iterdescendants(tag):
+        if isinstance(descendant.tag, str) and (class_name is None or _has_class(descendant, class_name)):
+            return descendant
+    return None
+
+def _header_info_lxml(header_table):
+    header_text = []
+    for row in header_table.iterdescendants('tr'):
+        cells = [_text(cell) for cell in row.iterdescendants('td')]
+        row_text = ' | '.join(cell for cell in cells if cell)
+        if row_text:
+            header_text.append(row_text)
+    return '\n'.join(header_text) if header_text else None
+
+def _main_title_lxml(main_title):
+    title_text = [text for text in (_text(p) for p in main_title.iterdescendants('p')) if text]
+    return '\n'.join(title_text) if title_text else None
+
+def _preamble_lxml(preamble_section):
+    preamble_text = ["PREAMBLE"]
+
+    # "THE EUROPEAN COMMISSION" and "Having regard to" sections
+    for p in preamble_section:
+        if p.tag == 'p' and _has_class(p, 'oj-normal'):
+            text = _text(p)
+            if text:
+                preamble_text.append(text)
+
+    # "Whereas" clauses (recitals)
+    whereas_clauses = [div for div in preamble_section.iterdescendants('div') if _RECITAL_ID.search(div.get('id', ''))]
+    if whereas_clauses:
+        preamble_text.append("\nWHEREAS:")
+        for clause in whereas_clauses:
+            table = _find(clause, 'table')
+            if table is None:
+                continue
+            for row in table.iterdescendants('tr'):
+                cells = list(row.iterdescendants('td'))
+                if len(cells) >= 2:
+                    number = _text(cells[0])
+                    content = _text(cells[1])
+                    if number and content:
+                        preamble_text.append(f"({number}) {content}")
+
+    return '\n\n'.join(preamble_text)
+
+def _article_lxml(article):
+    article_data = {}
+
+    article_id = article.get('id', '').replace('art_', '')
+    if article_id:
+        article_data['id'] = article_id
+
+    article_title = _find(article, class_name='oj-ti-art')
+    if article_title is not None:
+        article_data['title'] = _text(article_title)
+
+    article_subtitle = _find(article, class_name='oj-sti-art')
+    if article_subtitle is not None:
+        article_data['subtitle'] = _text(article_subtitle)
+
+    article_data['text'] = _text(article, '\n')
+    return article_data
+
+def _annex_lxml(annex, annex_id, annex_type):
+    annex_data = {
+        "id": annex_id,
+        "type": annex_type
+    }
+
+    annex_title = _find(annex, 'p', 'oj-doc-ti')
+    if annex_title is not None:
+        annex_data['title'] = _text(annex_title)
+
+    annex_data['text'] = _text(annex, '\n')
+    return [annex_data]
+
+def extract_eu_law_text_json(html_content):
+    """
+    Extract clean, structured data from EU legal document HTML.
+    Handles both modern and legacy HTML formats.
+    
+    The document is parsed with lxml and walked once to locate the header table, main
+    title, preamble, articles, annex, appendix and legacy TexteOnly elements. The output
+    is the same as extract_eu_law_text_json_bs4's.
+    
+    Args:
+        html_content (str): Raw HTML content of the EU law document
+        
+    Returns:
+        dict: Structured document (header, title, preamble, articles, annexes, appendices
+              for the modern format; title, articles, annexes for the legacy one)
+    """
+    try:
+        data = html_content.encode('utf-8') if isinstance(html_content, str) else html_content
+        root = etree.fromstring(data, _HTML_PARSER) if data.strip() else None
+    except (etree.ParserError, ValueError):
+        root = None
+    if root is None:
+        # Empty or unparsable document, let BeautifulSoup decide what is left
+        return extract_eu_law_text_json_bs4(html_content)
+
+    # Remove unwanted elements (their tail text is kept), and template contents which
+    # BeautifulSoup leaves out of get_text
+    etree.strip_elements(root, *_REMOVED_TAGS, 'template', with_tail=False)
+
+    header_table = main_title = preamble_section = annex = appendix = None
+    texte_only_div = h1 = strong = None
+    articles = []
+
+    # Single walk over the document to find every element of interest
+    for element in root.iter():
+        tag = element.tag
+        if not isinstance(tag, str):
+            continue
+
+        if tag == 'div':
+            element_id = element.get('id')
+            if element_id is not None:
+                if _ARTICLE_ID.search(element_id):
+                    articles.append(element)
+                if preamble_section is None and element_id == 'pbl_1':
+                    preamble_section = element
+                elif annex is None and element_id == 'anx_1':
+                    annex = element
+                elif appendix is None and element_id == 'anx_1.app_1':
+                    appendix = element
+                elif texte_only_div is None and element_id == 'TexteOnly':
+                    texte_only_div = element
+        elif tag == 'table':
+            if header_table is None and element.get('width') == '100%':
+                header_table = element
+        elif tag == 'h1':
+            if h1 is None:
+                h1 = element
+        elif tag == 'strong':
+            if strong is None:
+                strong = element
+
+        if main_title is None and 'class' in element.attrib and _has_class(element, 'eli-main-title'):
+            main_title = element
+
+    # Check if this is the modern format or legacy format
+    if articles or texte_only_div is None:
+        document_data = {
+            "header": _header_info_lxml(header_table) if header_table is not None else None,
+            "title": _main_title_lxml(main_title) if main_title is not None else None,
+            "preamble": _preamble_lxml(preamble_section) if preamble_section is not None else None,
+            "articles": [_article_lxml(article) for article in articles] or None,
+            "annexes": _annex_lxml(annex, "anx_1", "annex") if annex is not None else None,
+            "appendices": _annex_lxml(appendix, "anx_1.app_1", "appendix") if appendix is not None else None
+        }
+    else:
+        # Use legacy parsing for older HTML format
+        document_data = build_legacy_document(
+            _text(h1) if h1 is not None else None,
+            _text(strong) if strong is not None else None,
+            [_text(p) for p in texte_only_div.iterdescendants('p')]
+        )
+
+    # Remove None values
+    return {k: v for k, v in document_data.items() if v is not None}
+
 def load_cache():
 
     #Read all the cached laws CSV files from the data directory
@@ -570,37 +878,173 @@ def load_cache():
     # Read the cached laws CSV files into dataframes
     df_cache = pd.DataFrame()
 
-    for cache_file in cacheFiles:
-        file_path = path / cache_file
-        df_temp = pd.read_csv(file_path, encoding='utf-8')
-        df_cache = pd.concat([df_cache, df_temp], ignore_index=True)
+    with span("module_3.cache_load", files=len(cacheFiles)) as s:
+        for cache_file in cacheFiles:
+            file_path = path / cache_file
+            df_temp = pd.read_csv(file_path, encoding='utf-8')
+            df_cache = pd.concat([df_cache, df_temp], ignore_index=True)
+        s.set_attribute("rows", len(df_cache))
 
     return df_cache
 
-def getFullText(dfToGet, dfCache):
+def cache_fingerprint():
+    """Digest of the names, sizes and modification times of the cache shards, changing with any of them"""
+    path = Path(__file__).parent / "data"
+    digest = hashlib.sha256()
+    for name in sorted(f for f in os.listdir(path) if f.startswith('cachedLawsTexts_') and f.endswith('.csv')):
+        stat = os.stat(path / name)
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+# Law cache loaded in this process
+_df_cache = None
+
+def get_cache():
+    """Load the law cache once per process and reuse it afterwards"""
+    global _df_cache
+    if _df_cache is None:
+        _df_cache = load_cache()
+    return _df_cache
+
+# Parsed Law of the most requested laws, filled by preload_laws at startup
+_preloaded_laws = {}
+
+def preload_laws(celex_ids, memory_budget):
+    """
+    Parse the cached structured JSON of laws ahead of their first query.
+    
+    Laws are taken in order until the next one would exceed the memory budget. Cache hits
+    of preloaded laws skip parsing the CSV text and share the same Law.
+    
+    Args:
+        celex_ids (list): CELEX IDs, the most wanted first
+        memory_budget (int): Bytes the parsed laws may take
+        
+    Returns:
+        dict: CELEX ID -> Law of the preloaded laws
+    """
+    dfCache = get_cache()
+    cached = dfCache.drop_duplicates('celex_id').set_index('celex_id')['structured_json']
+    loaded, used = {}, 0
+    with span("module_3.preload", laws=len(celex_ids), preloaded=0, bytes=0) as s:
+        for celex_id in celex_ids:
+            data = cached.get(celex_id)
+            if not isinstance(data, str):
+                continue
+            try:
+                law = Law.from_json(celex_id, clean_articles(ast.literal_eval(data)))
+            except (ValueError, SyntaxError):
+                continue
+            size = approximate_size(law)
+            if used + size > memory_budget:
+                break
+            loaded[celex_id] = law
+            used += size
+        _preloaded_laws.update(loaded)
+        s.set_attributes(preloaded=len(loaded), bytes=used)
+    return loaded
+
+# Fetch and parse of the laws missing from the cache, by CELEX id
+_fetch_flight = SingleFlight(name="module_3_fetch")
+
+def fetch_law(celex_id, title=None, text=None, fetch=True):
+    """
+    Fetch a law that is not cached (from the raw store if it was fetched before) and parse it.
+
+    Args:
+        celex_id (str): CELEX id of the law
+        title (str): Dataset title, used if EUR-Lex is unavailable
+        text (str): Dataset text, used if EUR-Lex is unavailable
+        fetch (bool): Whether to fetch the law from EUR-Lex if it is not in the raw store
+
+    Returns:
+        Law: The parsed law, or a partial one made of its dataset text
+    """
+    # Get the HTML content, from the raw store if it was fetched before
+    raw_store = get_raw_store()
+    html = raw_store.get(celex_id)
+    if html is None and not fetch:
+        # No time for a live fetch
+        increment_attribute("cached_only_fallbacks")
+        return Law.from_json(celex_id, partial_document(title, text))
+    if html is None:
+        try:
+            response = fetch_celex(url_encode_celex_id(celex_id))
+        except FetchError as e:
+            # EUR-Lex is unavailable: fall back to the text of the dataset
+            print(f"Fetching {celex_id} failed, using the dataset text: {e}")
+            increment_attribute("fetch_fallbacks")
+            return Law.from_json(celex_id, partial_document(title, text))
+        html = response.content.decode("utf-8")
+        if response.status_code == 200:
+            raw_store.put(celex_id, response.content, **response_validators(response.headers))
+    else:
+        increment_attribute("raw_store_hits")
+    
+    # Extract structured JSON
+    with span("module_3.parse", celex_id=celex_id, html_chars=len(html)) as s:
+        structured_json = extract_eu_law_text_json(html)
+        s.set_attribute("articles", len(structured_json.get('articles') or []))
+    
+    # A Law is shared read-only by the callers waiting for it
+    return Law.from_json(celex_id, clean_articles(structured_json))
+
+def getFullText(dfToGet, dfCache, cached_only=False):
 
     for i, row in dfToGet.iterrows():
         #Get the CELEX ID
         celex_id = row['celex_id']
 
         # If the CELEX ID is not in the cache
-        if row['structured_json'] is None or \
-        dfCache[dfCache['celex_id'] == celex_id].empty or \
+        if dfCache[dfCache['celex_id'] == celex_id].empty or \
         dfCache[dfCache['celex_id'] == celex_id]['structured_json'].isnull().all() or \
         dfCache[dfCache['celex_id'] == celex_id]['structured_json'].isna().all() or \
         dfCache[dfCache['celex_id'] == celex_id]['structured_json'].apply(lambda x: x == {}).all():
                         
-            encoded_celex_id = url_encode_celex_id(celex_id)
+            increment_attribute("cache_misses")
+            
+            # Fetched and parsed once for all the queries missing the law at the same time
+            law, shared = _fetch_flight.do((celex_id, not cached_only), fetch_law, celex_id, row.get('title'),
+                                           row.get('text'), fetch=not cached_only)
+            if shared:
+                increment_attribute("fetches_shared")
+            dfToGet.at[i, 'structured_json'] = law
+        else:
+            increment_attribute("cache_hits")
             
-            # Get the HTML content
-            html = get_html_by_celex_id(encoded_celex_id)
+            # Revalidate the law if it is past its freshness lifetime
+            entry = get_raw_store().entry(celex_id)
+            state = FRESHNESS.state(entry)
+            if state == FreshnessPolicy.STALE:
+                increment_attribute("stale_hits")
+                schedule_revalidation(celex_id)
+            elif state == FreshnessPolicy.EXPIRED and cached_only:
+                # No time to revalidate: serve the expired copy and refresh it in the background
+                increment_attribute("expired_hits")
+                schedule_revalidation(celex_id)
+            elif state == FreshnessPolicy.EXPIRED:
+                increment_attribute("expired_hits")
+                try:
+                    structured_json = revalidate_law(celex_id)
+                except FetchError as e:
+                    # Serve the expired copy rather than nothing
+                    print(f"Revalidation of {celex_id} failed: {e}")
+                    structured_json = None
+                if structured_json is not None:
+                    dfToGet.at[i, 'structured_json'] = update_cached_law(celex_id, structured_json)
+                    continue
             
-            # Extract structured JSON
-            structured_json = extract_eu_law_text_json(html)
+            revalidated = get_revalidated_law(celex_id, dfCache, entry, cached_only)
+            if revalidated is not None:
+                dfToGet.at[i, 'structured_json'] = revalidated
+                continue
+            
+            preloaded = _preloaded_laws.get(celex_id)
+            if preloaded is not None:
+                increment_attribute("preloaded_hits")
+                dfToGet.at[i, 'structured_json'] = preloaded
+                continue
             
-            # Store JSON
-            dfToGet.at[i, 'structured_json'] = structured_json
-        else:
             try:
                 cacheJson = dfCache[dfCache['celex_id'] == celex_id]['structured_json'].values[0]
 
@@ -620,6 +1064,147 @@ def getFullText(dfToGet, dfCache):
 
     return dfToGet
 
+def partial_document(title, text):
+    """
+    Structured JSON made of the dataset text of a law (its title and recitals), served
+    when the full document cannot be fetched.
+    
+    Args:
+        title (str): Title of the law
+        text (str): Text of the law in the EURLEX dataset
+        
+    Returns:
+        dict: Document with the text as its only section, flagged as partial, or None
+    """
+    if not isinstance(text, str) or not text.strip():
+        return None
+    return {
+        "title": title,
+        "articles": [{"id": "text", "title": title, "text": text}],
+        "partial": True
+    }
+
+def revalidate_law(celex_id):
+    """
+    Revalidate the stored document of a law with a conditional GET.
+    
+    A 304 answer (or an identical document) only renews the validation time in the raw
+    store; a changed document is stored and parsed.
+    
+    Args:
+        celex_id (str): CELEX ID of the law
+        
+    Returns:
+        dict: The new structured JSON of the law if its document changed, otherwise None
+    """
+    raw_store = get_raw_store()
+    entry = raw_store.entry(celex_id)
+    
+    with span("module_3.revalidate", celex_id=celex_id, changed=False) as s:
+        response = fetch_celex(url_encode_celex_id(celex_id), headers=conditional_headers(entry))
+        validators = response_validators(response.headers)
+        
+        if response.status_code == 304:
+            raw_store.touch(celex_id, **validators)
+            return None
+        if response.status_code != 200:
+            print(f"Revalidation of {celex_id} answered HTTP {response.status_code}")
+            return None
+        if entry is not None and hashlib.sha256(response.content).hexdigest() == entry["sha256"]:
+            # The server ignored the conditional headers
+            raw_store.touch(celex_id, **validators)
+            return None
+        
+        raw_store.put(celex_id, response.content, **validators)
+        s.set_attribute("changed", True)
+        return clean_articles(extract_eu_law_text_json(response.content.decode("utf-8")))
+
+# Laws whose document changed since the cache shards were written, parsed from the raw
+# store. The shards are left as they are: they are rewritten by `cache_builder --reparse`.
+_revalidated_laws = {}
+_revalidated_lock = threading.Lock()
+
+def update_cached_law(celex_id, structured_json):
+    """
+    Serve the new structured JSON of a law instead of its cached copy.
+    
+    The Law is swapped in whole, so requests reading it concurrently see either version.
+    
+    Returns:
+        Law: The law
+    """
+    law = Law.from_json(celex_id, structured_json)
+    with _revalidated_lock:
+        _revalidated_laws[celex_id] = law
+        if celex_id in _preloaded_laws:
+            _preloaded_laws[celex_id] = law
+    return law
+
+def get_revalidated_law(celex_id, dfCache, entry, cached_only=False):
+    """
+    The law if its document changed since the cache shards were written, otherwise None.
+    
+    The raw store keeps the document of a revalidation (in this process or an earlier
+    one) and the shards the digest of the document each law was parsed from: a law whose
+    digests differ is parsed again from the raw store, once per process. Rows of shards
+    older than the digest column are served as cached until `cache_builder --reparse`.
+    
+    Args:
+        celex_id (str): CELEX ID of the law
+        dfCache (pd.DataFrame): Loaded law cache
+        entry (dict): Raw store entry of the law, or None
+        cached_only (bool): Whether live fetches are forbidden
+        
+    Returns:
+        Law: The law parsed from its current document, or None
+    """
+    with _revalidated_lock:
+        law = _revalidated_laws.get(celex_id)
+    if law is not None or entry is None or 'sha256' not in dfCache.columns:
+        return law
+    digest = dfCache.loc[dfCache['celex_id'] == celex_id, 'sha256'].values[0]
+    if not isinstance(digest, str) or digest == entry["sha256"]:
+        return None
+    increment_attribute("revalidated_reparses")
+    law, _ = _fetch_flight.do((celex_id, not cached_only), fetch_law, celex_id, fetch=not cached_only)
+    if law is None or law.partial:
+        # The stored document could not be read: serve the cached copy
+        return None
+    with _revalidated_lock:
+        return _revalidated_laws.setdefault(celex_id, law)
+
+# Laws waiting for a background revalidation, drained by one daemon thread
+_revalidation_queue = queue.Queue()
+_revalidation_pending = set()
+_revalidation_lock = threading.Lock()
+_revalidation_thread = None
+
+def schedule_revalidation(celex_id):
+    """Revalidate a stale law in the background, the cached copy is served meanwhile"""
+    global _revalidation_thread
+    with _revalidation_lock:
+        if celex_id in _revalidation_pending:
+            return
+        _revalidation_pending.add(celex_id)
+        if _revalidation_thread is None:
+            _revalidation_thread = threading.Thread(target=_revalidation_worker, name="legalqa-revalidation",
+                                                    daemon=True)
+            _revalidation_thread.start()
+    _revalidation_queue.put(celex_id)
+
+def _revalidation_worker():
+    while True:
+        celex_id = _revalidation_queue.get()
+        try:
+            structured_json = revalidate_law(celex_id)
+            if structured_json is not None:
+                update_cached_law(celex_id, structured_json)
+        except Exception as e:
+            print(f"Revalidation of {celex_id} failed: {e}")
+        finally:
+            with _revalidation_lock:
+                _revalidation_pending.discard(celex_id)
+
 def clean_articles(structured_json):
     if structured_json is not None and 'articles' in structured_json:
         filtered_articles = []
@@ -645,7 +1230,15 @@ def clean_articles(structured_json):
         structured_json['articles'] = filtered_articles
     return structured_json
 
-def run_module_3(lawsToConsider):
+def run_module_3(lawsToConsider, cached_only=False):
+    """
+    Full text of the laws retrieved by module 2, as a 'law' column of Law records.
+
+    Args:
+        lawsToConsider (pd.DataFrame): Module 2 output
+        cached_only (bool): Use only the law cache and the raw store: laws missing from
+            them are answered from their dataset text and expired laws are served as is
+    """
     
     # Add this column to store JSON data
     lawsToConsider['structured_json'] = None
@@ -653,10 +1246,15 @@ def run_module_3(lawsToConsider):
     #Remove erovoc_concepts
     lawsToConsider = lawsToConsider.drop(columns=['eurovoc_concepts'], errors='ignore')
 
-    df_cache = load_cache()
+    df_cache = get_cache()
 
-    dfFullText = getFullText(lawsToConsider, df_cache)
+    with span("module_3.get_full_text", laws=len(lawsToConsider), cache_hits=0, cache_misses=0):
+        dfFullText = getFullText(lawsToConsider, df_cache, cached_only=cached_only)
 
-    dfFullText['structured_json'] = dfFullText['structured_json'].apply(clean_articles)
+    # Compact Law objects, passed by reference to modules 4 and 5
+    dfFullText['law'] = [
+        structured_json if isinstance(structured_json, Law) else Law.from_json(celex_id, clean_articles(structured_json))
+        for celex_id, structured_json in zip(dfFullText['celex_id'], dfFullText['structured_json'])
+    ]
 
-    return dfFullText
\ No newline at end of file
+    return dfFullText.drop(columns=['structured_json'])
\ No newline at end of file
@@ -1,94 +1,313 @@
+import os
 import ast
+import sys
 import json
 import numpy as np
 import pandas as pd
-from typing import Optional
-from sentence_transformers import SentenceTransformer
+from pathlib import Path
+from typing import Optional, TYPE_CHECKING
+from src.documents import Law, Match, matches_to_json
+from src.module_3 import get_cache, clean_articles, cache_fingerprint
+from src.utils.bm25 import BM25Index
+from src.utils.tracing import span
 
-def run_module_4(df: pd.DataFrame, query: str, threshold: float = 0.5, model_name: str = 'jinaai/jina-embeddings-v2-small-en') -> pd.DataFrame:
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+DEFAULT_MODEL = 'jinaai/jina-embeddings-v2-small-en'
+SECTIONS = ('articles', 'annexes')
+
+# Sections per query passed to the encoder, the best by BM25 (0 to encode them all)
+PASSAGE_TOP_M = int(os.environ.get("LEGALQA_PASSAGE_TOP_M", 50))
+
+# Weight of the normalized BM25 score in the fused score of a match, the rest is the cosine similarity
+LEXICAL_WEIGHT = float(os.environ.get("LEGALQA_LEXICAL_WEIGHT", 0.2))
+
+# Where the BM25 index of the cached law sections is kept between runs
+SECTION_INDEX_DIR = Path(os.environ.get("LEGALQA_SECTION_INDEX",
+                                        Path(__file__).parent.parent / "cache" / "bm25" / "sections"))
+
+# Models loaded in this process, by name
+_models = {}
+
+# Section embeddings of the most requested laws by model name, filled by preload_embeddings
+_preloaded_embeddings = {}
+
+# BM25 index of the sections of the cached laws
+_section_index = None
+
+def get_model(model_name: str = DEFAULT_MODEL) -> "SentenceTransformer":
+    """
+    Load a SentenceTransformer model once per process and reuse it afterwards.
+
+    Args:
+        model_name (str): SentenceTransformer model name.
+
+    Returns:
+        SentenceTransformer: The loaded model.
+
+    Raises:
+        Exception: If model loading fails.
+    """
+    model = _models.get(model_name)
+    if model is None:
+        try:
+            with span("module_4.model_load", model=model_name):
+                # Imported on first use: it pulls in torch and transformers
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(model_name)
+        except Exception as e:
+            raise Exception(f"Failed to load model '{model_name}': {str(e)}")
+        _models[model_name] = model
+    return model
+
+def build_section_index(df_cache: pd.DataFrame, fingerprint: str = None) -> BM25Index:
+    """
+    Index the article/annex texts of every law of the cache with BM25.
+
+    The sections of a law are indexed in the order of Law.sections(SECTIONS), empty ones
+    included, so the passages of a law line up with the sections module 3 returns for it.
+
+    Args:
+        df_cache (pd.DataFrame): Law cache with 'celex_id' and 'structured_json' columns.
+        fingerprint (str): Fingerprint of the cache, saved with the index.
+
+    Returns:
+        BM25Index: One group of passages per law.
+    """
+    def groups():
+        for celex_id, structured_json in zip(df_cache['celex_id'], df_cache['structured_json']):
+            if not isinstance(structured_json, str):
+                continue
+            try:
+                law = Law.from_json(celex_id, clean_articles(ast.literal_eval(structured_json)))
+            except (ValueError, SyntaxError):
+                continue
+            yield law.celex_id, [section.text for section in law.sections(SECTIONS)]
+
+    with span("module_4.index_build", laws=len(df_cache)) as s:
+        index = BM25Index.build(groups(), metadata={"fingerprint": fingerprint})
+        s.set_attributes(passages=index.n_docs, terms=len(index.vocabulary))
+    return index
+
+def get_section_index() -> BM25Index:
+    """
+    Load the BM25 index of the cached law sections once per process.
+
+    The index saved in SECTION_INDEX_DIR is used while the cache shards it was built from
+    are unchanged, otherwise it is rebuilt from the cache and saved again.
+
+    Returns:
+        BM25Index: The section index.
+    """
+    global _section_index
+    if _section_index is None:
+        fingerprint = cache_fingerprint()
+        with span("module_4.index_load"):
+            index = BM25Index.load(SECTION_INDEX_DIR)
+        if index is None or index.metadata.get("fingerprint") != fingerprint:
+            index = build_section_index(get_cache(), fingerprint)
+            try:
+                index.save(SECTION_INDEX_DIR)
+            except OSError as e:
+                print(f"Could not save the section index: {e}")
+        _section_index = index
+    return _section_index
+
+def _lexical_scores(index: BM25Index, law: Law, sections: list, query: str) -> np.ndarray:
+    """BM25 scores of the sections of a law, from the index if it holds this version of the law"""
+    docs = index.group_docs(law.celex_id)
+    if docs is not None and len(docs) == len(sections) and \
+            all(index.doc_chars[d] == len(section.text or '') for d, section in zip(docs, sections)):
+        return index.score(query, docs)
+    # Law fetched live or changed since the index was built
+    return index.score_texts(query, [section.text for section in sections])
+
+def _select_sections(df: pd.DataFrame, query: str, index: BM25Index, top_m: int) -> list:
+    """
+    Score the non-empty sections of a query's laws with BM25 and keep the top_m best.
+
+    Returns:
+        list: (row position, section, normalized BM25 score) of the kept sections, in document order
+    """
+    candidates, scores = [], []
+    for row, law in enumerate(df['law']):
+        if law is None:
+            continue
+        sections = list(law.sections(SECTIONS))
+        lexical = _lexical_scores(index, law, sections, query)
+        for section, score in zip(sections, lexical):
+            if section.text:
+                candidates.append((row, section))
+                scores.append(score)
+
+    scores = np.asarray(scores, dtype=np.float64)
+    best = scores.max() if len(scores) else 0.0
+    normalized = scores / best if best > 0 else scores
+    keep = range(len(candidates))
+    if top_m and len(candidates) > top_m and best > 0:
+        # Without any query term in the sections BM25 cannot rank them, all are kept
+        keep = sorted(np.argsort(-scores, kind='stable')[:top_m])
+    return [(candidates[i][0], candidates[i][1], float(normalized[i])) for i in keep]
+
+def _document_texts(law: Law) -> list:
+    """List the non-empty article/annex texts of one law"""
+    if law is None:
+        return []
+    return [section.text for section in law.sections(SECTIONS) if section.text]
+
+def _section_texts(df: pd.DataFrame) -> list:
+    """List the non-empty article/annex texts of every law in the dataframe"""
+    return [text for law in df['law'] for text in _document_texts(law)]
+
+def preload_embeddings(documents: list, memory_budget: int, model_name: str = DEFAULT_MODEL) -> int:
+    """
+    Encode the article/annex texts of laws ahead of their first query.
+
+    Laws are taken in order until the embeddings of the next one would exceed the memory
+    budget; their texts are then encoded in one batch. run_module_4_batch only encodes the
+    texts that were not preloaded.
+
+    Args:
+        documents (list): Laws, the most wanted first.
+        memory_budget (int): Bytes the embeddings (and their text keys) may take.
+        model_name (str): SentenceTransformer model name.
+
+    Returns:
+        int: Number of texts preloaded.
+    """
+    model = get_model(model_name)
+    preloaded = _preloaded_embeddings.setdefault(model_name, {})
+    dimension = model.get_sentence_embedding_dimension() or 0
+    itemsize = np.dtype(np.float32).itemsize
+
+    texts, used = {}, 0
+    for data in documents:
+        new = [t for t in dict.fromkeys(_document_texts(data)) if t not in preloaded and t not in texts]
+        size = sum(sys.getsizeof(t) + dimension * itemsize for t in new)
+        if used + size > memory_budget:
+            break
+        texts.update(dict.fromkeys(new))
+        used += size
+
+    texts = list(texts)
+    with span("module_4.preload", model=model_name, laws=len(documents), sections=len(texts), bytes=used):
+        if texts:
+            preloaded.update(zip(texts, model.encode(texts, convert_to_numpy=True)))
+    return len(texts)
+
+def _match_sections(selection: list, n_rows: int, query_emb: np.ndarray, embeddings: dict, threshold: float) -> list:
+    """
+    Score the selected sections of a query against it with the precomputed embeddings
+    and keep only the sections with a cosine similarity >= threshold. Their score fuses
+    the cosine similarity with the normalized BM25 score.
+
+    Returns:
+        list: The matches of every row
+    """
+    matches = [[] for _ in range(n_rows)]
+    if not selection:
+        return matches
+
+    # Cosine similarity with the query
+    embs = np.stack([embeddings[section.text] for _, section, _ in selection])
+    dense = embs @ query_emb / (np.linalg.norm(embs, axis=1) * np.linalg.norm(query_emb))
+
+    for (row, section, lexical), cosine in zip(selection, dense.tolist()):
+        if cosine >= threshold:
+            score = (1 - LEXICAL_WEIGHT) * cosine + LEXICAL_WEIGHT * lexical
+            matches[row].append(Match(section, score, dense=cosine, lexical=lexical))
+    return matches
+
+def run_module_4_batch(dfs: list, queries: list, threshold: float = 0.5, model_name: str = DEFAULT_MODEL,
+                       top_m: int = PASSAGE_TOP_M) -> list:
+    """
+    Filter the laws of several queries at once.
+
+    The article/annex texts of each query's laws are first ranked with BM25 and only the
+    top_m best are passed to the encoder. The queries and the union of the kept texts are
+    then encoded in two batched calls, so a section shared by several queries is only
+    encoded once.
+
+    Args:
+        dfs (list): One DataFrame per query, each with 'law' (src.documents.Law) and 'celex_id' columns.
+        queries (list): Query texts, aligned with dfs.
+        threshold (float): Similarity threshold for filtering (0-1). Default: 0.5.
+        model_name (str): SentenceTransformer model name.
+        top_m (int): Sections per query passed to the encoder, 0 for all of them.
+
+    Returns:
+        list: One filtered DataFrame per query, see run_module_4.
+
+    Raises:
+        ValueError: If required columns are missing from an input DataFrame.
+        Exception: If model loading fails.
+    """
+    # Validate input DataFrames
+    required_columns = ['law', 'celex_id']
+    for df in dfs:
+        missing_columns = [col for col in required_columns if col not in df.columns]
+        if missing_columns:
+            raise ValueError(f"Missing required columns: {missing_columns}")
+
+    model = get_model(model_name)
+
+    # Encode the queries
+    with span("module_4.encode_query", queries=len(queries), query_chars=sum(len(q) for q in queries)):
+        query_embs = model.encode(list(queries), convert_to_numpy=True)
+
+    # Cheap lexical first stage: the sections worth encoding
+    index = get_section_index()
+    with span("module_4.lexical", queries=len(queries), top_m=top_m) as s:
+        selections = [_select_sections(df, query, index, top_m) for df, query in zip(dfs, queries)]
+        s.set_attributes(sections=sum(len(_section_texts(df)) for df in dfs),
+                         selected=sum(len(selection) for selection in selections))
+
+    # Encode every distinct selected section text once, unless it was preloaded
+    preloaded = _preloaded_embeddings.get(model_name, {})
+    texts = list(dict.fromkeys(section.text for selection in selections for _, section, _ in selection))
+    embeddings = {text: preloaded[text] for text in texts if text in preloaded}
+    texts = [text for text in texts if text not in embeddings]
+    with span("module_4.encode_sections", laws=sum(len(df) for df in dfs), sections=len(texts),
+              preloaded=len(embeddings), section_chars=sum(len(t) for t in texts)):
+        if texts:
+            embeddings.update(zip(texts, model.encode(texts, convert_to_numpy=True)))
+
+    results = []
+    for df, query_emb, selection in zip(dfs, query_embs, selections):
+        # Matches reference the sections of the laws, nothing is copied
+        matches = _match_sections(selection, len(df), query_emb, embeddings, threshold)
+
+        # Keep only rows with at least one match
+        mask = [len(law_matches) > 0 for law_matches in matches]
+        df_filtered = df.loc[mask, ['celex_id']].copy()
+        df_filtered['matches'] = [law_matches for law_matches in matches if law_matches]
+
+        results.append(df_filtered)
+
+    return results
+
+def run_module_4(df: pd.DataFrame, query: str, threshold: float = 0.5, model_name: str = DEFAULT_MODEL) -> pd.DataFrame:
     """
     Filter laws dataframe based on similarity of articles and annexes to the query.
 
     Args:
-        df (pd.DataFrame): DataFrame containing laws with a 'structured_json' column.
+        df (pd.DataFrame): DataFrame containing laws with a 'law' column.
         query (str): Query text to compare against.
         threshold (float): Similarity threshold for filtering (0-1). Default: 0.5.
         model_name (str): SentenceTransformer model name. Default: 'jinaai/jina-embeddings-v2-small-en'.
 
     Returns:
-        pd.DataFrame: Filtered DataFrame with columns ['celex_id', 'filtered_json'].
-                     Only contains rows where at least one article or annex meets the threshold.
+        pd.DataFrame: Filtered DataFrame with columns ['celex_id', 'matches'], 'matches' being
+                     the list of src.documents.Match of the law's articles and annexes whose
+                     cosine similarity meets the threshold, scored by the fusion of their
+                     cosine similarity and BM25 score. Only contains rows with at least one match.
 
     Raises:
         ValueError: If required columns are missing from the input DataFrame.
         Exception: If model loading fails.
     """
-    
-    # Validate input DataFrame
-    required_columns = ['structured_json', 'celex_id']
-    missing_columns = [col for col in required_columns if col not in df.columns]
-    print(missing_columns)
-    if missing_columns:
-        raise ValueError(f"Missing required columns: {missing_columns}")
-    
-    
-    # Initialize the sentence transformer model
-    try:
-        model = SentenceTransformer(model_name)
-    except Exception as e:
-        raise Exception(f"Failed to load model '{model_name}': {str(e)}")
-    
-    # Encode the query
-    query_emb = model.encode(query, convert_to_numpy=True)
-
-    def filter_structured(data: dict):
-        """
-        Parse the Python-style JSON in sj, compute cosine similarity of each
-        article/annex text to the query, add 'score' and keep only elements
-        with score >= threshold.
-        """
-        # Parse Python-dict string
-        # try:
-        #     #data = ast.literal_eval(sj)
-        # except (ValueError, SyntaxError):
-        #     return {'articles': [], 'annexes': []}
-
-        out = {'articles': [], 'annexes': []}
-        
-        for section in ('articles', 'annexes'):
-            for elem in data.get(section, []):
-                text = elem.get('text', '')
-                if not text:  # Skip empty texts
-                    continue
-                    
-                # Embed and compute cosine similarity
-                emb = model.encode(text, convert_to_numpy=True)
-                score = float(
-                    np.dot(query_emb, emb) /
-                    (np.linalg.norm(query_emb) * np.linalg.norm(emb))
-                )
-                elem['score'] = score
-                if score >= threshold:
-                    out[section].append(elem)
-        return out
-
-    # Create a copy of the DataFrame to avoid modifying the original
-    df_copy = df.copy()
-    
-    print("a filtrar")
-    # Apply filtering
-    df_copy['filtered_json'] = df_copy['structured_json'].apply(filter_structured)
-
-    # Keep only rows with at least one match
-    mask = df_copy['filtered_json'].apply(lambda d: len(d['articles']) + len(d['annexes']) > 0)
-    df_filtered = df_copy[mask].copy()
-
-    # Convert filtered dict back to JSON string
-    df_filtered['filtered_json'] = df_filtered['filtered_json'].apply(json.dumps)
-
-    # Select relevant columns and return
-    result = df_filtered[['celex_id', 'filtered_json']]
-    return result
+    return run_module_4_batch([df], [query], threshold=threshold, model_name=model_name)[0]
 
 def load_query_from_file(query_file: str) -> str:
     """
@@ -105,7 +324,7 @@ def load_query_from_file(query_file: str) -> str:
 
 def save_filtered_laws(df: pd.DataFrame, output_path: str) -> None:
     """
-    Helper function to save filtered laws to CSV.
+    Helper function to save filtered laws to CSV, the matches as a 'filtered_json' column.
     
     Args:
         df (pd.DataFrame): Filtered DataFrame to save.
@@ -113,5 +332,6 @@ def save_filtered_laws(df: pd.DataFrame, output_path: str) -> None:
     """
     import os
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    df.to_csv(output_path, index=False)
+    df = df.assign(filtered_json=df['matches'].apply(lambda matches: json.dumps(matches_to_json(matches))))
+    df.drop(columns=['matches']).to_csv(output_path, index=False)
     
\ No newline at end of file
@@ -4,95 +4,32 @@ import json
 import pandas as pd
 from time import time
 from pathlib import Path
-from openai import OpenAI
 from dotenv import load_dotenv
+from src.documents import matches_from_json
+from src.utils.tracing import span
 
 class SequenceFilterer:
     def __init__(self, minimum_length_limit=20, max_added_word_limit=10000):
         self.minimum_length_limit = minimum_length_limit
         self.max_added_word_limit = max_added_word_limit
 
-    def _clean_json_str(self, raw_str: str) -> str:
-        """Ultra-robust JSON string cleaning."""
-        import re
-        
-        # Step 1: Decode unicode escapes
-        try:
-            decoded = bytes(raw_str, "utf-8").decode("unicode_escape")
-        except:
-            decoded = raw_str
-        
-        # Step 2: Remove ALL control characters completely
-        # This removes characters 0-31 (except \n, \r, \t) and 127-159
-        cleaned = ''.join(char for char in decoded if ord(char) >= 32 or char in '\n\r\t')
-        
-        # Step 3: Handle problematic Unicode characters
-        cleaned = re.sub(r'[\u00A0\u1680\u180E\u2000-\u200B\u202F\u205F\u3000\uFEFF]', ' ', cleaned)
-        
-        # Step 4: The key fix - properly escape ALL special characters within JSON strings
-        # We need to parse the structure and escape content within quotes
-        
-        result = ""
-        i = 0
-        in_string = False
-        
-        while i < len(cleaned):
-            char = cleaned[i]
-            
-            if char == '"' and (i == 0 or cleaned[i-1] != '\\'):
-                # Toggle string state
-                in_string = not in_string
-                result += char
-            elif in_string:
-                # We're inside a JSON string value - escape special characters
-                if char == '\\':
-                    result += '\\\\'
-                elif char == '"':
-                    result += '\\"'
-                elif char == '\n':
-                    result += '\\n'
-                elif char == '\r':
-                    result += '\\r'
-                elif char == '\t':
-                    result += '\\t'
-                elif char == '\b':
-                    result += '\\b'
-                elif char == '\f':
-                    result += '\\f'
-                elif ord(char) < 32:
-                    # Any remaining control character - escape as unicode
-                    result += f'\\u{ord(char):04x}'
-                else:
-                    result += char
-            else:
-                # We're in JSON structure (outside strings)
-                result += char
-            
-            i += 1
-        
-        return result
-
-    def _parse_and_flatten(self, celex_id: str, filtered_json_str: str) -> list:
-        """Decode, clean, parse JSON, flatten articles, sort by score."""
-        try:
-            cleaned = self._clean_json_str(filtered_json_str)
-            obj = json.loads(cleaned)
-            articles = []
-            for art in obj.get("articles", []):
-                flat = dict(art)
-                flat["celex_id"] = celex_id
-                articles.append(flat)
-            return sorted(articles, key=lambda x: x.get("score", 0), reverse=True)
-        except Exception as e:
-            print(f"Parse error for {celex_id}: {e}")
-            print(f"Problematic JSON: {filtered_json_str[:200]}...")
-            return []
+    def _article_matches(self, celex_id: str, matches) -> list:
+        """Article matches of a law sorted by descending score, from module 4's list or a filtered_json string."""
+        if isinstance(matches, str):
+            try:
+                matches = matches_from_json(celex_id, matches)
+            except (json.JSONDecodeError, AttributeError) as e:
+                print(f"Parse error for {celex_id}: {e}")
+                print(f"Problematic JSON: {matches[:200]}...")
+                return []
+        articles = [match for match in matches if match.section.kind == "articles"]
+        return sorted(articles, key=lambda match: match.score, reverse=True)
 
     def _filter_by_word_count(self, articles: list) -> list:
         """Select articles above min length and within total-word cap."""
         selected, total = [], 0
         for art in articles:
-            text = art.get("text", "")
+            text = art.text or ""
             wc = len(re.findall(r'\w+', text))
             if wc < self.minimum_length_limit: 
                 continue
@@ -103,19 +40,20 @@ class SequenceFilterer:
         return selected
 
     def aggregate_all_articles(self, df: pd.DataFrame, title_df: pd.DataFrame = None, 
-                          source_column: str = "filtered_json") -> dict:
+                          source_column: str = "matches") -> dict:
         """
-        Aggregate all articles from all rows into a single JSON structure,
-        sorted by descending score, maintaining all original information plus celex_id
-        and law titles (if title_df is provided).
+        Aggregate the matching articles of all rows into a single structure, sorted by
+        descending score. The articles are the src.documents.Match of module 4, which
+        reference the sections of the laws: their texts are not copied.
         
         Args:
             df: Main DataFrame with articles data
             title_df: DataFrame with celex_id and title columns (optional)
-            source_column: Column name containing the JSON data
+            source_column: Column with the matches of each law (or filtered_json strings)
         
         Returns:
-            dict: JSON-like structure with 'articles' key containing all aggregated articles
+            dict: 'articles' (the aggregated matches), 'total_articles' and 'law_titles'
+                  (celex_id -> law title)
         """
         all_articles = []
         
@@ -125,36 +63,27 @@ class SequenceFilterer:
             title_mapping = dict(zip(title_df['celex_id'], title_df['title']))
         
         # Process each row in the dataframe
-        for idx, row in df.iterrows():
-            cid = row.get("celex_id")
-            raw = row.get(source_column)
-            
-            if pd.isna(cid) or pd.isna(raw):
+        for cid, raw in zip(df["celex_id"], df[source_column]):
+            if pd.isna(cid) or not isinstance(raw, (str, list)):
                 continue
                 
-            # Parse and flatten articles from this row
-            arts = self._parse_and_flatten(cid, raw)
+            # Article matches of this row
+            arts = self._article_matches(cid, raw)
             
             # Apply word count filtering
             filt = self._filter_by_word_count(arts)
             
-            # Add law title to each article if title mapping is available
-            if title_mapping:
-                for article in filt:
-                    celex_id = article.get('celex_id')
-                    law_title = title_mapping.get(celex_id, 'Unknown Law')
-                    article['law_title'] = law_title
-            
             # Add filtered articles to the aggregated list
             all_articles.extend(filt)
         
         # Sort all articles by descending score
-        all_articles_sorted = sorted(all_articles, key=lambda x: x.get("score", 0), reverse=True)
+        all_articles_sorted = sorted(all_articles, key=lambda match: match.score, reverse=True)
         
-        # Create final JSON structure
+        # Create final structure
         final_json = {
             "articles": all_articles_sorted,
             "total_articles": len(all_articles_sorted),
+            "law_titles": title_mapping,
             "includes_law_titles": title_mapping is not None
         }
         
@@ -174,13 +103,14 @@ class SequenceFilterer:
         from collections import defaultdict
         
         articles = aggregated_json.get('articles', [])
+        law_titles = aggregated_json.get('law_titles') or {}
         grouped = defaultdict(list)
         
         # Group articles by celex_id, preserving law titles
         for article in articles:
-            celex_id = article.get('celex_id', 'UNKNOWN')
-            text = article.get('text', '')
-            law_title = article.get('law_title', 'Unknown Law')
+            celex_id = article.celex_id
+            text = article.text or ''
+            law_title = law_titles.get(celex_id, 'Unknown Law')
             
             if text:  # Only add non-empty texts
                 grouped[celex_id].append({
@@ -225,6 +155,7 @@ def run_llm_pipeline_with_variables(prompt_variables, prompt_file="prompts/promp
     base_path = Path(__file__).parent if '__file__' in globals() else Path.cwd()
     PROMPT_PATH = base_path / prompt_file
     MODEL = os.environ.get("OPENROUTER_MODEL", "qwen/qwen3-30b-a3b:free")
+    BASE_URL = os.environ.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
     API_KEY = os.environ.get("OPENROUTER_API_KEY")
     
     assert API_KEY, "OPENROUTER_API_KEY environment variable must be set or provided as parameter."
@@ -241,22 +172,28 @@ def run_llm_pipeline_with_variables(prompt_variables, prompt_file="prompts/promp
             raise ValueError(f"Missing variable for prompt: {e}")
     
     def call_openrouter_llm(prompt, api_key, model):
-        client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=api_key,
-        )
-        completion = client.chat.completions.create(
-            extra_headers={},
-            extra_body={},
-            model=model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ]
-        )
-        return completion.choices[0].message.content
+        with span("module_5.llm_call", model=model, prompt_chars=len(prompt)) as s:
+            from openai import OpenAI
+
+            client = OpenAI(
+                base_url=BASE_URL,
+                api_key=api_key,
+            )
+            completion = client.chat.completions.create(
+                extra_headers={},
+                extra_body={},
+                model=model,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ]
+            )
+            if completion.usage is not None:
+                s.set_attributes(prompt_tokens=completion.usage.prompt_tokens,
+                                 completion_tokens=completion.usage.completion_tokens)
+            return completion.choices[0].message.content
     
     # Main execution logic
     try:
@@ -268,11 +205,14 @@ def run_llm_pipeline_with_variables(prompt_variables, prompt_file="prompts/promp
         print(f"Error: {e}")
         raise e
 
-def run_module_5(filteredDF, lawsDF, user_query, dummy_prompt:bool=False):
+def run_module_5(filteredDF, lawsDF, user_query, dummy_prompt:bool=False, max_context_words:int=10000):
 
-    filterer = SequenceFilterer(minimum_length_limit=20, max_added_word_limit=10000)
-    summarized_laws = filterer.aggregate_all_articles(df=filteredDF, title_df=lawsDF, source_column='filtered_json')
-    summarized_laws = filterer.generate_text_prompt(summarized_laws)
+    filterer = SequenceFilterer(minimum_length_limit=20, max_added_word_limit=max_context_words)
+    with span("module_5.aggregate") as s:
+        summarized_laws = filterer.aggregate_all_articles(df=filteredDF, title_df=lawsDF, source_column='matches')
+        s.set_attribute("articles", summarized_laws["total_articles"])
+        summarized_laws = filterer.generate_text_prompt(summarized_laws)
+        s.set_attribute("context_chars", len(summarized_laws))
 
     if dummy_prompt:
         # Use a dummy prompt for testing purposes
@@ -0,0 +1,86 @@
+"""
+Log of the laws every query retrieved, used to prewarm a new process.
+
+Every query appends one JSON line {"ts", "celex_ids"} to cache/query_log.jsonl (or
+LEGALQA_QUERY_LOG, empty to disable logging). At startup the orchestrator reads the most
+recent lines and preloads the parsed text and the article embeddings of the laws that
+came up most often, so the first queries after a deploy do not pay for them.
+"""
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from collections import Counter, deque
+
+QUERY_LOG_PATH = os.environ.get("LEGALQA_QUERY_LOG", str(Path(__file__).parent.parent / "cache" / "query_log.jsonl"))
+
+# Queries read back when ranking the laws, the older ones are ignored
+RECENT_QUERIES = 10000
+
+
+class QueryLog:
+    """
+    Append-only log of the CELEX ids retrieved per query.
+
+    Args:
+        path (Path): JSONL file of the log, None to keep nothing
+        recent (int): Most recent queries considered by top_laws
+    """
+
+    def __init__(self, path=QUERY_LOG_PATH, recent=RECENT_QUERIES):
+        self.path = Path(path) if path else None
+        self.recent = recent
+        self._lock = threading.Lock()
+
+    def record(self, celex_ids):
+        """Append the CELEX ids retrieved for one query"""
+        if self.path is None or not celex_ids:
+            return
+        line = json.dumps({"ts": time.time(), "celex_ids": [str(c) for c in celex_ids]}) + "\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def entries(self):
+        """The most recent log entries, oldest first"""
+        if self.path is None or not self.path.exists():
+            return []
+        with self._lock, open(self.path, "r", encoding="utf-8") as f:
+            lines = deque(f, maxlen=self.recent)
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                # Last line of a process killed mid-write
+                continue
+        return entries
+
+    def top_laws(self, n):
+        """
+        The laws retrieved by the most recent queries, most frequent first.
+
+        Args:
+            n (int): Number of laws
+
+        Returns:
+            list: (celex_id, queries) tuples
+        """
+        counts = Counter()
+        for entry in self.entries():
+            # A law retrieved twice for one query counts once
+            counts.update(set(entry.get("celex_ids") or []))
+        return counts.most_common(n)
+
+
+# Log used by this process
+_query_log = None
+
+def get_query_log():
+    """Open the query log once per process and reuse it afterwards"""
+    global _query_log
+    if _query_log is None:
+        _query_log = QueryLog()
+    return _query_log
@@ -0,0 +1,241 @@
+"""
+Content-addressed store of the raw EUR-Lex HTML of every law.
+
+Documents are compressed (zstd, or gzip when zstandard is not installed) and stored once
+per SHA-256 of their bytes under objects/<sha[:2]>/<sha>.<codec>; index.jsonl maps every
+CELEX id to the digest of its latest fetch, with the HTTP validators (ETag,
+Last-Modified) of the response and the time it was last confirmed current. Keeping the
+raw HTML lets a parser upgrade re-parse the whole cache locally
+(python -m src.cache_builder --reparse) instead of fetching it again, and the validators
+let a law be revalidated with a conditional GET (FreshnessPolicy decides when).
+"""
+import os
+import gzip
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Where the store lives, overridable to share it between checkouts
+RAW_STORE_DIR = Path(os.environ.get("LEGALQA_RAW_STORE", Path(__file__).parent.parent / "cache" / "raw"))
+
+DAY = 24 * 60 * 60
+
+
+def response_validators(headers):
+    """ETag and Last-Modified of an HTTP response, the fields kept in the index"""
+    return {"etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified")}
+
+
+def conditional_headers(entry):
+    """If-None-Match / If-Modified-Since headers revalidating an index entry"""
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+class FreshnessPolicy:
+    """
+    When a cached law may be served without revalidating it.
+
+    A law validated less than max_age seconds ago is fresh. Within the following
+    stale_window seconds it is stale: served as is while it is revalidated in the
+    background. After that it has expired and must be revalidated before being served.
+    Laws without a raw store entry have no validators and are always served.
+
+    Args:
+        max_age (float): Seconds a law stays fresh after being validated
+        stale_window (float): Seconds a stale law may still be served
+    """
+
+    FRESH = "fresh"
+    STALE = "stale"
+    EXPIRED = "expired"
+    UNKNOWN = "unknown"
+
+    def __init__(self, max_age=30 * DAY, stale_window=335 * DAY):
+        self.max_age = max_age
+        self.stale_window = stale_window
+
+    @classmethod
+    def from_env(cls):
+        """Policy from LEGALQA_CACHE_MAX_AGE_DAYS and LEGALQA_CACHE_STALE_DAYS"""
+        return cls(max_age=float(os.environ.get("LEGALQA_CACHE_MAX_AGE_DAYS", 30)) * DAY,
+                   stale_window=float(os.environ.get("LEGALQA_CACHE_STALE_DAYS", 335)) * DAY)
+
+    def state(self, entry, now=None):
+        """Freshness of a raw store index entry"""
+        if entry is None:
+            return self.UNKNOWN
+        age = (now or time.time()) - entry.get("validated_at", entry["fetched_at"])
+        if age <= self.max_age:
+            return self.FRESH
+        if age <= self.max_age + self.stale_window:
+            return self.STALE
+        return self.EXPIRED
+
+
+class RawStore:
+    """
+    Raw HTML documents by CELEX id.
+
+    Args:
+        root (Path): Directory of the store
+        level (int): Compression level
+    """
+
+    def __init__(self, root=RAW_STORE_DIR, level=9):
+        self.root = Path(root)
+        self.level = level
+        self.codec = "zst" if zstandard is not None else "gz"
+        self._index = None
+        self._lock = threading.Lock()
+
+    @property
+    def index_path(self):
+        return self.root / "index.jsonl"
+
+    def _object_path(self, digest, codec):
+        return self.root / "objects" / digest[:2] / f"{digest}.{codec}"
+
+    def _load_index(self):
+        """CELEX id -> latest index entry, the last line of an id wins"""
+        if self._index is None:
+            index = {}
+            if self.index_path.exists():
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            # Last line of a process killed mid-write
+                            continue
+                        index[entry["celex_id"]] = entry
+            self._index = index
+        return self._index
+
+    def _compress(self, data):
+        if self.codec == "zst":
+            return zstandard.ZstdCompressor(level=self.level).compress(data)
+        return gzip.compress(data, compresslevel=min(self.level, 9))
+
+    @staticmethod
+    def _decompress(data, codec):
+        if codec == "zst":
+            if zstandard is None:
+                raise RuntimeError("zstandard is needed to read .zst objects of the raw store")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def put(self, celex_id, html, **metadata):
+        """
+        Store the raw bytes fetched for a law.
+
+        Args:
+            celex_id (str): CELEX id of the law
+            html (bytes): Raw response body
+            **metadata: Extra fields recorded in the index entry
+
+        Returns:
+            str: SHA-256 hex digest of the document
+        """
+        if isinstance(html, str):
+            html = html.encode("utf-8")
+        digest = hashlib.sha256(html).hexdigest()
+
+        # Identical documents share one object; concurrent writers replace it with the same bytes
+        path = self._object_path(digest, self.codec)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(self._compress(html))
+            os.replace(tmp, path)
+
+        with self._lock:
+            now = time.time()
+            self._append({"celex_id": celex_id, "sha256": digest, "codec": self.codec, "bytes": len(html),
+                          "fetched_at": now, "validated_at": now, **metadata})
+        return digest
+
+    def touch(self, celex_id, **metadata):
+        """
+        Record that the stored document of a law is still current (a 304 answer).
+
+        Args:
+            celex_id (str): CELEX id of the law
+            **metadata: Index fields to update, e.g. new validators
+
+        Returns:
+            dict: The new index entry, or None if the law is not stored
+        """
+        with self._lock:
+            entry = self._load_index().get(celex_id)
+            if entry is None:
+                return None
+            return self._append({**entry, **{k: v for k, v in metadata.items() if v is not None},
+                                 "validated_at": time.time()})
+
+    def _append(self, entry):
+        """Append an index entry (the lock is held)"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        self._load_index()[entry["celex_id"]] = entry
+        return entry
+
+    def entry(self, celex_id):
+        """Index entry of a law, or None"""
+        with self._lock:
+            return self._load_index().get(celex_id)
+
+    def get_bytes(self, celex_id):
+        """Raw bytes of a law, or None if it is not stored"""
+        entry = self.entry(celex_id)
+        if entry is None:
+            return None
+        path = self._object_path(entry["sha256"], entry["codec"])
+        if not path.exists():
+            return None
+        return self._decompress(path.read_bytes(), entry["codec"])
+
+    def get(self, celex_id):
+        """Raw HTML of a law, or None if it is not stored"""
+        data = self.get_bytes(celex_id)
+        return data.decode("utf-8") if data is not None else None
+
+    def __contains__(self, celex_id):
+        return self.entry(celex_id) is not None
+
+    def celex_ids(self):
+        with self._lock:
+            return list(self._load_index())
+
+    def compact_index(self):
+        """Rewrite the index with one line per law"""
+        with self._lock:
+            index = self._load_index()
+            tmp = self.index_path.with_suffix(".jsonl.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                for entry in index.values():
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(tmp, self.index_path)
+
+
+# Store used by this process
+_raw_store = None
+
+def get_raw_store():
+    """Open the raw store once per process and reuse it afterwards"""
+    global _raw_store
+    if _raw_store is None:
+        _raw_store = RawStore()
+    return _raw_store
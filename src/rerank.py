@@ -0,0 +1,281 @@
+"""
+Second-stage reranking of the laws retrieved by module 2, before modules 3 to 5.
+
+Module 2 fuses the BM25 rankings of the law texts and titles into a top-N list whose
+scores are not comparable across queries. Every candidate law is scored here by the
+cosine similarity of the query with its title and summary, encoded with the module 4
+encoder; the embedding of a law is computed once and kept in cache/law_embeddings/.
+An adaptive cutoff keeps the laws scoring close to the best one, so laws unlikely to
+contribute articles are neither fetched, parsed nor encoded.
+"""
+import os
+import re
+import fcntl
+import struct
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from src.module_4 import get_model, get_section_index, DEFAULT_MODEL
+from src.utils.tracing import span, REGISTRY
+
+RERANK_ENABLED = os.environ.get("LEGALQA_RERANK", "1") != "0"
+
+# Candidates fused by module 2 and reranked
+RERANK_TOP_N = int(os.environ.get("LEGALQA_RERANK_TOP_N", 10))
+
+# Laws kept: within RERANK_MARGIN of the best score and above RERANK_MIN_SCORE, at
+# least RERANK_MIN_LAWS and at most RERANK_MAX_LAWS of them
+RERANK_MARGIN = float(os.environ.get("LEGALQA_RERANK_MARGIN", 0.08))
+RERANK_MIN_SCORE = float(os.environ.get("LEGALQA_RERANK_MIN_SCORE", 0.3))
+RERANK_MIN_LAWS = int(os.environ.get("LEGALQA_RERANK_MIN_LAWS", 1))
+RERANK_MAX_LAWS = int(os.environ.get("LEGALQA_RERANK_MAX_LAWS", 2))
+
+# Laws passed on without reranking: no RRF score reaches module 2's threshold of 5, so
+# it keeps its top 2. The work saved by the reranker is counted against these.
+BASELINE_LAWS = 2
+
+# Characters of the dataset text encoded with the title, its summary part
+SUMMARY_CHARS = 1000
+
+LAW_EMBEDDINGS_DIR = Path(os.environ.get("LEGALQA_LAW_EMBEDDINGS",
+                                         Path(__file__).parent.parent / "cache" / "law_embeddings"))
+
+
+class LawEmbeddingStore:
+    """
+    Embeddings of laws by CELEX id, for one model.
+
+    Stored in embeddings.bin: a header (magic, dimension, row count) followed by fixed-size
+    records, each a CELEX id (ID_BYTES, zero-padded) and its float32 vector, so an id can
+    never be paired with another law's vector. The file is shared by the processes of a
+    node (batch workers, server replicas): appends take an exclusive flock, write the
+    records after the last counted one and then update the count; readers take a shared
+    flock and read only the counted rows. Bytes after them, left by a process killed
+    mid-append, are ignored and overwritten by the next append. A process reads the rows
+    appended by the others when it misses an id, and does not append ids already stored.
+
+    Args:
+        root (Path): Directory of the embeddings of all models
+        model_name (str): Model the embeddings were computed with
+    """
+
+    MAGIC = b"LQAEMB1\0"
+    HEADER = struct.Struct("<8sII")
+    ID_BYTES = 32
+
+    def __init__(self, root=LAW_EMBEDDINGS_DIR, model_name=DEFAULT_MODEL):
+        self.directory = Path(root) / re.sub(r'[^A-Za-z0-9_.-]', '_', model_name)
+        self.path = self.directory / "embeddings.bin"
+        self._vectors = None
+        # Rows of the file read into _vectors
+        self._rows = 0
+        self._lock = threading.Lock()
+
+    def _record_dtype(self, dimension):
+        return np.dtype([("id", f"S{self.ID_BYTES}"), ("vector", "<f4", (dimension,))])
+
+    def _read_header(self, f):
+        """(dimension, rows) of an open store, None if it is empty or not a store"""
+        f.seek(0)
+        header = f.read(self.HEADER.size)
+        if len(header) < self.HEADER.size:
+            return None
+        magic, dimension, rows = self.HEADER.unpack(header)
+        if magic != self.MAGIC or dimension == 0:
+            return None
+        return dimension, rows
+
+    def _read_rows(self, f, dimension, rows):
+        """Read the rows of an open store this process has not read yet (the lock is held)"""
+        if rows <= self._rows:
+            return
+        dtype = self._record_dtype(dimension)
+        f.seek(self.HEADER.size + self._rows * dtype.itemsize)
+        records = np.frombuffer(f.read((rows - self._rows) * dtype.itemsize), dtype=dtype)
+        if len(records) != rows - self._rows:
+            print(f"Law embeddings {self.path}: {len(records)} of {rows - self._rows} new rows readable, "
+                  "the others are recomputed")
+        self._vectors.update((celex_id.decode("utf-8"), vector)
+                             for celex_id, vector in zip(records["id"], records["vector"]))
+        self._rows += len(records)
+
+    def _refresh(self):
+        """Read the rows appended by any process since the last read (the lock is held)"""
+        if self._vectors is None:
+            self._vectors, self._rows = {}, 0
+        if not self.path.exists():
+            return
+        with open(self.path, "rb") as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                header = self._read_header(f)
+                if header is not None:
+                    self._read_rows(f, *header)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get(self, celex_ids):
+        """Embeddings of the CELEX ids that are stored, by this process or another one"""
+        with self._lock:
+            if self._vectors is None or any(celex_id not in self._vectors for celex_id in celex_ids):
+                self._refresh()
+            return {celex_id: self._vectors[celex_id] for celex_id in celex_ids if celex_id in self._vectors}
+
+    def add(self, celex_ids, embeddings):
+        """Store the embeddings of laws, except those another process stored meanwhile"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        dimension = int(embeddings.shape[1])
+        with self._lock:
+            if self._vectors is None:
+                self._vectors, self._rows = {}, 0
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # Not opened for appending: the records are written at the offset after the counted rows
+            with open(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644), "r+b") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    header = self._read_header(f)
+                    if header is None:
+                        rows = 0
+                    else:
+                        stored, rows = header
+                        if stored != dimension:
+                            raise ValueError(f"Law embeddings {self.path} have dimension {stored}, not {dimension}")
+                        self._read_rows(f, stored, rows)
+                    new = [i for i, celex_id in enumerate(celex_ids) if celex_id not in self._vectors]
+                    if new:
+                        records = np.zeros(len(new), dtype=self._record_dtype(dimension))
+                        records["id"] = [str(celex_ids[i]).encode("utf-8")[:self.ID_BYTES] for i in new]
+                        records["vector"] = embeddings[new]
+                        # Records first, then the count: a reader never sees a row that is not fully written
+                        os.pwrite(f.fileno(), records.tobytes(), self.HEADER.size + rows * records.dtype.itemsize)
+                        os.pwrite(f.fileno(), self.HEADER.pack(self.MAGIC, dimension, rows + len(new)), 0)
+                        f.flush()
+                        os.fsync(f.fileno())
+                        self._vectors.update((celex_ids[i], embeddings[i]) for i in new)
+                        self._rows = rows + len(new)
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# Stores used by this process, by model name
+_law_embeddings = {}
+
+def get_law_embeddings(model_name=DEFAULT_MODEL):
+    """Open the law embedding store of a model once per process and reuse it afterwards"""
+    store = _law_embeddings.get(model_name)
+    if store is None:
+        store = _law_embeddings[model_name] = LawEmbeddingStore(model_name=model_name)
+    return store
+
+
+def law_text(title, text):
+    """Text of a law that is encoded: its title and the start of its dataset text"""
+    title = title if isinstance(title, str) else ""
+    text = text if isinstance(text, str) else ""
+    return f"{title}\n{text[:SUMMARY_CHARS]}".strip()
+
+
+def adaptive_cutoff(scores, margin=RERANK_MARGIN, min_score=RERANK_MIN_SCORE, min_laws=RERANK_MIN_LAWS,
+                    max_laws=RERANK_MAX_LAWS):
+    """
+    Number of laws kept from scores sorted in descending order.
+
+    Returns:
+        int: Laws scoring at least max(min_score, best - margin), clamped to [min_laws, max_laws]
+    """
+    if not len(scores):
+        return 0
+    floor = max(min_score, scores[0] - margin)
+    kept = int(sum(score >= floor for score in scores))
+    return min(len(scores), max(min_laws, min(kept, max_laws)))
+
+
+def downstream_work(celex_ids):
+    """
+    Downstream work of laws: laws, sections scored (of the laws in the cache) and live
+    fetches (of the others).
+
+    Returns:
+        dict: 'laws', 'sections' and 'fetches'
+    """
+    index = get_section_index()
+    sections = fetches = 0
+    for celex_id in celex_ids:
+        docs = index.group_docs(celex_id)
+        if docs is not None:
+            sections += len(docs)
+        else:
+            fetches += 1
+    return {"laws": len(celex_ids), "sections": sections, "fetches": fetches}
+
+
+def work_saved(baseline_ids, kept_ids):
+    """
+    Downstream work of the laws processed without reranking minus that of the kept laws,
+    negative where the reranker keeps more.
+
+    Returns:
+        dict: 'laws', 'sections' and 'fetches' not done
+    """
+    baseline, kept = downstream_work(baseline_ids), downstream_work(kept_ids)
+    return {key: baseline[key] - kept[key] for key in baseline}
+
+
+def rerank_laws_batch(dfs, queries, model_name=DEFAULT_MODEL):
+    """
+    Rerank the candidate laws of several queries and keep the likely relevant ones.
+
+    The queries and the laws without a stored embedding are encoded in two batched calls.
+
+    Args:
+        dfs (list): Module 2 output of each query (celex_id, score, title, text, ...)
+        queries (list): Query texts, aligned with dfs
+        model_name (str): SentenceTransformer model name
+
+    Returns:
+        list: One (DataFrame, report) tuple per query. The DataFrame holds the kept laws,
+              best first, with a 'rerank_score' column; the report has the 'candidates' and
+              'kept' law counts and the work saved against the top BASELINE_LAWS laws
+              of module 2 (see work_saved).
+    """
+    model = get_model(model_name)
+    store = get_law_embeddings(model_name)
+
+    with span("rerank.encode", queries=len(queries)) as s:
+        query_embs = model.encode(list(queries), convert_to_numpy=True)
+
+        celex_ids = list(dict.fromkeys(celex_id for df in dfs for celex_id in df['celex_id']))
+        law_embs = store.get(celex_ids)
+        missing = {}
+        for df in dfs:
+            for celex_id, title, text in zip(df['celex_id'], df['title'], df['text']):
+                if celex_id not in law_embs and celex_id not in missing:
+                    missing[celex_id] = law_text(title, text)
+        if missing:
+            embeddings = model.encode(list(missing.values()), convert_to_numpy=True)
+            store.add(list(missing), embeddings)
+            law_embs.update(zip(missing, embeddings))
+        s.set_attributes(laws=len(celex_ids), encoded=len(missing))
+
+    results = []
+    for df, query_emb in zip(dfs, query_embs):
+        if df.empty:
+            results.append((df, {"candidates": 0, "kept": 0, **work_saved([], [])}))
+            continue
+
+        embs = np.stack([law_embs[celex_id] for celex_id in df['celex_id']])
+        scores = embs @ query_emb / (np.linalg.norm(embs, axis=1) * np.linalg.norm(query_emb))
+        ranked = df.assign(rerank_score=scores).sort_values('rerank_score', ascending=False, kind='stable')
+        kept = adaptive_cutoff(ranked['rerank_score'].tolist())
+
+        # Module 2 output is in fused order: its head is what would have been processed
+        saved = work_saved(df['celex_id'].head(BASELINE_LAWS).tolist(), ranked['celex_id'].head(kept).tolist())
+        report = {"candidates": len(ranked), "kept": kept, **saved}
+        for key, value in saved.items():
+            # Counters only grow: the extra work of a query keeping more laws is counted apart
+            REGISTRY.increment(f"rerank_saved_{key}", max(value, 0))
+            REGISTRY.increment(f"rerank_added_{key}", max(-value, 0))
+        results.append((ranked.head(kept), report))
+    return results
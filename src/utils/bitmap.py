@@ -0,0 +1,155 @@
+"""
+Compressed bitmaps of document ordinals and an inverted index of them.
+
+Bitmaps are pyroaring BitMaps (Roaring bitmaps: sorted runs and arrays per 64K block of
+ids). When pyroaring is not installed, SortedIds offers the same operations on a sorted
+numpy array of ids, so callers are written once against either.
+
+A BitmapIndex maps keys (EuroVoc concepts) to the bitmap of the documents having them;
+the documents matching a set of keys are the union or intersection of their bitmaps.
+"""
+import numpy as np
+
+try:
+    from pyroaring import BitMap
+except ImportError:
+    BitMap = None
+
+
+class SortedIds:
+    """
+    Set of document ordinals as a sorted uint32 array, with the operations of a BitMap.
+
+    Args:
+        values (iterable): Document ordinals, in any order and possibly repeated
+    """
+
+    __slots__ = ("ids",)
+
+    def __init__(self, values=()):
+        self.ids = np.unique(np.fromiter(values, dtype=np.uint32))
+
+    @classmethod
+    def _of(cls, ids):
+        bitmap = cls.__new__(cls)
+        bitmap.ids = ids
+        return bitmap
+
+    @classmethod
+    def union(cls, *bitmaps):
+        if not bitmaps:
+            return cls()
+        return cls._of(np.unique(np.concatenate([b.ids for b in bitmaps])))
+
+    @classmethod
+    def intersection(cls, *bitmaps):
+        if not bitmaps:
+            return cls()
+        ids = bitmaps[0].ids
+        for b in bitmaps[1:]:
+            ids = np.intersect1d(ids, b.ids, assume_unique=True)
+        return cls._of(ids)
+
+    def __and__(self, other):
+        return SortedIds.intersection(self, other)
+
+    def __or__(self, other):
+        return SortedIds.union(self, other)
+
+    def __contains__(self, value):
+        i = np.searchsorted(self.ids, value)
+        return bool(i < len(self.ids) and self.ids[i] == value)
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __repr__(self):
+        return f"SortedIds({len(self)} ids)"
+
+
+# Bitmap type used by this process
+Bitmap = BitMap if BitMap is not None else SortedIds
+
+
+def to_array(bitmap):
+    """Ordinals of a bitmap as a sorted int64 array"""
+    if isinstance(bitmap, SortedIds):
+        return bitmap.ids.astype(np.int64)
+    return np.fromiter(bitmap, dtype=np.int64, count=len(bitmap))
+
+
+class BitmapIndex:
+    """
+    Inverted index from keys to the bitmap of the documents having them.
+
+    Args:
+        bitmaps (dict): Key -> Bitmap of document ordinals
+        n_docs (int): Number of documents indexed
+    """
+
+    def __init__(self, bitmaps, n_docs):
+        self.bitmaps = bitmaps
+        self.n_docs = n_docs
+
+    @classmethod
+    def build(cls, keys_per_doc):
+        """
+        Index the keys of every document.
+
+        Args:
+            keys_per_doc (iterable): Keys of each document (a list, array or None), the
+                position of a document being its ordinal
+
+        Returns:
+            BitmapIndex: The index
+        """
+        postings = {}
+        n_docs = 0
+        for ordinal, keys in enumerate(keys_per_doc):
+            n_docs += 1
+            if keys is None:
+                continue
+            for key in keys:
+                postings.setdefault(str(key), []).append(ordinal)
+        return cls({key: Bitmap(ordinals) for key, ordinals in postings.items()}, n_docs)
+
+    def extended(self, keys_per_doc):
+        """
+        Index with documents appended, their ordinals following the indexed ones. Only the
+        bitmaps of their keys are copied, this index is left unchanged.
+
+        Args:
+            keys_per_doc (iterable): Keys of each new document (a list, array or None)
+
+        Returns:
+            BitmapIndex: The index of all the documents
+        """
+        added = BitmapIndex.build(keys_per_doc)
+        bitmaps = dict(self.bitmaps)
+        for key, bitmap in added.bitmaps.items():
+            shifted = Bitmap([ordinal + self.n_docs for ordinal in bitmap])
+            bitmaps[key] = bitmaps[key] | shifted if key in bitmaps else shifted
+        return BitmapIndex(bitmaps, self.n_docs + added.n_docs)
+
+    def get(self, key):
+        """Bitmap of the documents having a key (empty if none has it)"""
+        bitmap = self.bitmaps.get(str(key))
+        return bitmap if bitmap is not None else Bitmap()
+
+    def any(self, keys):
+        """Documents having at least one of the keys"""
+        return Bitmap.union(*(self.get(key) for key in keys))
+
+    def all(self, keys):
+        """Documents having every key"""
+        keys = list(keys)
+        if not keys:
+            return Bitmap()
+        # Smallest bitmaps first: the intersection only shrinks
+        return Bitmap.intersection(*sorted((self.get(key) for key in keys), key=len))
+
+    def __len__(self):
+        return len(self.bitmaps)
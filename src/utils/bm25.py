@@ -0,0 +1,313 @@
+"""
+BM25 index over short passages (articles and annexes) in numpy arrays.
+
+Passages are grouped (one group per law) and numbered consecutively, group by group.
+The postings of every term are stored in CSR form: doc_ids[offsets[t]:offsets[t + 1]]
+are the sorted passages containing term t and tfs the matching term frequencies. Scoring
+a query restricted to a set of passages costs one binary search per query term, so the
+sections of the candidate laws of a query are ranked in well under a millisecond.
+
+An index can also be one shard of a larger corpus: term_stats gives the statistics the
+shards sum up, and score/search accept the resulting global IDF and average length so
+every shard scores its passages as the whole corpus would.
+
+An index is saved as a directory of .npy arrays plus meta.json (vocabulary, group keys,
+parameters and caller metadata), replaced whole by every save.
+"""
+import os
+import re
+import json
+import shutil
+import tempfile
+from pathlib import Path
+from collections import Counter
+
+import numpy as np
+
+# Words too common in legal English to tell passages apart, left out of the postings
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in into is it its of on or such that the their
+there these this those to was were which with shall may any other all not no be been being
+""".split())
+
+_TOKEN = re.compile(r"\w+")
+
+# Reads of an index directory replaced by concurrent saves before giving up
+LOAD_ATTEMPTS = 5
+
+ARRAYS = ("offsets", "doc_ids", "tfs", "doc_lengths", "doc_chars", "group_offsets")
+
+
+def tokenize(text):
+    """Lowercase word tokens of a text, without stopwords and one-character tokens"""
+    return [token for token in _TOKEN.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 over groups of passages.
+
+    Args:
+        vocabulary (list): Term of every term id
+        offsets (np.ndarray): Start of the postings of every term id in doc_ids/tfs, plus the end
+        doc_ids (np.ndarray): Passage ids of the postings, sorted within every term
+        tfs (np.ndarray): Term frequencies of the postings
+        doc_lengths (np.ndarray): Tokens of every passage
+        doc_chars (np.ndarray): Characters of every passage, to check a passage is the one indexed
+        group_keys (list): Key of every group (a CELEX id)
+        group_offsets (np.ndarray): First passage of every group, plus the end
+        k1 (float): Term frequency saturation
+        b (float): Length normalization
+        metadata (dict): Caller data saved with the index
+    """
+
+    def __init__(self, vocabulary, offsets, doc_ids, tfs, doc_lengths, doc_chars, group_keys, group_offsets,
+                 k1=1.2, b=0.75, metadata=None):
+        self.vocabulary = vocabulary
+        self.term_ids = {term: i for i, term in enumerate(vocabulary)}
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.doc_chars = doc_chars
+        self.group_keys = group_keys
+        self.group_index = {key: i for i, key in enumerate(group_keys)}
+        self.group_offsets = group_offsets
+        self.k1 = k1
+        self.b = b
+        self.metadata = metadata or {}
+        self.avgdl = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @property
+    def n_docs(self):
+        return len(self.doc_lengths)
+
+    @property
+    def total_length(self):
+        """Tokens of all the passages"""
+        return int(self.doc_lengths.sum())
+
+    @classmethod
+    def build(cls, groups, k1=1.2, b=0.75, metadata=None):
+        """
+        Index groups of passages.
+
+        Args:
+            groups (iterable): (key, list of passage texts) pairs, the texts may be None
+            k1 (float): Term frequency saturation
+            b (float): Length normalization
+            metadata (dict): Caller data saved with the index
+
+        Returns:
+            BM25Index: The index
+        """
+        term_ids = {}
+        postings = []  # per term id: list of (doc id, tf)
+        doc_lengths, doc_chars, group_keys, group_offsets = [], [], [], [0]
+
+        for key, texts in groups:
+            for text in texts:
+                doc_id = len(doc_lengths)
+                tokens = tokenize(text or "")
+                for term, tf in Counter(tokens).items():
+                    term_id = term_ids.get(term)
+                    if term_id is None:
+                        term_id = term_ids[term] = len(postings)
+                        postings.append([])
+                    postings[term_id].append((doc_id, tf))
+                doc_lengths.append(len(tokens))
+                doc_chars.append(len(text or ""))
+            group_keys.append(key)
+            group_offsets.append(len(doc_lengths))
+
+        offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(p) for p in postings])
+        flat = [posting for term_postings in postings for posting in term_postings]
+        doc_ids = np.fromiter((d for d, _ in flat), dtype=np.int32, count=len(flat))
+        tfs = np.fromiter((min(tf, 65535) for _, tf in flat), dtype=np.uint16, count=len(flat))
+
+        return cls(list(term_ids), offsets, doc_ids, tfs, np.asarray(doc_lengths, dtype=np.int32),
+                   np.asarray(doc_chars, dtype=np.int32), group_keys, np.asarray(group_offsets, dtype=np.int64),
+                   k1=k1, b=b, metadata=metadata)
+
+    def save(self, directory):
+        """
+        Write the index to a directory, replaced whole: it is written to a sibling directory
+        moved into place, so processes saving the same index concurrently never mix their
+        arrays and readers never see a partial index.
+        """
+        directory = Path(directory)
+        directory.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix=f".{directory.name}.", dir=directory.parent))
+        try:
+            for name in ARRAYS:
+                np.save(tmp / f"{name}.npy", getattr(self, name))
+            meta = {"vocabulary": self.vocabulary, "group_keys": self.group_keys, "k1": self.k1, "b": self.b,
+                    "metadata": self.metadata}
+            (tmp / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+            os.chmod(tmp, 0o755)
+            try:
+                # Replaces a missing or empty directory
+                os.replace(tmp, directory)
+            except OSError:
+                # An index is there: move it aside, then move this one in
+                old = tmp.with_name(tmp.name + ".old")
+                try:
+                    os.replace(directory, old)
+                except FileNotFoundError:
+                    pass
+                try:
+                    os.replace(tmp, directory)
+                except OSError:
+                    # Another process saved its index in between: keep that one
+                    pass
+                shutil.rmtree(old, ignore_errors=True)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory, mmap=False):
+        """
+        Read an index written by save.
+
+        Args:
+            directory (Path): Directory of the index
+            mmap (bool): Memory-map the arrays (read-only, paged in on use) instead of reading them
+
+        Returns:
+            BM25Index: The index, or None if the directory holds no complete index
+        """
+        directory = Path(directory)
+        meta_path = directory / "meta.json"
+        mmap_mode = "r" if mmap else None
+        for _ in range(LOAD_ATTEMPTS):
+            if not meta_path.exists():
+                return None
+            try:
+                inode = directory.stat().st_ino
+                meta = json.loads(meta_path.read_text(encoding="utf-8"))
+                arrays = {name: np.load(directory / f"{name}.npy", mmap_mode=mmap_mode) for name in ARRAYS}
+                # Every save is a new directory: the same one before and after means one index was read
+                if directory.stat().st_ino == inode:
+                    break
+            except FileNotFoundError:
+                pass
+        else:
+            return None
+        return cls(meta["vocabulary"], group_keys=meta["group_keys"], k1=meta["k1"], b=meta["b"],
+                   metadata=meta.get("metadata"), **arrays)
+
+    def group_docs(self, key):
+        """Passage ids of a group, or None if the group is not indexed"""
+        i = self.group_index.get(key)
+        if i is None:
+            return None
+        return np.arange(self.group_offsets[i], self.group_offsets[i + 1])
+
+    def query_terms(self, query):
+        """Ids and IDF of the distinct indexed terms of a query"""
+        ids = sorted({self.term_ids[t] for t in tokenize(query) if t in self.term_ids})
+        ids = np.asarray(ids, dtype=np.int64)
+        df = (self.offsets[ids + 1] - self.offsets[ids]).astype(np.float64)
+        idf = np.log1p((self.n_docs - df + 0.5) / (df + 0.5))
+        return ids, idf
+
+    def term_stats(self, query):
+        """Document frequency of the distinct indexed terms of a query"""
+        stats = {}
+        for term in tokenize(query):
+            term_id = self.term_ids.get(term)
+            if term_id is not None:
+                stats[term] = int(self.offsets[term_id + 1] - self.offsets[term_id])
+        return stats
+
+    def _query_weights(self, query, idf=None):
+        """Ids and IDF of the query terms, the IDF given by term (global statistics) if any"""
+        if idf is None:
+            return self.query_terms(query)
+        terms = [term for term in idf if term in self.term_ids]
+        return (np.asarray([self.term_ids[term] for term in terms], dtype=np.int64),
+                np.asarray([idf[term] for term in terms], dtype=np.float64))
+
+    def _weights(self, tf, lengths, avgdl=None):
+        norm = self.k1 * (1 - self.b + self.b * lengths / ((avgdl or self.avgdl) or 1.0))
+        return tf * (self.k1 + 1) / (tf + norm)
+
+    def score(self, query, docs, idf=None, avgdl=None):
+        """
+        BM25 scores of indexed passages.
+
+        Args:
+            query (str): Query text
+            docs (np.ndarray): Sorted passage ids
+            idf (dict): IDF of the query terms, to use global statistics instead of the index's
+            avgdl (float): Average passage length, to use global statistics instead of the index's
+
+        Returns:
+            np.ndarray: Score of every passage of docs
+        """
+        docs = np.asarray(docs, dtype=np.int64)
+        scores = np.zeros(len(docs), dtype=np.float64)
+        if not len(docs):
+            return scores
+        lengths = self.doc_lengths[docs].astype(np.float64)
+        for term_id, term_idf in zip(*self._query_weights(query, idf)):
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            posting_docs = self.doc_ids[start:end]
+            # Positions of the requested passages in the postings of the term
+            found = np.searchsorted(posting_docs, docs)
+            hit = found < len(posting_docs)
+            hit[hit] = posting_docs[found[hit]] == docs[hit]
+            if hit.any():
+                tf = self.tfs[start + found[hit]].astype(np.float64)
+                scores[hit] += term_idf * self._weights(tf, lengths[hit], avgdl)
+        return scores
+
+    def search(self, query, k=1000, idf=None, avgdl=None):
+        """
+        Best passages of the whole index for a query.
+
+        Args:
+            query (str): Query text
+            k (int): Passages returned
+            idf (dict): IDF of the query terms, to use global statistics instead of the index's
+            avgdl (float): Average passage length, to use global statistics instead of the index's
+
+        Returns:
+            tuple: (passage ids, scores), best first, only passages containing a query term
+        """
+        scores = np.zeros(self.n_docs, dtype=np.float64)
+        for term_id, term_idf in zip(*self._query_weights(query, idf)):
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end].astype(np.float64)
+            # A passage appears once in the postings of a term
+            scores[docs] += term_idf * self._weights(tf, self.doc_lengths[docs].astype(np.float64), avgdl)
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(scores[matched], -k)[-k:]]
+        order = np.argsort(-scores[matched], kind="stable")
+        return matched[order], scores[matched[order]]
+
+    def score_texts(self, query, texts):
+        """
+        BM25 scores of passages that are not indexed, with the statistics of the index.
+
+        Args:
+            query (str): Query text
+            texts (list): Passage texts
+
+        Returns:
+            np.ndarray: Score of every text
+        """
+        ids, idf = self.query_terms(query)
+        terms = [self.vocabulary[i] for i in ids]
+        scores = np.zeros(len(texts), dtype=np.float64)
+        for j, text in enumerate(texts):
+            tokens = tokenize(text or "")
+            if not tokens:
+                continue
+            counts = Counter(tokens)
+            tf = np.asarray([counts.get(term, 0) for term in terms], dtype=np.float64)
+            scores[j] = float((idf * self._weights(tf, float(len(tokens)))).sum())
+        return scores
@@ -0,0 +1,117 @@
+"""
+Metadata encoded in CELEX ids, parsed once into typed arrays.
+
+A CELEX id such as 32014R0727 is the sector (3: legislation), the year (2014), the
+document type (R: regulation, L: directive, D: decision, ...) and a number. CelexMetadata
+keeps the sector, year and type of every law of a corpus in numpy arrays indexed by the
+position of the law, so the candidates of a query are filtered with vectorized masks.
+"""
+import re
+
+import numpy as np
+
+CELEX_PATTERN = re.compile(r"^([0-9CE])(\d{4})([A-Z]{1,2})")
+
+# Names of the document types of sector 3 (legislation), accepted by the doc_type filter
+DOC_TYPES = {"R": "regulation", "L": "directive", "D": "decision", "H": "recommendation", "A": "opinion"}
+_DOC_TYPE_CODES = {name: code for code, name in DOC_TYPES.items()}
+
+# Filters accepted by CelexMetadata.mask
+FILTERS = ("sector", "year", "doc_type")
+
+
+def parse_celex(celex_id):
+    """
+    Sector, year and document type of a CELEX id.
+
+    Returns:
+        tuple: (sector, year, doc_type), or None if the id is not in the CELEX format
+    """
+    match = CELEX_PATTERN.match(str(celex_id))
+    if match is None:
+        return None
+    return match.group(1), int(match.group(2)), match.group(3)
+
+
+def _values(value):
+    return [value] if isinstance(value, (str, int)) else list(value)
+
+
+class CelexMetadata:
+    """
+    Sector, year and document type of a corpus, one array element per law.
+
+    Args:
+        sectors (np.ndarray): Sector character of every law as uint8 (0 if unknown)
+        years (np.ndarray): Year of every law as int16 (0 if unknown)
+        doc_types (np.ndarray): Code of the document type of every law as uint8
+        doc_type_names (list): Document type of every code, "" (code 0) if unknown
+    """
+
+    def __init__(self, sectors, years, doc_types, doc_type_names):
+        self.sectors = sectors
+        self.years = years
+        self.doc_types = doc_types
+        self.doc_type_names = doc_type_names
+
+    @classmethod
+    def build(cls, celex_ids):
+        """Parse the CELEX ids of a corpus, in the order of the corpus"""
+        celex_ids = list(celex_ids)
+        sectors = np.zeros(len(celex_ids), dtype=np.uint8)
+        years = np.zeros(len(celex_ids), dtype=np.int16)
+        doc_types = np.zeros(len(celex_ids), dtype=np.uint8)
+        names = [""]
+        codes = {"": 0}
+        for i, celex_id in enumerate(celex_ids):
+            parsed = parse_celex(celex_id)
+            if parsed is None:
+                continue
+            sector, year, doc_type = parsed
+            sectors[i] = ord(sector)
+            years[i] = year
+            code = codes.get(doc_type)
+            if code is None:
+                code = codes[doc_type] = len(names)
+                names.append(doc_type)
+            doc_types[i] = code
+        return cls(sectors, years, doc_types, names)
+
+    def __len__(self):
+        return len(self.years)
+
+    def mask(self, ordinals, sector=None, year=None, doc_type=None):
+        """
+        Which laws pass the filters. A filter left to None accepts every law.
+
+        Args:
+            ordinals (np.ndarray): Positions of the laws in the corpus, -1 for unknown laws
+            sector (str or list): Sector(s) accepted, e.g. "3"
+            year (int or tuple): Year accepted, or (first, last) years, inclusive, either
+                of them None for an open range
+            doc_type (str or list): Document type(s) accepted, e.g. "R" or ["regulation", "L"]
+
+        Returns:
+            np.ndarray: Boolean mask aligned with ordinals (False for unknown laws)
+        """
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        known = ordinals >= 0
+        ordinals = np.where(known, ordinals, 0)
+        mask = known
+
+        if sector is not None:
+            codes = np.asarray([ord(str(s)) for s in _values(sector)], dtype=np.uint8)
+            mask = mask & np.isin(self.sectors[ordinals], codes)
+        if year is not None:
+            first, last = (year, year) if isinstance(year, int) else year
+            years = self.years[ordinals]
+            mask = mask & (years > 0)
+            if first is not None:
+                mask = mask & (years >= first)
+            if last is not None:
+                mask = mask & (years <= last)
+        if doc_type is not None:
+            wanted = {_DOC_TYPE_CODES.get(value.lower(), value) for value in _values(doc_type)}
+            codes = [code for code, name in enumerate(self.doc_type_names) if name in wanted]
+            mask = mask & np.isin(self.doc_types[ordinals], codes)
+        return mask
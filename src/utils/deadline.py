@@ -0,0 +1,75 @@
+"""
+Per-request latency budget and the degradations applied to stay within it.
+
+A Deadline is created when a request arrives and passed through the pipeline stages.
+Before a stage, the orchestrator compares the time left with the expected duration of
+the stages still to run (the p95 of their recent spans, or a default until enough of
+them were observed) and, when it is short, the stage runs in a cheaper mode: the
+rephrasing is skipped, fewer laws or sections are kept, only cached texts are used or
+the LLM context is reduced. Every degradation is recorded for the response.
+"""
+import os
+import time
+
+from src.utils.tracing import REGISTRY
+
+# Budget of a request when none is given, 0 for no deadline
+DEADLINE_SECONDS = float(os.environ.get("LEGALQA_DEADLINE_SECONDS", 60))
+
+# Expected seconds of every stage until MIN_SAMPLES of its spans were observed
+DEFAULT_STAGE_SECONDS = {
+    "module_1": 5.0,
+    "module_2": 0.5,
+    "rerank": 0.2,
+    "module_3": 3.0,
+    "module_4": 1.0,
+    "module_5": 10.0,
+}
+MIN_SAMPLES = 20
+
+
+def stage_estimate(stage):
+    """Expected duration of a stage in seconds: the p95 of its recent spans"""
+    if REGISTRY.count(stage) < MIN_SAMPLES:
+        return DEFAULT_STAGE_SECONDS.get(stage, 0.0)
+    return REGISTRY.quantiles(stage, (0.95,))[0.95]
+
+
+class Deadline:
+    """
+    Time budget of one request.
+
+    Args:
+        seconds (float): Budget from now, None (or 0) for no deadline
+    """
+
+    def __init__(self, seconds=None):
+        self.seconds = seconds or None
+        self.expires = time.monotonic() + seconds if seconds else None
+        self.degradations = []
+
+    @classmethod
+    def from_env(cls):
+        """Deadline of LEGALQA_DEADLINE_SECONDS from now"""
+        return cls(DEADLINE_SECONDS)
+
+    def remaining(self):
+        """Seconds left, infinite without a deadline"""
+        if self.expires is None:
+            return float("inf")
+        return self.expires - time.monotonic()
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def short_for(self, stages):
+        """Whether the time left is less than the expected duration of the stages"""
+        if self.expires is None:
+            return False
+        return self.remaining() < sum(stage_estimate(stage) for stage in stages)
+
+    def degrade(self, name, **details):
+        """Record a degradation applied to the request"""
+        remaining_ms = round(self.remaining() * 1000) if self.expires is not None else None
+        self.degradations.append({"degradation": name, "remaining_ms": remaining_ms, **details})
+        REGISTRY.increment(f"deadline_degraded_{name}")
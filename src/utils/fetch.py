@@ -0,0 +1,275 @@
+import time
+import threading
+
+import requests
+
+from src.utils.singleflight import SingleFlight
+from src.utils.tracing import REGISTRY
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting the rate of upstream requests.
+
+    Args:
+        rate (float): Tokens added per second (requests per second), 0 or None for no limit
+        burst (int): Maximum tokens stored, the number of requests allowed back to back
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1):
+        """
+        Block until the tokens are available and take them.
+
+        Returns:
+            float: Seconds spent waiting
+        """
+        if not self.rate:
+            return 0.0
+
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def try_acquire(self, tokens=1):
+        """Take the tokens if they are available right now, without waiting"""
+        if not self.rate:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+
+class FetchError(Exception):
+    """A document could not be fetched"""
+
+
+class CircuitOpenError(FetchError):
+    """The upstream is considered unhealthy, the request was not sent"""
+
+
+class SchedulerSaturatedError(FetchError):
+    """Too many requests are waiting for the upstream, the request was not queued"""
+
+
+class CircuitBreaker:
+    """
+    Stop calling an upstream after consecutive failures, and probe it again later.
+
+    Closed: requests go through. After failure_threshold consecutive failures the circuit
+    opens and requests fail fast. Once reset_timeout seconds have passed one probe request
+    is let through (half open): its success closes the circuit, its failure opens it again.
+
+    Args:
+        failure_threshold (int): Consecutive failures opening the circuit
+        reset_timeout (float): Seconds before an open circuit lets a probe through
+        name (str): Prefix of the circuit state gauge
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, name="fetch"):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        self.state = state
+        REGISTRY.set_gauge(f"{self.name}_circuit_open", 0 if state == self.CLOSED else 1)
+
+    def rejecting(self):
+        """Whether requests are failing fast right now, without changing the state"""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self._opened_at < self.reset_timeout
+            return self.state == self.HALF_OPEN
+
+    def allow(self):
+        """Whether a request may be sent now (an open circuit past its timeout lets one probe through)"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Let this one request probe the upstream
+                self._set_state(self.HALF_OPEN)
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    REGISTRY.increment(f"{self.name}_circuit_opened")
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+
+class FetchScheduler:
+    """
+    Shared client of one upstream: rate limit, concurrency limit, retries, circuit breaker.
+
+    - Identical requests in flight at the same time are sent once (SingleFlight).
+    - At most max_concurrency requests are sent at once, at most `rate` per second.
+    - Callers waiting for a slot are bounded by max_queue and max_wait: beyond them
+      SchedulerSaturatedError is raised at once instead of piling up requests.
+    - 429 and 5xx answers, timeouts and connection errors are retried with backoff (or the
+      Retry-After delay), then count as one failure of the circuit breaker. While the
+      circuit is open CircuitOpenError is raised without calling the upstream.
+
+    Queue depth, in-flight requests and outcomes are exported as <name>_* metrics.
+
+    Args:
+        rate (float): Requests per second, 0 or None for no limit
+        burst (int): Requests allowed back to back by the rate limit
+        max_concurrency (int): Requests sent at the same time
+        max_queue (int): Callers waiting for a slot, None for no bound
+        max_wait (float): Seconds a caller waits for a slot, None to wait indefinitely
+        timeout (float): Seconds before a request is abandoned
+        retries (int): Retries of a failed request
+        breaker (CircuitBreaker): Circuit breaker of the upstream, None for none
+        name (str): Prefix of the metrics
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, rate=5.0, burst=5, max_concurrency=4, max_queue=32, max_wait=10.0, timeout=20.0, retries=2,
+                 breaker=None, name="fetch"):
+        self.bucket = TokenBucket(rate, burst=burst)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.retries = retries
+        self.breaker = breaker
+        self.name = name
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._flight = SingleFlight(name=name)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._in_flight = 0
+
+    def _session(self):
+        """One requests session (connection pool) per calling thread"""
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _gauges(self):
+        REGISTRY.set_gauge(f"{self.name}_queue_depth", self._waiting)
+        REGISTRY.set_gauge(f"{self.name}_in_flight", self._in_flight)
+
+    def get(self, url, headers=None):
+        """
+        GET a URL through the scheduler.
+
+        Returns:
+            requests.Response: The response, of any status other than the retryable ones
+                               (RETRY_STATUSES)
+
+        Raises:
+            CircuitOpenError: The circuit breaker is open
+            SchedulerSaturatedError: Too many callers are waiting already
+            FetchError: The request failed after its retries: a connection error, or a
+                        retryable status whose last response is the .response attribute
+        """
+        key = (url, tuple(sorted((headers or {}).items())))
+        response, _ = self._flight.do(key, self._get, url, headers)
+        return response
+
+    def _reject_open_circuit(self, url):
+        REGISTRY.increment(f"{self.name}_rejected_circuit_open")
+        raise CircuitOpenError(f"Circuit open, not calling {url}")
+
+    def _get(self, url, headers):
+        # Fail fast before queueing while the circuit is open
+        if self.breaker is not None and self.breaker.rejecting():
+            self._reject_open_circuit(url)
+
+        with self._lock:
+            if self.max_queue is not None and self._waiting >= self.max_queue:
+                REGISTRY.increment(f"{self.name}_rejected_saturated")
+                raise SchedulerSaturatedError(f"{self._waiting} requests already waiting, not calling {url}")
+            self._waiting += 1
+            self._gauges()
+        acquired = self._slots.acquire(timeout=self.max_wait)
+        with self._lock:
+            self._waiting -= 1
+            if acquired:
+                self._in_flight += 1
+            self._gauges()
+        if not acquired:
+            REGISTRY.increment(f"{self.name}_rejected_saturated")
+            raise SchedulerSaturatedError(f"No slot within {self.max_wait}s, not calling {url}")
+
+        try:
+            if self.breaker is not None and not self.breaker.allow():
+                self._reject_open_circuit(url)
+            return self._send(url, headers)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._gauges()
+            self._slots.release()
+
+    def _send(self, url, headers):
+        """Send a request with retries, reporting the outcome to the circuit breaker"""
+        error, retry_after = None, None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                REGISTRY.increment(f"{self.name}_retries")
+                time.sleep(min(retry_after, 30.0) if retry_after is not None else min(0.5 * 2 ** attempt, 10.0))
+            self.bucket.acquire()
+            try:
+                response = self._session().get(url, headers=headers, timeout=self.timeout, allow_redirects=True)
+            except requests.RequestException as e:
+                error, retry_after = FetchError(f"{type(e).__name__}: {e}"), None
+                continue
+
+            if response.status_code not in self.RETRY_STATUSES:
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                return response
+
+            header = response.headers.get("Retry-After", "")
+            error = FetchError(f"HTTP {response.status_code}")
+            error.response = response
+            retry_after = float(header) if header.isdigit() else None
+
+        REGISTRY.increment(f"{self.name}_failures")
+        if self.breaker is not None:
+            self.breaker.record_failure()
+        raise error
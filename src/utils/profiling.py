@@ -0,0 +1,164 @@
+"""
+On-demand profiles of single requests, written next to their trace id.
+
+A request is profiled when its caller asks for it (the X-Profile header of the HTTP
+API, --profile of batch.py, profile=True of process_legal_query) or, for the others,
+with probability LEGALQA_PROFILE_SAMPLE_RATE (0 by default). Two profilers are available
+(LEGALQA_PROFILE_MODE, or the value of the header):
+
+- sampling: a background thread records the stack of the request's thread every
+  LEGALQA_PROFILE_INTERVAL_MS (5) ms. Written as cache/profiles/<trace_id>.collapsed, one
+  "frame;frame;... count" line per distinct stack, the input of flamegraph.pl and
+  speedscope. Cheap enough for production traffic.
+- cprofile: every Python call of the request's thread is timed by cProfile. Written as
+  cache/profiles/<trace_id>.prof (pstats, snakeviz) plus the top functions as text. Exact
+  call counts, but slows the request down several times.
+
+Only the thread running the pipeline is profiled: a query coalesced with another one
+shows the time spent waiting for it. A request that is not profiled costs one random draw.
+"""
+import os
+import sys
+import time
+import random
+import cProfile
+import pstats
+import threading
+from pathlib import Path
+from collections import Counter
+from contextlib import contextmanager
+
+PROFILE_DIR = Path(os.environ.get("LEGALQA_PROFILE_DIR", Path(__file__).parent.parent.parent / "cache" / "profiles"))
+
+# Fraction of the requests profiled without being asked for
+PROFILE_SAMPLE_RATE = float(os.environ.get("LEGALQA_PROFILE_SAMPLE_RATE", 0))
+
+PROFILE_MODES = ("sampling", "cprofile")
+PROFILE_MODE = os.environ.get("LEGALQA_PROFILE_MODE", "sampling")
+
+# Milliseconds between two stack samples
+PROFILE_INTERVAL_MS = float(os.environ.get("LEGALQA_PROFILE_INTERVAL_MS", 5))
+
+# Functions listed in the text summary of a cProfile profile
+SUMMARY_FUNCTIONS = 40
+
+
+def profile_mode(requested):
+    """
+    Profiler asked for by a request flag or header value, None if not profiled.
+
+    Args:
+        requested: True or "1" for the default profiler, a name of PROFILE_MODES, or a
+            false value ("", "0", None, False) to leave the choice to the sample rate
+
+    Returns:
+        str or None: The profiler
+    """
+    if requested in (None, False, "", "0", "false", "off"):
+        if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            return PROFILE_MODE
+        return None
+    if requested in (True, "1", "true", "on"):
+        return PROFILE_MODE
+    if requested not in PROFILE_MODES:
+        raise ValueError(f"Unknown profiler {requested!r}, expected one of {PROFILE_MODES}")
+    return requested
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+def collapse(frame):
+    """Collapsed stack of a frame, outermost first"""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """
+    Sample the stack of one thread from a background thread.
+
+    Args:
+        thread_id (int): Identifier of the sampled thread
+        interval (float): Seconds between two samples
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL_MS / 1000):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="legalqa-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+            del frame
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        """Write the samples in collapsed-stack format"""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+@contextmanager
+def request_profile(request_span, mode):
+    """
+    Profile the calling thread while the block runs, and write the profile under the
+    trace id of the request. The path is set as the "profile" attribute of the span.
+
+    Args:
+        request_span (Span): Root span of the request
+        mode (str): One of PROFILE_MODES, or None not to profile
+
+    Yields:
+        None
+    """
+    if mode is None:
+        yield
+        return
+
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    if mode == "sampling":
+        profiler = StackSampler(threading.get_ident())
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active (one at a time from Python 3.12): sample instead
+            mode, profiler = "sampling", StackSampler(threading.get_ident())
+            profiler.start()
+    try:
+        yield
+    finally:
+        if mode == "sampling":
+            profiler.stop()
+            path = PROFILE_DIR / f"{request_span.trace_id}.collapsed"
+            profiler.write(path)
+            request_span.set_attributes(profile=str(path), profile_samples=sum(profiler.stacks.values()))
+        else:
+            profiler.disable()
+            path = PROFILE_DIR / f"{request_span.trace_id}.prof"
+            profiler.dump_stats(path)
+            with open(path.with_suffix(".txt"), "w", encoding="utf-8") as f:
+                pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(SUMMARY_FUNCTIONS)
+            request_span.set_attributes(profile=str(path))
+        print(f"Profile of trace {request_span.trace_id} ({mode}, "
+              f"{time.perf_counter() - start:.2f} s) written to {path}")
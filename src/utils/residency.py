@@ -0,0 +1,109 @@
+"""
+Residency of the retrieval indices: how their files are brought into memory.
+
+LEGALQA_INDEX_RESIDENCY selects one of three policies for the module 2 indices:
+
+- disk: the files are read on demand (Terrier's default file access, numpy arrays
+  memory-mapped and left untouched), the first queries after a deploy hit the disk
+- mmap: the same files, memory-mapped and every page touched once at startup, so they
+  start in the page cache (shared by the processes of a node, evictable under pressure)
+- memory: the indices are copied into the process heap at startup (Terrier's in-memory
+  data structures, numpy arrays read whole), never evicted but not shared either
+
+benchmarks/residency.py reports the tail latency and RSS of each policy.
+"""
+import os
+import mmap
+from pathlib import Path
+
+import numpy as np
+
+from src.utils.bm25 import BM25Index
+from src.utils.tracing import span
+
+POLICIES = ("disk", "mmap", "memory")
+
+RESIDENCY = os.environ.get("LEGALQA_INDEX_RESIDENCY", "disk")
+
+
+def check_policy(policy):
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown index residency {policy!r}, expected one of {POLICIES}")
+    return policy
+
+
+def index_files(*directories):
+    """Files of index directories, recursively"""
+    return [path for directory in directories for path in sorted(Path(directory).rglob("*")) if path.is_file()]
+
+
+def touch_pages(paths):
+    """
+    Read one byte of every page of files through a memory map, so their pages are in the
+    page cache when the first query arrives.
+
+    Returns:
+        int: Bytes touched
+    """
+    touched = 0
+    for path in paths:
+        size = os.path.getsize(path)
+        if size == 0:
+            continue
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, "madvise"):
+                mapped.madvise(mmap.MADV_WILLNEED)
+            # Strided read of the mapping: one byte per page, faulted in by the kernel
+            int(np.frombuffer(mapped, dtype=np.uint8)[::mmap.PAGESIZE].sum())
+        touched += size
+    return touched
+
+
+def evict_pages(paths):
+    """Drop files from the page cache (where the kernel supports it), for cold-start measurements"""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def open_terrier_index(pt, directory, policy=RESIDENCY):
+    """
+    Open a Terrier index with a residency policy.
+
+    Args:
+        pt (module): pyterrier, started
+        directory (Path): Index directory
+        policy (str): One of POLICIES
+
+    Returns:
+        The Terrier index
+    """
+    check_policy(policy)
+    directory = str(Path(directory).absolute())
+    if policy == "memory":
+        return pt.IndexFactory.of(directory, memory=True)
+    index = pt.IndexFactory.of(directory)
+    if policy == "mmap":
+        with span("index.touch_pages", index=Path(directory).name) as s:
+            s.set_attributes(bytes=touch_pages(index_files(directory)))
+    return index
+
+
+def load_bm25_index(directory, policy=RESIDENCY):
+    """
+    Load a BM25Index with a residency policy.
+
+    Returns:
+        BM25Index: The index, or None if the directory holds no complete index
+    """
+    check_policy(policy)
+    index = BM25Index.load(directory, mmap=policy != "memory")
+    if index is not None and policy == "mmap":
+        with span("index.touch_pages", index=Path(directory).name) as s:
+            s.set_attributes(bytes=touch_pages(index_files(directory)))
+    return index
@@ -0,0 +1,315 @@
+"""
+Corpus partitioned into BM25 shards, searched concurrently by local worker processes.
+
+Every law goes to one shard, by a hash of its CELEX id or by its CELEX sector, and every
+shard is a BM25Index of its own directory. A query is answered in two rounds sent to all
+the shards at once: the shards first return their document count, total length and the
+document frequency of the query terms, which the coordinator sums into the statistics of
+the whole corpus (IDF and average length); they then score their laws with those global
+statistics and return their top k, merged into the top k of the corpus. The scores are
+the ones a single index of the corpus would give, whatever the partition.
+
+Each shard is served by a worker process holding its index, so the shards are scored in
+parallel and a shard could later move to another machine behind the same two messages.
+"""
+import json
+import heapq
+import hashlib
+import threading
+import multiprocessing
+from pathlib import Path
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from src.utils.bm25 import BM25Index
+from src.utils.celex import parse_celex
+from src.utils.residency import RESIDENCY, check_policy, load_bm25_index
+from src.utils.tracing import span
+
+PARTITIONS = ("hash", "sector")
+
+
+def shard_of(celex_id, n_shards, partition="hash"):
+    """
+    Shard of a law.
+
+    Args:
+        celex_id (str): CELEX id of the law
+        n_shards (int): Number of shards
+        partition (str): "hash" spreads the laws evenly, "sector" keeps the laws of a CELEX
+            sector together (uneven: most laws are legislation)
+
+    Returns:
+        int: Shard number
+    """
+    if partition not in PARTITIONS:
+        raise ValueError(f"Unknown partition {partition!r}, expected one of {PARTITIONS}")
+    key = str(celex_id)
+    if partition == "sector":
+        parsed = parse_celex(celex_id)
+        key = parsed[0] if parsed else ""
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest(), 16) % n_shards
+
+
+def build_shards(docs, root, n_shards, partition="hash"):
+    """
+    Index a corpus as shards.
+
+    Args:
+        docs (iterable): (celex_id, text) pairs
+        root (str or Path): Directory of the shards, written as shard_<i>/ plus manifest.json
+        n_shards (int): Number of shards
+        partition (str): One of PARTITIONS
+
+    Returns:
+        list: Laws of every shard
+    """
+    root = Path(root)
+    groups = [[] for _ in range(n_shards)]
+    for celex_id, text in docs:
+        groups[shard_of(celex_id, n_shards, partition)].append((celex_id, [text]))
+    for i, group in enumerate(groups):
+        BM25Index.build(group).save(root / f"shard_{i}")
+    sizes = [len(group) for group in groups]
+    # The manifest last: shards without it are incomplete and are rebuilt
+    (root / "manifest.json").write_text(json.dumps({"n_shards": n_shards, "partition": partition, "laws": sizes}),
+                                        encoding="utf-8")
+    return sizes
+
+
+def read_manifest(root):
+    """Manifest of the shards of a directory, or None if there are no complete shards"""
+    path = Path(root) / "manifest.json"
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _stats(index, queries):
+    """Round 1: the statistics of a shard for the queries"""
+    return index.n_docs, index.total_length, [index.term_stats(query) for query in queries]
+
+
+def top_laws(index, queries, k, candidates=None, idfs=None, avgdl=None):
+    """
+    Top k laws of an index of one passage per law for every query.
+
+    Args:
+        index (BM25Index): The index, a group per law
+        queries (list): Query texts
+        k (int): Laws returned per query
+        candidates (list): Per query, the CELEX ids to score (None for all the laws)
+        idfs (list): Per query, the IDF by term of global statistics (None for the index's)
+        avgdl (float): Average law length of global statistics (None for the index's)
+
+    Returns:
+        list: Per query, (CELEX ids, scores) of the laws containing a query term, best first
+    """
+    results = []
+    for q, query in enumerate(queries):
+        idf = idfs[q] if idfs is not None else None
+        if candidates is None or candidates[q] is None:
+            docs, scores = index.search(query, k, idf=idf, avgdl=avgdl)
+        else:
+            # One passage per law: the passage id is the position of the law in the shard
+            docs = np.asarray(sorted(index.group_index[c] for c in set(candidates[q]) if c in index.group_index),
+                              dtype=np.int64)
+            scores = index.score(query, docs, idf=idf, avgdl=avgdl)
+            matched = scores > 0
+            docs, scores = docs[matched], scores[matched]
+            if len(docs) > k:
+                top = np.argpartition(scores, -k)[-k:]
+                docs, scores = docs[top], scores[top]
+            # Best first, as search returns them
+            order = np.argsort(-scores, kind="stable")
+            docs, scores = docs[order], scores[order]
+        results.append(([index.group_keys[d] for d in docs], scores.tolist()))
+    return results
+
+
+def _search(index, queries, idfs, avgdl, k, candidates):
+    """Round 2: the top k laws of a shard for every query, scored with the global statistics"""
+    return top_laws(index, queries, k, candidates, idfs, avgdl)
+
+
+_OPERATIONS = {"stats": _stats, "search": _search}
+
+
+def _serve(directory, conn, residency):
+    """Worker process: load one shard and answer the coordinator until it sends None"""
+    index = load_bm25_index(directory, residency)
+    conn.send(index is not None)
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        operation, args = message
+        try:
+            conn.send((True, _OPERATIONS[operation](index, *args)))
+        except Exception as e:
+            conn.send((False, repr(e)))
+    conn.close()
+
+
+class ShardedIndex:
+    """
+    Coordinator of the shards of a directory written by build_shards.
+
+    Args:
+        root (str or Path): Directory of the shards
+        processes (bool): Serve every shard from a worker process (scored in parallel),
+            or keep the shards in this process and score them one after the other
+        residency (str): How the shards are loaded, one of src.utils.residency.POLICIES
+    """
+
+    def __init__(self, root, processes=True, residency=RESIDENCY):
+        self.root = Path(root)
+        self.residency = check_policy(residency)
+        manifest = read_manifest(self.root)
+        if manifest is None:
+            raise FileNotFoundError(f"No shards in {self.root}")
+        self.n_shards = manifest["n_shards"]
+        self.partition = manifest["partition"]
+        self.processes = processes
+        # One query batch at a time goes through the workers' pipes
+        self._lock = threading.Lock()
+        self._indices, self._workers, self._conns = [], [], []
+
+        directories = [self.root / f"shard_{i}" for i in range(self.n_shards)]
+        if not processes:
+            self._indices = [load_bm25_index(directory, residency) for directory in directories]
+            return
+        # Spawned, not forked: the parent may hold a JVM or threads
+        context = multiprocessing.get_context("spawn")
+        for directory in directories:
+            conn, child = context.Pipe()
+            worker = context.Process(target=_serve, args=(str(directory), child, residency), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+            self._conns.append(conn)
+        try:
+            loaded = [conn.recv() for conn in self._conns]
+        except EOFError:
+            self.close()
+            raise RuntimeError(f"A shard worker of {self.root} exited while starting")
+        if not all(loaded):
+            self.close()
+            raise FileNotFoundError(f"Incomplete shards in {self.root}")
+
+    def _call(self, operation, *args):
+        """Run an operation on every shard, concurrently with worker processes"""
+        with self._lock:
+            if not self.processes:
+                return [_OPERATIONS[operation](index, *args) for index in self._indices]
+            for conn in self._conns:
+                conn.send((operation, args))
+            replies = [conn.recv() for conn in self._conns]
+        for ok, result in replies:
+            if not ok:
+                raise RuntimeError(f"Shard {operation} failed: {result}")
+        return [result for _, result in replies]
+
+    def global_stats(self, queries):
+        """
+        Statistics of the whole corpus for the queries, summed over the shards.
+
+        Returns:
+            tuple: (IDF by term of every query, average law length)
+        """
+        stats = self._call("stats", list(queries))
+        n_docs = sum(n for n, _, _ in stats)
+        avgdl = sum(length for _, length, _ in stats) / max(n_docs, 1)
+        idfs = []
+        for q in range(len(queries)):
+            df = Counter()
+            for _, _, per_query in stats:
+                df.update(per_query[q])
+            idfs.append({term: float(np.log1p((n_docs - f + 0.5) / (f + 0.5))) for term, f in df.items()})
+        return idfs, avgdl
+
+    def search(self, queries, k=1000, candidates=None):
+        """
+        Top k laws of the corpus for every query.
+
+        Args:
+            queries (list): Query texts
+            k (int): Laws returned per query
+            candidates (list): Per query, the CELEX ids to score (None for the whole corpus)
+
+        Returns:
+            list: Per query, (celex_id, score) pairs best first
+        """
+        queries = list(queries)
+        with span("shards.stats", shards=self.n_shards, queries=len(queries)):
+            idfs, avgdl = self.global_stats(queries)
+        with span("shards.search", shards=self.n_shards, queries=len(queries)):
+            replies = self._call("search", queries, idfs, avgdl, k, candidates)
+        rankings = []
+        for q in range(len(queries)):
+            hits = ((score, key) for keys, scores in (reply[q] for reply in replies) for key, score in zip(keys, scores))
+            rankings.append([(key, score) for score, key in heapq.nlargest(k, hits)])
+        return rankings
+
+    def close(self):
+        """Stop the worker processes"""
+        for conn in self._conns:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for worker in self._workers:
+            worker.join(timeout=5)
+        self._workers, self._conns = [], []
+
+
+class LocalIndex:
+    """
+    Index of one passage per law held by this process, searched like a ShardedIndex.
+
+    Args:
+        index (BM25Index): The index, a group per law
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def search(self, queries, k=1000, candidates=None):
+        """Top k laws for every query: per query, (celex_id, score) pairs best first"""
+        return [list(zip(keys, scores)) for keys, scores in top_laws(self.index, list(queries), k, candidates)]
+
+
+class LawRetriever:
+    """
+    Sharded or local index with the transform interface of a PyTerrier retriever.
+
+    Args:
+        index (ShardedIndex or LocalIndex): The laws
+        num_results (int): Laws returned per query
+    """
+
+    def __init__(self, index, num_results=1000):
+        self.index = index
+        self.num_results = num_results
+
+    def transform(self, queries):
+        """
+        Rank the laws for a dataframe of queries (qid, query), or score the given laws of a
+        dataframe of (qid, query, docno) candidates.
+
+        Returns:
+            pd.DataFrame: qid, docno, rank, score and query of every retrieved law
+        """
+        if "docno" in queries.columns:
+            grouped = queries.groupby("qid", sort=False)
+            qids = list(grouped.groups)
+            texts = [group["query"].iloc[0] for _, group in grouped]
+            candidates = [group["docno"].tolist() for _, group in grouped]
+        else:
+            qids, texts, candidates = queries["qid"].tolist(), queries["query"].tolist(), None
+        rankings = self.index.search(texts, self.num_results, candidates)
+        rows = [{"qid": qid, "docno": docno, "rank": rank, "score": score, "query": text}
+                for qid, text, ranking in zip(qids, texts, rankings)
+                for rank, (docno, score) in enumerate(ranking)]
+        return pd.DataFrame(rows, columns=["qid", "docno", "rank", "score", "query"])
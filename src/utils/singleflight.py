@@ -0,0 +1,126 @@
+import threading
+
+from src.utils.tracing import REGISTRY
+
+
+class _Call:
+    """One in-flight execution and the callers waiting for it"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one execution.
+
+    The first caller of a key runs the function; callers arriving while it runs wait
+    and get the same result (or exception) instead of running it again. Nothing is
+    cached once the call returns.
+
+    Args:
+        name (str): Prefix of the metrics: '<name>_calls' executions and
+            '<name>_deduplicated' calls answered by another caller's execution.
+            Without a name no metric is exported.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def _join(self, keys, repeated=0):
+        """
+        Register distinct keys: (keys to run with their calls, keys to wait for with their
+        calls). repeated callers of the same keys are counted as deduplicated.
+        """
+        led, followed = [], []
+        with self._lock:
+            for key in keys:
+                call = self._calls.get(key)
+                if call is None:
+                    call = self._calls[key] = _Call()
+                    led.append((key, call))
+                else:
+                    followed.append((key, call))
+            self.shared += len(followed) + repeated
+        if self.name is not None:
+            if led:
+                REGISTRY.increment(f"{self.name}_calls", len(led))
+            if followed or repeated:
+                REGISTRY.increment(f"{self.name}_deduplicated", len(followed) + repeated)
+        return led, followed
+
+    def _finish(self, led):
+        with self._lock:
+            for key, _ in led:
+                del self._calls[key]
+        for _, call in led:
+            call.done.set()
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) unless a call with the same key is already running.
+
+        Returns:
+            tuple: (result, shared), shared is True if the result comes from another caller's run
+        """
+        led, followed = self._join([key])
+        if followed:
+            return followed[0][1].wait(), True
+
+        call = led[0][1]
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(led)
+
+    def do_many(self, keys, fn):
+        """
+        Run fn once for the distinct keys that are not already running, and wait for the others.
+        Repeated keys are run once.
+
+        Args:
+            keys (list): Keys of the calls
+            fn (callable): fn(keys) -> list of results aligned with the keys it is given
+
+        Returns:
+            dict: key -> (result, shared) for every distinct key
+        """
+        distinct = list(dict.fromkeys(keys))
+        led, followed = self._join(distinct, repeated=len(keys) - len(distinct))
+        outcomes = {}
+        try:
+            if led:
+                results = fn([key for key, _ in led])
+                for (key, call), result in zip(led, results):
+                    call.result = result
+                    outcomes[key] = (result, False)
+        except BaseException as e:
+            for _, call in led:
+                call.error = e
+            raise
+        finally:
+            self._finish(led)
+
+        for key, call in followed:
+            outcomes[key] = (call.wait(), True)
+        return outcomes
+
+    def in_flight(self):
+        """Number of keys being executed"""
+        with self._lock:
+            return len(self._calls)
@@ -0,0 +1,321 @@
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Number of recent observations kept per histogram to compute the quantiles
+RESERVOIR_SIZE = 4096
+QUANTILES = (0.5, 0.95, 0.99)
+METRIC_PREFIX = "legalqa"
+
+_current_span = contextvars.ContextVar("legalqa_current_span", default=None)
+
+_metrics_server = None
+_metrics_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+
+class Span:
+    """A timed unit of work with free-form attributes (cache hits, sizes, tokens...)"""
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, attributes: Optional[dict] = None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self._start_perf = time.perf_counter()
+        self.duration = None
+        self.error = None
+        # Finished spans of the whole trace, only filled on the root span
+        self.finished = [] if parent is None else None
+
+    @property
+    def root(self) -> "Span":
+        span = self
+        while span.parent is not None:
+            span = span.parent
+        return span
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def increment(self, key: str, amount: int = 1) -> None:
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class MetricsRegistry:
+    """Thread-safe store of span latency histograms, counters and gauges"""
+
+    def __init__(self, reservoir_size: int = RESERVOIR_SIZE):
+        self.reservoir_size = reservoir_size
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = {"values": deque(maxlen=self.reservoir_size), "count": 0, "sum": 0.0}
+                self._histograms[name] = hist
+            hist["values"].append(value)
+            hist["count"] += 1
+            hist["sum"] += value
+
+    def increment(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def count(self, name: str) -> int:
+        """Observations of a histogram"""
+        with self._lock:
+            hist = self._histograms.get(name)
+            return hist["count"] if hist else 0
+
+    def quantiles(self, name: str, quantiles=QUANTILES) -> Dict[float, float]:
+        with self._lock:
+            hist = self._histograms.get(name)
+            values = sorted(hist["values"]) if hist else []
+        return {q: _quantile(values, q) for q in quantiles}
+
+    def snapshot(self) -> dict:
+        """Return a JSON-serialisable view of all the metrics"""
+        with self._lock:
+            histograms = {k: (sorted(v["values"]), v["count"], v["sum"]) for k, v in self._histograms.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        return {
+            "histograms": {
+                name: {
+                    "count": count,
+                    "sum": total,
+                    **{f"p{int(q * 100)}": _quantile(values, q) for q in QUANTILES},
+                }
+                for name, (values, count, total) in histograms.items()
+            },
+            "counters": counters,
+            "gauges": gauges,
+        }
+
+    def render_prometheus(self) -> str:
+        """Render the metrics in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = []
+
+        metric = f"{METRIC_PREFIX}_span_duration_seconds"
+        lines.append(f"# HELP {metric} Latency of the pipeline spans.")
+        lines.append(f"# TYPE {metric} summary")
+        for name, hist in sorted(snapshot["histograms"].items()):
+            label = _escape_label(name)
+            for q in QUANTILES:
+                lines.append(f'{metric}{{span="{label}",quantile="{q}"}} {hist[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'{metric}_sum{{span="{label}"}} {hist["sum"]:.6f}')
+            lines.append(f'{metric}_count{{span="{label}"}} {hist["count"]}')
+
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = f"{METRIC_PREFIX}_{_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+
+        for name, value in sorted(snapshot["gauges"].items()):
+            metric = f"{METRIC_PREFIX}_{_metric_name(name)}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def _metric_name(name: str) -> str:
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _emit_json_log(span: Span) -> None:
+    """Write the finished span as one JSON line if LEGALQA_TRACE_LOG is set ('-' for stderr)"""
+    destination = os.environ.get("LEGALQA_TRACE_LOG")
+    if not destination:
+        return
+
+    line = json.dumps(span.to_dict(), default=str, ensure_ascii=False)
+    with _log_lock:
+        if destination == "-":
+            sys.stderr.write(line + "\n")
+        else:
+            with open(destination, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a block of code as a span of the current trace.
+
+    A span opened with no active parent starts a new trace. On exit the duration is
+    recorded in the latency histogram of the span name and the span is emitted as a
+    JSON log line.
+
+    Args:
+        name (str): Name of the span, e.g. "module_3" or "module_3.http_fetch"
+        **attributes: Initial attributes of the span
+
+    Yields:
+        Span: The span, so attributes can be added while it runs
+    """
+    parent = _current_span.get()
+    current = Span(name, parent=parent, attributes=attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current.duration = time.perf_counter() - current._start_perf
+        current.root.finished.append(current)
+        REGISTRY.observe(name, current.duration)
+        _emit_json_log(current)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    active = _current_span.get()
+    return active.trace_id if active else None
+
+
+def set_attribute(key: str, value) -> None:
+    """Set an attribute on the active span (no-op outside of a span)"""
+    active = _current_span.get()
+    if active is not None:
+        active.set_attribute(key, value)
+
+
+def increment_attribute(key: str, amount: int = 1) -> None:
+    """Increment a counter attribute on the active span (no-op outside of a span)"""
+    active = _current_span.get()
+    if active is not None:
+        active.increment(key, amount)
+
+
+def stage_timings(root: Span) -> Dict[str, float]:
+    """
+    Get the duration in milliseconds of every finished span of a trace.
+
+    Args:
+        root (Span): Root span of the trace
+
+    Returns:
+        dict: Span name -> total duration in milliseconds (repeated spans are summed)
+    """
+    timings = {}
+    for finished in root.finished or []:
+        if finished.duration is None:
+            continue
+        timings[finished.name] = timings.get(finished.name, 0.0) + finished.duration * 1000
+    return {k: round(v, 3) for k, v in timings.items()}
+
+
+def render_prometheus() -> str:
+    return REGISTRY.render_prometheus()
+
+
+def start_metrics_server(port: Optional[int] = None):
+    """
+    Serve the Prometheus text metrics on http://0.0.0.0:<port>/metrics in a daemon thread.
+
+    The port defaults to the LEGALQA_METRICS_PORT environment variable; if neither is
+    set nothing is started. Calling it more than once is a no-op.
+
+    Args:
+        port (int, optional): Port to listen on
+
+    Returns:
+        The running HTTP server, or None if metrics are not exposed
+    """
+    global _metrics_server
+
+    if port is None:
+        port = os.environ.get("LEGALQA_METRICS_PORT")
+        if not port:
+            return None
+
+    with _metrics_lock:
+        if _metrics_server is not None:
+            return _metrics_server
+
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] == "/metrics":
+                    body = render_prometheus().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif self.path.split("?")[0] == "/metrics.json":
+                    body = json.dumps(REGISTRY.snapshot()).encode("utf-8")
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        _metrics_server = ThreadingHTTPServer(("0.0.0.0", int(port)), MetricsHandler)
+        threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+        return _metrics_server
@@ -1,4 +1,5 @@
 import re
+import sys
 
 def clean_llm_response(response: str) -> str:
     """
@@ -35,3 +36,29 @@ def clean_llm_response(response: str) -> str:
     response = response.strip()
     
     return response
+
+def approximate_size(obj) -> int:
+    """
+    Approximate memory footprint of a parsed document: the objects and everything their
+    dicts, lists and slots hold, in bytes. Shared (e.g. interned) objects are counted
+    every time they are referenced.
+
+    Args:
+        obj: A dict/list/tuple/str/number structure, a Law, or a numpy array
+
+    Returns:
+        int: Bytes
+    """
+    if hasattr(obj, "nbytes"):
+        # getsizeof counts the data of an array owning it, only the header of a view
+        return sys.getsizeof(obj) + (obj.nbytes if getattr(obj, "base", None) is not None else 0)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approximate_size(k) + approximate_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(approximate_size(v) for v in obj)
+    else:
+        # Records with __slots__ (src.documents)
+        slots = getattr(type(obj), "__slots__", ())
+        size += sum(approximate_size(getattr(obj, name, None)) for name in slots)
+    return size